@@ -0,0 +1,110 @@
+'''
+Synthesize fleets of bare git repositories for the migration benchmarks.
+
+The repositories are written with git fast-import, so a fleet of thousands of commits is
+generated in seconds. Blob contents are random bytes and do not compress, the fleet size
+on disk is close to the size git has to transfer.
+'''
+import hashlib
+import json
+import random
+import shutil
+import subprocess
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+
+@dataclass(frozen=True)
+class FleetSpec:
+    '''Parameters of a synthetic fleet.'''
+    repos: int = 10
+    commits: int = 20
+    blob_kb: int = 16
+    files_per_commit: int = 1
+    branches: int = 2
+    tags: int = 2
+    large_files: int = 0
+    large_file_mb: int = 10
+    seed: int = 0
+
+    def key(self) -> str:
+        return hashlib.sha256(json.dumps(asdict(self), sort_keys=True).encode()).hexdigest()[:12]
+
+
+def _data(payload: bytes) -> bytes:
+    return b"data %d\n" % len(payload) + payload + b"\n"
+
+
+def _fast_import_stream(spec: FleetSpec, rng: random.Random):
+    '''Yield the chunks of the fast-import stream of a single repository.'''
+    mark = 0
+    timestamp = 1700000000
+    commit_marks = []
+
+    for number in range(spec.commits):
+        files = []
+        if number == 0:
+            for large in range(spec.large_files):
+                mark += 1
+                yield b"blob\nmark :%d\n" % mark + _data(rng.randbytes(spec.large_file_mb * 2**20))
+                files.append((f"assets/large-{large}.bin", mark))
+        for file_number in range(spec.files_per_commit):
+            mark += 1
+            yield b"blob\nmark :%d\n" % mark + _data(rng.randbytes(spec.blob_kb * 2**10))
+            files.append((f"src/file-{file_number}.dat", mark))
+
+        mark += 1
+        header = b"commit refs/heads/main\nmark :%d\n" % mark
+        header += b"committer Bench <bench@vecto> %d +0000\n" % (timestamp + number)
+        header += _data(b"commit %d" % number)
+        if commit_marks:
+            header += b"from :%d\n" % commit_marks[-1]
+        header += b"".join(b"M 100644 :%d %s\n" % (blob, path.encode()) for path, blob in files)
+        yield header + b"\n"
+        commit_marks.append(mark)
+
+    for number in range(spec.branches):
+        mark += 1
+        yield b"blob\nmark :%d\n" % mark + _data(rng.randbytes(spec.blob_kb * 2**10))
+        base = commit_marks[rng.randrange(len(commit_marks))]
+        yield (b"commit refs/heads/branch-%d\n" % number
+               + b"committer Bench <bench@vecto> %d +0000\n" % (timestamp + spec.commits + number)
+               + _data(b"branch %d" % number)
+               + b"from :%d\n" % base
+               + b"M 100644 :%d branch-%d.dat\n\n" % (mark, number))
+
+    for number in range(spec.tags):
+        target = commit_marks[rng.randrange(len(commit_marks))]
+        yield b"reset refs/tags/v%d\nfrom :%d\n\n" % (number, target)
+
+
+def create_repo(path: Path, spec: FleetSpec, rng: random.Random):
+    '''Create a single bare repository of the fleet at path.'''
+    subprocess.run(["git", "init", "--quiet", "--bare", "--initial-branch", "main", str(path)], check=True)
+    process = subprocess.Popen(["git", "--git-dir", str(path), "fast-import", "--quiet"], stdin=subprocess.PIPE)
+    for chunk in _fast_import_stream(spec, rng):
+        process.stdin.write(chunk)
+    process.stdin.close()
+    if process.wait() != 0:
+        raise Exception(f"git fast-import failed for '{path}'.")
+
+
+def generate_fleet(root: Path, spec: FleetSpec, project: str = "bench") -> Path:
+    '''
+    Generate the fleet under <root>/<spec key>/<project>/repo-<n>.git. A fleet that was already
+    generated with the same spec is reused.
+
+    Output: the root of the fleet, usable as the root of the Local VCS
+    '''
+    fleet_root = Path(root) / spec.key()
+    done = fleet_root / "fleet.json"
+    if done.exists():
+        return fleet_root
+    # Leftovers of an interrupted generation
+    shutil.rmtree(fleet_root, ignore_errors=True)
+
+    rng = random.Random(spec.seed)
+    for number in range(spec.repos):
+        create_repo(fleet_root / project / f"repo-{number}.git", spec, rng)
+    done.write_text(json.dumps(asdict(spec), indent=2))
+    return fleet_root
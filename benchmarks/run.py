@@ -0,0 +1,227 @@
+'''
+End-to-end migration benchmark.
+
+Generates (or reuses) a synthetic fleet, migrates it between two Local VCS roots with
+migration() and records repos/min, MiB/s, peak RSS and peak disk usage of the work dir.
+Every result is appended to a JSON lines file together with the commit it ran on, so the
+numbers of two commits can be compared.
+
+    python -m benchmarks.run --repos 50 --commits 100 --blob-kb 64 --migration '{"concurrency": 8}'
+    python -m benchmarks.run --repos 50 --compare
+    python -m benchmarks.run --repos 50 --runs 3 --migration '{"cache_dir": true}'
+
+With a cache_dir, the mirror cache is kept next to the fleet: the first run measures the cold
+path, the next ones the warm path, and results are only compared with the same path.
+'''
+import argparse
+import contextlib
+import io
+import json
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import Optional
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from benchmarks.fleet import FleetSpec, generate_fleet  # noqa: E402
+from migration.cache import dir_size  # noqa: E402
+from migration.main import migration  # noqa: E402
+from utils.config import from_dict  # noqa: E402
+
+
+DEFAULT_FLEETS_DIR = REPO_ROOT / ".vecto" / "fleets"
+DEFAULT_RESULTS = REPO_ROOT / "benchmarks" / "results.jsonl"
+
+
+class DiskSampler:
+    '''Samples the total size of some directories in the background and keeps the peak.'''
+    def __init__(self, *paths: Path, interval: float = 0.2):
+        self.paths = paths
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._size())
+            self._stop.wait(self.interval)
+
+    def _size(self) -> int:
+        return sum(dir_size(path) for path in self.paths if path.exists())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._size())
+
+
+def _git_revision() -> dict:
+    def git(*args):
+        result = subprocess.run(["git", "-C", str(REPO_ROOT), *args], capture_output=True, text=True)
+        return result.stdout.strip()
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def _peak_rss_mb() -> dict:
+    # ru_maxrss is in KiB on Linux. For the children it is the peak of the largest git process
+    return {
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "peak_child_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }
+
+
+def cache_dir(fleets_dir: Path, spec: FleetSpec, migration_config: dict) -> Optional[Path]:
+    '''
+    Mirror cache of the benchmark, None when migration_config has no cache_dir. A path is used as
+    is, any other value (e.g. true) puts the cache next to the fleet, kept from one run to the next.
+    '''
+    value = migration_config.get("cache_dir")
+    if not value:
+        return None
+    return Path(value) if isinstance(value, str) else Path(fleets_dir) / f"{spec.key()}-mirrors"
+
+
+def run_benchmark(spec: FleetSpec, migration_config: dict, fleets_dir: Path = DEFAULT_FLEETS_DIR,
+                  dest_config: dict = None, verbose: bool = False) -> dict:
+    '''
+    Migrate the fleet of spec once. The mirror cache, when migration_config has one, is kept for
+    the next runs, which then measure the warm path.
+
+    Output: the benchmark result
+    '''
+    fleet_root = generate_fleet(fleets_dir, spec)
+    fleet_bytes = dir_size(fleet_root)
+    mirrors = cache_dir(fleets_dir, spec, migration_config)
+    warm_cache = bool(mirrors and mirrors.exists() and any(mirrors.iterdir()))
+
+    bench_dir = Path(tempfile.mkdtemp(prefix="vecto-bench-"))
+    work_dir = bench_dir / "work"
+    work_dir.mkdir()
+    try:
+        repo_map = [
+            {"src_repo": f"repo-{number}", "src_project": "bench",
+             "dest_repo": f"repo-{number}", "dest_project": "bench"}
+            for number in range(spec.repos)
+        ]
+        (bench_dir / "repos_map.json").write_text(json.dumps(repo_map))
+
+        settings = {"state_file": str(bench_dir / "state.db"), **migration_config,
+                    # The throwaway mirrors of migration() land in the sampled work dir
+                    "work_dir": str(work_dir)}
+        if mirrors:
+            settings["cache_dir"] = str(mirrors)
+        config = from_dict({
+            "src": {"vcs": "Local", "config": {"root": str(fleet_root)}},
+            "dest": {"vcs": "Local", "config": {"root": str(bench_dir / "dest"), **(dest_config or {})}},
+            "repos": {"map": str(bench_dir / "repos_map.json")},
+            "migration": settings,
+        })
+
+        output = io.StringIO()
+        with DiskSampler(work_dir, *([mirrors] if mirrors else [])) as disk, \
+                contextlib.redirect_stdout(sys.stdout if verbose else output):
+            started = time.monotonic()
+            success = migration(config)
+            duration = time.monotonic() - started
+    finally:
+        shutil.rmtree(bench_dir, ignore_errors=True)
+
+    return {
+        "timestamp": time.time(),
+        **_git_revision(),
+        "fleet": asdict(spec),
+        "migration": migration_config,
+        "warm_cache": warm_cache,
+        "dest": dest_config or {},
+        "success": success,
+        "duration_seconds": duration,
+        "fleet_mb": fleet_bytes / 2**20,
+        "repos_per_minute": spec.repos / duration * 60,
+        "mb_per_second": fleet_bytes / 2**20 / duration,
+        "peak_work_dir_mb": disk.peak / 2**20,
+        **_peak_rss_mb(),
+    }
+
+
+def _scenario(result: dict) -> tuple:
+    return json.dumps(result["fleet"], sort_keys=True), json.dumps(result["migration"], sort_keys=True), \
+        json.dumps(result["dest"], sort_keys=True), result.get("warm_cache", False)
+
+
+def compare(result: dict, results_path: Path):
+    '''Print the result next to the last recorded result of the same scenario.'''
+    previous = None
+    if results_path.exists():
+        for line in results_path.read_text().splitlines():
+            recorded = json.loads(line)
+            if _scenario(recorded) == _scenario(result):
+                previous = recorded
+    if not previous:
+        print("No previous result for this scenario.")
+        return
+
+    print(f"Compared to {previous['commit'][:10]}{' (dirty)' if previous['dirty'] else ''}:")
+    for key in ("duration_seconds", "repos_per_minute", "mb_per_second", "peak_work_dir_mb", "peak_rss_mb"):
+        change = (result[key] - previous[key]) / previous[key] * 100 if previous[key] else 0.0
+        print(f"  {key:<18} {previous[key]:>10.2f} -> {result[key]:>10.2f} ({change:+.1f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vecto migration benchmark")
+    parser.add_argument("--repos", type=int, default=FleetSpec.repos)
+    parser.add_argument("--commits", type=int, default=FleetSpec.commits)
+    parser.add_argument("--blob-kb", type=int, default=FleetSpec.blob_kb)
+    parser.add_argument("--files-per-commit", type=int, default=FleetSpec.files_per_commit)
+    parser.add_argument("--branches", type=int, default=FleetSpec.branches)
+    parser.add_argument("--tags", type=int, default=FleetSpec.tags)
+    parser.add_argument("--large-files", type=int, default=FleetSpec.large_files)
+    parser.add_argument("--large-file-mb", type=int, default=FleetSpec.large_file_mb)
+    parser.add_argument("--seed", type=int, default=FleetSpec.seed)
+    parser.add_argument("--migration", type=json.loads, default={},
+                        help='migration block of config.yml as JSON, e.g. \'{"concurrency": 8}\'. cache_dir may be '
+                             'true for a cache kept with the fleet')
+    parser.add_argument("--latency-ms", type=float, help="simulated latency of the destination")
+    parser.add_argument("--bandwidth-mbps", type=float, help="simulated bandwidth of the destination")
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--fleets-dir", type=Path, default=DEFAULT_FLEETS_DIR)
+    parser.add_argument("--results", type=Path, default=DEFAULT_RESULTS)
+    parser.add_argument("--compare", action="store_true", help="compare with the last result of the same scenario")
+    parser.add_argument("--verbose", action="store_true", help="show the output of the migration")
+    args = parser.parse_args(argv)
+
+    spec = FleetSpec(args.repos, args.commits, args.blob_kb, args.files_per_commit, args.branches, args.tags,
+                     args.large_files, args.large_file_mb, args.seed)
+    dest_config = {key: value for key, value in (("latency_ms", args.latency_ms),
+                                                 ("bandwidth_mbps", args.bandwidth_mbps)) if value}
+
+    for _ in range(args.runs):
+        result = run_benchmark(spec, args.migration, args.fleets_dir, dest_config, args.verbose)
+        status = ('OK' if result['success'] else 'FAILED') + (' (warm cache)' if result['warm_cache'] else '')
+        print(f"{status}: {spec.repos} repos ({result['fleet_mb']:.1f} MiB) "
+              f"in {result['duration_seconds']:.2f}s, {result['repos_per_minute']:.1f} repos/min, "
+              f"{result['mb_per_second']:.2f} MiB/s, peak work dir {result['peak_work_dir_mb']:.1f} MiB, "
+              f"peak RSS {result['peak_rss_mb']:.1f} MiB")
+        if args.compare:
+            compare(result, args.results)
+        args.results.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.results, "a") as f:
+            f.write(json.dumps(result) + "\n")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
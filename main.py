@@ -1,23 +1,101 @@
 from utils import config
+from migration.bundles import export_bundles, import_bundles
 from migration.main import migration
+from migration.plan import DEFAULT_PLAN_FILE, DEFAULT_WORK_LIST, plan
+from migration.verify import DEFAULT_REPORT, DEFAULT_RESYNC, DEFAULT_SAMPLE, verify
+from migration.workqueue import coordinate, merge_report
+from utils.mapper import generate_repo_map
+import argparse
+import dataclasses
 import sys
 
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Vecto - VCS Migration Tool")
+    parser.add_argument("--jobs", "-j", type=int, default=None,
+                        help="Number of repositories to migrate in parallel. "
+                             "Overrides migration.concurrency of config.yml")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip the repositories whose source did not change since their last successful migration")
+    parser.add_argument("--generate-map", nargs="*", metavar="PROJECT",
+                        help="Write repos.map from the source inventory of the projects "
+                             "(every project when none is given) and exit")
+    parser.add_argument("--plan", action="store_true",
+                        help=f"Compare the refs of the sources and destinations of the map, write {DEFAULT_PLAN_FILE} "
+                             f"and the work list {DEFAULT_WORK_LIST} of the repositories that need a transfer, "
+                             "and exit")
+    parser.add_argument("--verify", action="store_true",
+                        help=f"Compare the refs of the sources and destinations of the map, write {DEFAULT_REPORT} "
+                             f"and the re-sync map {DEFAULT_RESYNC} of the mismatching repositories, and exit")
+    parser.add_argument("--sample", type=float, default=DEFAULT_SAMPLE,
+                        help="Share of the repositories --verify fetches fresh for a fsck and a commit count")
+    parser.add_argument("--coordinator", action="store_true",
+                        help="Load the map into the shared work queue of migration.queue for the --worker runs, "
+                             "and exit")
+    parser.add_argument("--worker", action="store_true",
+                        help="Migrate the repositories leased from the shared work queue until it is empty")
+    parser.add_argument("--merge-report", action="store_true",
+                        help="Write the run report of all the workers of the shared work queue, and exit")
+    parser.add_argument("--export", metavar="DIR",
+                        help="Write the source repositories of the map as git bundles into DIR, only the new commits "
+                             "after the first export, and exit")
+    parser.add_argument("--import", dest="import_dir", metavar="DIR",
+                        help="Push the repositories of the bundles exported into DIR to the destination, and exit")
+    parser.add_argument("--map", metavar="PATH",
+                        help="Repository map to use instead of repos.map of config.yml, e.g. the work list of --plan")
+    args = parser.parse_args(argv)
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if not 0 <= args.sample <= 1:
+        parser.error("--sample must be between 0 and 1")
+    return args
+
 def main():
+    args = _parse_args()
     print("Vecto - VCS Migration Tool")
     
-    # 1. Parse Config
-    conf = config.parse()
-    if not conf:
+    # 1. Load the config once, it is passed down from here
+    conf = config.load_and_report()
+    if conf is None:
         print("Error: Invalid or missing configuration.")
         sys.exit(1)
         
-    print(f"Loaded configuration for migration from {conf['src']['vcs']} to {conf['dest']['vcs']}")
+    print(f"Loaded configuration for migration from {conf.src.vcs} to {conf.dest.vcs}")
+    if args.map:
+        conf = dataclasses.replace(conf, repos_map=args.map)
     
-    # 2. Skip Map Generation - Assume repos_map.json is provided by user
+    # 2. Generate the map on request, otherwise assume repos_map.json is provided by user
+    if args.generate_map is not None:
+        generate_repo_map(conf, args.generate_map or None)
+        return
     print("Assuming repos_map.json is provided by the user.")
 
+    if args.plan:
+        if not plan(conf, jobs=args.jobs):
+            sys.exit(1)
+        return
+    if args.verify:
+        if not verify(conf, jobs=args.jobs, sample=args.sample):
+            sys.exit(1)
+        return
+    if args.export:
+        if not export_bundles(args.export, conf, jobs=args.jobs):
+            sys.exit(1)
+        return
+    if args.import_dir:
+        if not import_bundles(args.import_dir, conf, jobs=args.jobs):
+            sys.exit(1)
+        return
+    if args.coordinator:
+        if not coordinate(conf):
+            sys.exit(1)
+        return
+    if args.merge_report:
+        if not merge_report(conf):
+            sys.exit(1)
+        return
+
     # 3. Perform Migration
-    migration_success = migration()
+    migration_success = migration(conf, jobs=args.jobs, resume=args.resume, worker=args.worker)
 
     if migration_success:
         print("\nMigration process completed successfully.")
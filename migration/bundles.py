@@ -0,0 +1,353 @@
+'''
+Offline transfer of the repositories through git bundles.
+
+When no single host reaches both the source and the destination, the migration runs in two
+halves, possibly days apart, with the bundle directory carried between them:
+
+export_bundles: fetches every source repo of the map and writes a git bundle of it, the full
+    history the first time, then only the objects and refs added since the previous export.
+    manifest.jsonl lists every repo with its refs and its chain of bundles
+import_bundles: applies the chain of bundles of every repo of the manifest to a local mirror
+    and pushes it to the destination, repos in parallel. The refs gone from the source are
+    deleted at the destination, the repos whose refs did not change since their last import
+    are skipped (state file of the run)
+
+A later sync pass then only carries the new bundles of the repos that changed. With the mirror
+cache (migration.cache_dir) on the import side, the mirrors are kept from one import to the
+next and an import only applies the bundles created since, the bundle directory may then only
+hold the new bundles. Without it, every import replays the whole chain, which must stay in the
+bundle directory.
+'''
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from utils import shell
+from utils.config import Config, load_and_report
+from utils.repo_map import REQUIRED_FIELDS, read_repo_map, write_repo_map
+from utils.vcs.factory import VCSFactory
+from migration.cache import MirrorCache, fetch_mirror
+from migration.concurrency import HostLimiter, RepoLog
+from migration.context import open_context
+from migration.refs import RefRules, ref_rules
+from migration.state import StateStore, tips_hash
+
+
+MANIFEST_FILE = "manifest.jsonl"
+# Git config key of the import mirrors, the checksum of the last bundle applied
+APPLIED_BUNDLE_KEY = "vecto.appliedbundle"
+
+EXPORT_BUNDLED = "bundled"
+EXPORT_UNCHANGED = "unchanged"
+EXPORT_FAILED = "failed"
+
+
+def _key(entry: dict) -> Tuple[str, ...]:
+    return tuple(entry.get(key) for key in REQUIRED_FIELDS)
+
+
+def _git(repo: Path, *args: str) -> str:
+    return shell.run(["git", "-C", str(repo), *args], f"git {args[0]}.", log=lambda *_: None)
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def mirror_refs(mirror: Path, rules: Optional[RefRules] = None) -> Dict[str, str]:
+    '''Sha by ref name of the refs of the mirror under the rules, every ref when None.'''
+    refs = {}
+    for line in _git(mirror, "for-each-ref", "--format=%(objectname) %(refname)").splitlines():
+        sha, ref = line.split(" ", 1)
+        if rules is None or rules.matches(ref):
+            refs[ref] = sha
+    return refs
+
+
+def _stdin_git(repo: Path, args: List[str], lines: List[str]) -> subprocess.CompletedProcess:
+    '''Run a git command reading its arguments from stdin, a repo can have more refs than a command line holds.'''
+    return subprocess.run(["git", "-C", str(repo), *args], input="".join(f"{line}\n" for line in lines).encode(),
+                          capture_output=True)
+
+
+def _present(mirror: Path, shas: List[str]) -> List[str]:
+    '''The objects among shas the mirror has.'''
+    if not shas:
+        return []
+    output = _stdin_git(mirror, ["cat-file", "--batch-check=%(objectname)"], shas).stdout.decode()
+    return [line for line in output.splitlines() if not line.endswith(" missing")]
+
+
+def read_manifest(bundle_dir: Path) -> Dict[Tuple[str, ...], dict]:
+    '''The manifest lines of an earlier export by map entry, empty on the first export.'''
+    manifest = bundle_dir / MANIFEST_FILE
+    if not manifest.exists():
+        return {}
+    return {_key(line): line for line in read_repo_map(manifest)}
+
+
+def write_bundle(mirror: Path, path: Path, refs: List[str], prerequisites: List[str]) -> bool:
+    '''
+    Bundle the refs of the mirror, leaving out the history of the prerequisites the other side already has.
+
+    Output: False when the prerequisites already hold every ref (e.g. a branch rewound), no bundle is written
+    '''
+    path.parent.mkdir(parents=True, exist_ok=True)
+    result = _stdin_git(mirror, ["bundle", "create", "--quiet", str(path.resolve()), "--stdin"],
+                        refs + [f"^{sha}" for sha in prerequisites])
+    if result.returncode == 0:
+        return True
+    error = result.stderr.decode(errors='replace').strip()
+    if "empty bundle" in error:
+        return False
+    raise Exception(f"git bundle create failed for {path.name}: {error}")
+
+
+def export_repo(mirror: Path, bundle_dir: Path, entry: dict, rules: RefRules, previous: Optional[dict]) -> dict:
+    '''
+    Write the next bundle of the chain of a repo whose source mirror is up to date.
+
+    Input: the mirror, the bundle directory, the map entry, the ref rules and the manifest line
+    of the previous export (None on the first one)
+
+    Output: the new manifest line
+    '''
+    refs = mirror_refs(mirror, rules)
+    bundles = list(previous["bundles"]) if previous else []
+    previous_refs = previous["refs"] if previous else {}
+    changed = sorted(ref for ref, sha in refs.items() if previous_refs.get(ref) != sha)
+    if changed:
+        # What the previous bundles shipped and the mirror still has, the rewritten history is shipped again
+        prerequisites = _present(mirror, sorted(set(previous_refs.values())))
+        relative = Path(entry['src_project']) / entry['src_repo'] / f"{len(bundles) + 1:04d}.bundle"
+        if write_bundle(mirror, bundle_dir / relative, changed, prerequisites):
+            bundles.append({"file": relative.as_posix(), "sha256": _sha256(bundle_dir / relative),
+                            "size": (bundle_dir / relative).stat().st_size, "refs": len(changed),
+                            "created_at": time.time()})
+    # Deleted and rewound refs need no bundle, the refs of the manifest tell the import where they stand
+    return {**{key: entry[key] for key in REQUIRED_FIELDS}, "refs": refs, "bundles": bundles}
+
+
+def export_bundles(bundle_dir: str, config: Optional[Config] = None, jobs: Optional[int] = None) -> bool:
+    '''
+    Export the source repos of the map into the bundle directory.
+
+    Input: the bundle directory (created if missing), the loaded Config (config.yml is loaded
+    when None) and the number of repos exported in parallel (migration.concurrency by default).
+    The mirrors come from the mirror cache when enabled, the next export then only fetches the
+    deltas, otherwise every export fetches the whole repos
+
+    Output: True when every repo got exported
+    '''
+    print("Exporting the source repositories to bundles...")
+    context = open_context(config, "export")
+    if context is None:
+        return False
+    config, count, problems = context.config, context.count, context.problems
+    src_vcs, limiter = context.src_vcs, context.src_limiter
+
+    map_file_path = config.repos_map
+    root = Path(bundle_dir)
+    root.mkdir(parents=True, exist_ok=True)
+    manifest = read_manifest(root)
+    settings = config.migration
+    rules = ref_rules(settings.refs, (src_vcs,))
+    mirrors = MirrorCache(settings.cache_dir) if settings.cache_dir else None
+    work_dir = Path(tempfile.mkdtemp(prefix="vecto-export-"))
+
+    def export_entry(indexed: tuple) -> Tuple[dict, str]:
+        index, entry = indexed
+        log = RepoLog(buffered=True)
+        try:
+            if index in problems:
+                raise Exception(f"Invalid repo map entry: {problems[index]}.")
+            src_url = src_vcs.get_clone_url(entry['src_repo'], config.src.auth, entry['src_project'])
+            previous = manifest.get(_key(entry))
+            # Entries of different projects can share a repo name, keep their mirrors apart
+            checkout = mirrors.checkout(src_url) if mirrors else \
+                nullcontext(work_dir / entry['src_project'] / entry['src_repo'])
+            with checkout as mirror:
+                with limiter.slot(src_url):
+                    options = {"timeout": settings.command_timeout, "env": src_vcs.git_env()}
+                    description = f"source repository '{entry['src_repo']}'"
+                    if mirrors:
+                        mirrors.sync(src_url, mirror, description, log, rules.refspecs(), **options)
+                    else:
+                        fetch_mirror(src_url, mirror, rules.refspecs(), description, log, **options)
+                line = export_repo(mirror, root, entry, rules, previous)
+                if not mirrors:
+                    shutil.rmtree(mirror, ignore_errors=True)
+            if line["bundles"] == (previous["bundles"] if previous else []):
+                log(f"UNCHANGED: '{entry['src_repo']}' (Project: {entry['src_project']}) has no new commits.")
+                return line, EXPORT_UNCHANGED
+            log(f"BUNDLED: '{entry['src_repo']}' (Project: {entry['src_project']}) into {line['bundles'][-1]['file']}.")
+            return line, EXPORT_BUNDLED
+        except Exception as e:
+            log(f"ERROR: Failed to export '{entry.get('src_repo')}' (Project: {entry.get('src_project')}): {e}")
+            return manifest.get(_key(entry)), EXPORT_FAILED
+        finally:
+            log.flush()
+
+    workers = jobs or settings.concurrency
+    print(f"Exporting {count} repositories to {root} with {workers} parallel jobs.")
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vecto-export") as pool:
+            results = list(pool.map(export_entry, enumerate(read_repo_map(map_file_path))))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    # The repos of earlier exports missing from this map keep their lines
+    for line, _ in results:
+        if line is not None:
+            manifest[_key(line)] = line
+    # Same suffix, the JSON lines format follows it
+    tmp = root / f".tmp-{MANIFEST_FILE}"
+    write_repo_map(tmp, manifest.values())
+    os.replace(tmp, root / MANIFEST_FILE)
+
+    statuses = [status for _, status in results]
+    new_bytes = sum(line["bundles"][-1]["size"] for line, status in results if status == EXPORT_BUNDLED)
+    print(f"\nExported {statuses.count(EXPORT_BUNDLED)} repositories ({new_bytes / 2**20:.1f} MiB of new bundles), "
+          f"{statuses.count(EXPORT_UNCHANGED)} unchanged, {statuses.count(EXPORT_FAILED)} failed.")
+    print(f"Manifest written to: {root / MANIFEST_FILE}")
+    return EXPORT_FAILED not in statuses
+
+
+def _applied_bundle(mirror: Path) -> Optional[str]:
+    '''Checksum of the last bundle applied to a mirror kept from an earlier import, None for a new mirror.'''
+    if not (mirror / "HEAD").exists():
+        return None
+    result = subprocess.run(["git", "-C", str(mirror), "config", "--get", APPLIED_BUNDLE_KEY],
+                            capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+
+def _apply_bundles(mirror: Path, bundle_dir: Path, bundles: List[dict], log=print):
+    for bundle in bundles:
+        path = bundle_dir / bundle["file"]
+        if not path.exists():
+            raise Exception(f"Bundle {bundle['file']} is missing from {bundle_dir}.")
+        if _sha256(path) != bundle["sha256"]:
+            raise Exception(f"Bundle {bundle['file']} is corrupted (checksum mismatch).")
+        shell.run(["git", "-C", str(mirror), "fetch", "--quiet", str(path.resolve()), "+refs/*:refs/*"],
+                  f"Unbundling {bundle['file']}.", log)
+        _git(mirror, "config", APPLIED_BUNDLE_KEY, bundle["sha256"])
+
+
+def unbundle(line: dict, bundle_dir: Path, mirror: Path, log=print):
+    '''
+    Bring the mirror of a manifest line to exactly the refs of the manifest. A mirror kept from an
+    earlier import only gets the bundles created since, the earlier ones may be gone from the
+    bundle directory. A new mirror replays the whole chain.
+    '''
+    checksums = [bundle["sha256"] for bundle in line["bundles"]]
+    applied = _applied_bundle(mirror)
+    rebuild = applied not in checksums
+    if not rebuild:
+        try:
+            _apply_bundles(mirror, bundle_dir, line["bundles"][checksums.index(applied) + 1:], log)
+        except Exception as e:
+            # e.g. the objects a bundle builds on got pruned from the mirror
+            log(f"Could not update the kept mirror ({e}), rebuilding it from the whole chain of bundles.")
+            rebuild = True
+    if rebuild:
+        shutil.rmtree(mirror, ignore_errors=True)
+        shell.run(["git", "init", "--quiet", "--bare", str(mirror)], "Creating an empty mirror.", log)
+        _apply_bundles(mirror, bundle_dir, line["bundles"], log)
+
+    # The refs deleted or rewound at the source since an earlier bundle
+    stale = set(mirror_refs(mirror)) - set(line["refs"])
+    result = _stdin_git(mirror, ["update-ref", "--stdin"], [f"delete {ref}" for ref in sorted(stale)] +
+                        [f"update {ref} {sha}" for ref, sha in sorted(line["refs"].items())])
+    if result.returncode != 0:
+        raise Exception(f"Could not set the refs of the mirror: {result.stderr.decode(errors='replace').strip()}")
+
+
+def import_bundles(bundle_dir: str, config: Optional[Config] = None, jobs: Optional[int] = None) -> bool:
+    '''
+    Push the repos of the manifest of the bundle directory to the destination.
+
+    Input: the bundle directory of the exports, the loaded Config (config.yml is loaded when
+    None) and the number of repos pushed in parallel (migration.concurrency by default)
+
+    Output: True when every repo got imported or was already up to date
+    '''
+    print("Importing the bundles into the destination...")
+    config = config or load_and_report()
+    if config is None:
+        print("Error: Invalid or missing configuration. Aborting import.")
+        return False
+
+    root = Path(bundle_dir)
+    manifest = read_manifest(root)
+    if not manifest:
+        print(f"Error: No {MANIFEST_FILE} found in '{root}'. Aborting.")
+        return False
+
+    settings = config.migration
+    dest_vcs = VCSFactory.from_settings(config.dest)
+    limiter = HostLimiter(settings.max_per_dest_host)
+    rules = ref_rules(settings.refs, (dest_vcs,))
+    state = StateStore(settings.state_file)
+    # Kept between the imports, keyed by the destination, a pass then only applies the new bundles
+    mirrors = MirrorCache(settings.cache_dir) if settings.cache_dir else None
+    work_dir = Path(tempfile.mkdtemp(prefix="vecto-import-"))
+
+    def import_line(line: dict) -> Optional[bool]:
+        log = RepoLog(buffered=True)
+        name = f"'{line['dest_repo']}' (Project: {line['dest_project']})"
+        tips = tips_hash("\n".join(f"{sha}\t{ref}" for ref, sha in line["refs"].items()))
+        if state.is_synced(line, tips):
+            log(f"UP-TO-DATE: {name} got these refs on its last import. Skipping.")
+            log.flush()
+            return None
+        state.start(line)
+        dest_url = dest_vcs.get_clone_url(line['dest_repo'], config.dest.auth, line['dest_project'])
+        checkout = mirrors.checkout(dest_url) if mirrors else \
+            nullcontext(work_dir / line['src_project'] / line['src_repo'])
+        try:
+            with checkout as mirror:
+                unbundle(line, root, mirror, log)
+                with limiter.slot(dest_url):
+                    if not dest_vcs.create_repo(line['dest_repo'], line['dest_project']):
+                        raise Exception(f"Failed to create destination repo {name}.")
+                    shell.run(["git", "-C", str(mirror), "push", "--prune", "--progress", dest_url,
+                               *rules.refspecs()], f"Pushing {name} to destination.", log,
+                              timeout=settings.command_timeout, env=dest_vcs.git_env())
+            state.finish(line, tips)
+            log(f"SUCCESS: Imported {name} from {len(line['bundles'])} bundles.")
+            return True
+        except Exception as e:
+            state.finish(line, tips, error=str(e))
+            log(f"ERROR: Failed to import {name}: {e}")
+            return False
+        finally:
+            if not mirrors:
+                shutil.rmtree(work_dir / line['src_project'] / line['src_repo'], ignore_errors=True)
+            log.flush()
+
+    workers = jobs or settings.concurrency
+    print(f"Importing {len(manifest)} repositories from {root} with {workers} parallel jobs.")
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vecto-import") as pool:
+            results = list(pool.map(import_line, manifest.values()))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        state.close()
+    if mirrors:
+        mirrors.evict()
+
+    print(f"\nImported {results.count(True)} repositories, {results.count(None)} already up to date, "
+          f"{results.count(False)} failed.")
+    return False not in results
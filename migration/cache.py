@@ -0,0 +1,170 @@
+'''
+Persistent cache of source mirrors.
+
+Every source clone URL gets a bare mirror under the cache directory. The first run
+clones the mirror, the later runs only fetch the deltas into it. Once the cache grows
+over its disk budget, the least recently used mirrors are evicted.
+'''
+import hashlib
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+from urllib.parse import urlparse, urlunparse
+
+from utils.shell import run
+
+
+LAST_USED_FILE = "vecto-last-used"
+# Refspec of a full mirror
+MIRROR_REFSPECS = ("+refs/*:refs/*",)
+ALTERNATES_FILE = Path("objects") / "info" / "alternates"
+
+
+def strip_credentials(url: str) -> str:
+    '''Remove the user info (PAT) from an http(s) clone URL.'''
+    if "://" not in url:
+        return url
+    parsed = urlparse(url)
+    if not parsed.username and not parsed.password:
+        return url
+    netloc = parsed.hostname or ""
+    if parsed.port:
+        netloc = f"{netloc}:{parsed.port}"
+    return urlunparse(parsed._replace(netloc=netloc))
+
+
+def dir_size(path: Path) -> int:
+    '''Size in bytes of all the files under path.'''
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def fetch_mirror(src_url: str, path: Path, refspecs: Sequence[str], description: str, log=print,
+                 alternate: Optional[Path] = None, **run_options):
+    '''
+    Clone src_url as a bare mirror of the refs selected by refspecs. Unlike git clone --mirror,
+    the refs left out are never downloaded. The objects of the alternate repo, when given, are
+    borrowed instead of downloaded (see migration.pools).
+    '''
+    run(["git", "init", "--quiet", "--bare", str(path)], f"Creating an empty mirror for {description}.", log)
+    if alternate is not None:
+        (path / ALTERNATES_FILE).write_text(f"{(alternate / 'objects').resolve()}\n")
+    run(["git", "-C", str(path), "fetch", "--progress", src_url, *refspecs], f"Cloning {description}.", log,
+        **run_options)
+
+
+class MirrorCache:
+    '''
+    On-disk mirror cache keyed by the source clone URL.
+
+    Input: directory of the cache and the disk budget in bytes (None means unlimited)
+    '''
+    def __init__(self, root: str, max_bytes: Optional[int] = None):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._locks: Dict[str, threading.Lock] = {}
+        self._in_use: Set[str] = set()
+        # The workers evict as their repos finish, one at a time
+        self._evict_lock = threading.Lock()
+
+    @staticmethod
+    def key(src_url: str) -> str:
+        return hashlib.sha256(strip_credentials(src_url).encode()).hexdigest()[:24]
+
+    def path(self, src_url: str) -> Path:
+        return self.root / f"{self.key(src_url)}.git"
+
+    @contextmanager
+    def checkout(self, src_url: str):
+        '''
+        Reserve the mirror of src_url. Only one worker at a time uses a mirror, and a
+        mirror in use is never evicted.
+        '''
+        key = self.key(src_url)
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            with self._lock:
+                self._in_use.add(key)
+            try:
+                yield self.path(src_url)
+            finally:
+                self._touch(key)
+                with self._lock:
+                    self._in_use.discard(key)
+
+    def sync(self, src_url: str, path: Path, description: str, log=print,
+             refspecs: Sequence[str] = MIRROR_REFSPECS, alternate: Optional[Path] = None, **run_options):
+        '''
+        Bring the mirror at path up to date with src_url. Clones it on the first use and
+        fetches only the deltas afterwards. refspecs select the refs fetched (every ref by default),
+        alternate is the object pool of the first clone, run_options go to utils.shell.run
+        (timeout, cancel, on_progress).
+        '''
+        if (path / "HEAD").exists():
+            fetch_cmd = ["git", "-C", str(path), "fetch", "--progress", "--prune", src_url, *refspecs]
+            run(fetch_cmd, f"Updating cached mirror of {description}.", log, **run_options)
+            return
+
+        # Clone next to the final path and rename it, a half cloned mirror never lands in the cache
+        tmp_path = path.with_name(path.name + ".tmp")
+        if tmp_path.exists():
+            shutil.rmtree(tmp_path)
+        # The URL (and its PAT) is never written to the cached config, every sync passes it explicitly
+        fetch_mirror(src_url, tmp_path, refspecs, f"{description} into the mirror cache", log, alternate,
+                     **run_options)
+        os.replace(tmp_path, path)
+
+    def _touch(self, key: str):
+        stamp = self.root / f"{key}.git" / LAST_USED_FILE
+        if stamp.parent.exists():
+            stamp.write_text(str(time.time()))
+
+    def _entries(self) -> List[Tuple[float, str, Path]]:
+        entries = []
+        for path in self.root.glob("*.git"):
+            stamp = path / LAST_USED_FILE
+            last_used = stamp.stat().st_mtime if stamp.exists() else path.stat().st_mtime
+            entries.append((last_used, path.name[:-len(".git")], path))
+        return entries
+
+    def evict(self, log=print) -> List[Path]:
+        '''
+        Remove the least recently used mirrors until the cache fits its disk budget.
+
+        Output: the evicted mirror paths
+        '''
+        if self.max_bytes is None:
+            return []
+        with self._evict_lock:
+            return self._evict(log)
+
+    def _evict(self, log) -> List[Path]:
+        entries = sorted(self._entries())
+        sizes = {key: dir_size(path) for _, key, path in entries}
+        total = sum(sizes.values())
+
+        evicted = []
+        for _, key, path in entries:
+            if total <= self.max_bytes:
+                break
+            with self._lock:
+                if key in self._in_use:
+                    continue
+            log(f"Evicting cached mirror {path.name} ({sizes[key] / 2**20:.1f} MiB).")
+            shutil.rmtree(path, ignore_errors=True)
+            total -= sizes[key]
+            evicted.append(path)
+        return evicted
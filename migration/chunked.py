@@ -0,0 +1,109 @@
+'''
+Chunked push of the repositories too large for a single push.
+
+A single push of a multi-GB history hits the limits of the destination (the 2 GB push cap of
+GitHub, the timeouts of Azure DevOps) and fails with nothing to resume from. Instead, the
+first-parent history of every branch is cut into chunks whose new objects stay under the chunk
+size, and each chunk is pushed as an intermediate commit of the branch. The regular push then
+only sends the remaining refs.
+
+The size of a chunk is the on-disk size of the objects it adds (git rev-list --disk-usage),
+the closest estimate of the pack sent. A single commit larger than the chunk size is pushed
+alone. Every pushed chunk is checkpointed in the state store, an interrupted push resumes after
+the last chunk the destination accepted.
+'''
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+from utils import shell
+from migration.refs import RefRules
+from migration.state import StateStore
+
+
+def _git(mirror: Path, *args: str) -> str:
+    return shell.run(["git", "-C", str(mirror), *args], f"git {args[0]} in the mirror.", log=lambda *_: None)
+
+
+def _rev_list(mirror: Path, options: List[str], commit: str, exclude: Iterable[str], **run_options) -> str:
+    '''
+    git rev-list of commit and not exclude, exclude may name unknown objects. The revisions go
+    through stdin, a repo can have more refs than a command line holds.
+    '''
+    revisions = "".join(f"{line}\n" for line in [commit, *(f"^{sha}" for sha in exclude)])
+    return shell.run(["git", "-C", str(mirror), "rev-list", *options, "--ignore-missing", "--stdin"],
+                     "git rev-list in the mirror.", log=lambda *_: None, stdin=revisions,
+                     **{**run_options, "on_progress": None})
+
+
+def _disk_usage(mirror: Path, commit: str, exclude: Iterable[str], **run_options) -> int:
+    '''Bytes of the objects reachable from commit and not from exclude, exclude may name unknown objects.'''
+    return int(_rev_list(mirror, ["--objects", "--disk-usage"], commit, exclude, **run_options))
+
+
+def plan_chunks(mirror: Path, tip: str, exclude: Iterable[str], chunk_bytes: int, **run_options) -> List[str]:
+    '''
+    Cut the first-parent history of tip into chunks.
+
+    Input: the local mirror, the branch tip, the commits the destination already has and the
+    chunk size in bytes. run_options go to utils.shell.run (timeout, cancel)
+
+    Output: the last commit of every chunk, oldest first, the last one is tip
+    '''
+    exclude = list(exclude)
+    commits = _rev_list(mirror, ["--first-parent", "--reverse"], tip, exclude, **run_options).split()
+    boundaries = []
+    start = 0
+    while start < len(commits):
+        if _disk_usage(mirror, commits[-1], exclude, **run_options) <= chunk_bytes:
+            boundaries.append(commits[-1])
+            break
+        # The size only grows along the first-parent chain, find the last commit that still fits
+        best, low, high = start, start + 1, len(commits) - 2
+        while low <= high:
+            middle = (low + high) // 2
+            if _disk_usage(mirror, commits[middle], exclude, **run_options) <= chunk_bytes:
+                best, low = middle, middle + 1
+            else:
+                high = middle - 1
+        boundaries.append(commits[best])
+        exclude.append(commits[best])
+        start = best + 1
+    return boundaries
+
+
+def push_in_chunks(mirror: Path, dest_url: str, rules: RefRules, chunk_bytes: int, state: StateStore,
+                   entry: dict, log=print, **run_options) -> int:
+    '''
+    Push the history of every branch of the mirror in chunks, resuming from the checkpoints of an earlier attempt.
+
+    Input: the local mirror, the destination URL, the ref rules of the run, the chunk size in bytes,
+    the state store and the map entry. run_options go to utils.shell.run
+
+    Output: the number of chunks pushed
+    '''
+    branches: Dict[str, str] = {}
+    for line in _git(mirror, "for-each-ref", "--format=%(objectname) %(refname)", "refs/heads/").splitlines():
+        sha, ref = line.split(" ", 1)
+        if rules.matches(ref):
+            branches[ref] = sha
+
+    dest_refs = shell.run(["git", "ls-remote", "--heads", dest_url], "Listing destination branches.",
+                          log=lambda *_: None, **{**run_options, "on_progress": None})
+    checkpoints = state.checkpoints(entry)
+    if checkpoints:
+        log(f"Resuming the chunked push after {len(checkpoints)} checkpointed branches.")
+    # What the destination already has is never sent again
+    exclude = {line.split("\t", 1)[0] for line in dest_refs.splitlines() if line} | set(checkpoints.values())
+
+    pushed = 0
+    for ref, tip in sorted(branches.items()):
+        if checkpoints.get(ref) == tip:
+            continue
+        chunks = plan_chunks(mirror, tip, sorted(exclude), chunk_bytes, **run_options)
+        for number, commit in enumerate(chunks, 1):
+            push_cmd = ["git", "-C", str(mirror), "push", "--progress", dest_url, f"+{commit}:{ref}"]
+            shell.run(push_cmd, f"Pushing chunk {number}/{len(chunks)} of {ref}.", log, **run_options)
+            state.checkpoint(entry, ref, commit)
+            exclude.add(commit)
+            pushed += 1
+    return pushed
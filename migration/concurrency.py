@@ -0,0 +1,82 @@
+'''
+Helpers to run repository migrations in parallel.
+
+HostLimiter: caps the number of concurrent operations against a single host
+RepoLog: keeps the log output of a single repository together
+'''
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+
+_print_lock = threading.Lock()
+
+
+def url_host(url: str) -> str:
+    '''
+    Extract the host from a clone URL.
+
+    Input: https://<pat>@dev.azure.com/org/project/_git/repo, git@github.com:org/repo.git, file:///srv/repos/repo.git
+
+    Output: dev.azure.com, github.com, localhost
+    '''
+    if "://" in url:
+        parsed = urlparse(url)
+        return parsed.hostname or "localhost"
+
+    # scp-like syntax, e.g. git@ssh.dev.azure.com:v3/org/project/repo
+    host = url.split(":", 1)[0]
+    return host.rsplit("@", 1)[-1]
+
+
+class HostLimiter:
+    '''
+    Bounded semaphore per host. A limit of None means no cap.
+    '''
+    def __init__(self, limit: Optional[int]):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+
+    def _semaphore(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.limit)
+            return self._semaphores[host]
+
+    @contextmanager
+    def slot(self, url: str):
+        if not self.limit:
+            yield
+            return
+
+        semaphore = self._semaphore(url_host(url))
+        with semaphore:
+            yield
+
+
+class RepoLog:
+    '''
+    Collects the log lines of a single repository migration.
+
+    When buffered, the lines are printed in one block by flush() so that the
+    output of parallel migrations does not interleave. Otherwise lines are printed
+    as they come.
+    '''
+    def __init__(self, buffered: bool = False):
+        self.buffered = buffered
+        self.lines: List[str] = []
+
+    def __call__(self, message: str = ""):
+        if not self.buffered:
+            print(message)
+            return
+        self.lines.append(str(message))
+
+    def flush(self):
+        if not self.lines:
+            return
+        with _print_lock:
+            print("\n".join(self.lines), flush=True)
+        self.lines = []
@@ -0,0 +1,86 @@
+'''
+Shared start of the commands driven by the repo map (migration, plan, verify, export, coordinate).
+
+check_repo_map: validates the whole map before any network call and reports its invalid entries
+open_context: loads the config, checks the map and builds both VCS clients with their host limiters
+'''
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from utils.config import Config, load_and_report
+from utils.repo_map import read_repo_map, validate_repo_map
+from utils.vcs.api_cache import ApiCache
+from utils.vcs.base import BaseVCS
+from utils.vcs.factory import VCSFactory
+from migration.concurrency import HostLimiter
+
+
+MAX_REPORTED_PROBLEMS = 20
+
+
+def check_repo_map(map_file_path: str) -> Optional[Tuple[int, Dict[int, str]]]:
+    '''
+    Validation pass over the whole map before any network call.
+
+    Output: the number of entries and the problems by entry index, None when the file is missing or cannot be read
+    '''
+    if not Path(map_file_path).exists():
+        print(f"Error: Repository map file '{map_file_path}' not found. Aborting.")
+        return None
+    try:
+        count, problems = validate_repo_map(read_repo_map(map_file_path))
+    except Exception as e:
+        print(f"Error: Could not read the repository map: {e}. Aborting.")
+        return None
+
+    for index, problem in list(problems.items())[:MAX_REPORTED_PROBLEMS]:
+        print(f"Invalid repo map entry #{index + 1}: {problem}.")
+    if len(problems) > MAX_REPORTED_PROBLEMS:
+        print(f"... and {len(problems) - MAX_REPORTED_PROBLEMS} more invalid entries.")
+    if problems:
+        print(f"{len(problems)} of {count} repo map entries are invalid and will be failed.")
+    return count, problems
+
+
+@dataclass
+class MapContext:
+    '''The loaded config, the checked repo map and the clients of both sides.'''
+    config: Config
+    count: int
+    problems: Dict[int, str]
+    src_vcs: BaseVCS
+    dest_vcs: BaseVCS
+    src_limiter: HostLimiter
+    dest_limiter: HostLimiter
+
+
+def open_context(config: Optional[Config], action: str, api_cache: Optional[ApiCache] = None) -> Optional[MapContext]:
+    '''
+    Load the config (config.yml when None), check the repo map and build both VCS clients.
+
+    Input: the loaded Config or None, the action named in the abort message (e.g. "plan") and the
+    API cache of the clients, if any
+
+    Output: the MapContext, None when the config or the map is unusable (the reason is printed)
+    '''
+    config = config or load_and_report()
+    if config is None:
+        print(f"Error: Invalid or missing configuration. Aborting {action}.")
+        return None
+
+    checked = check_repo_map(config.repos_map)
+    if checked is None:
+        return None
+    count, problems = checked
+
+    settings = config.migration
+    return MapContext(
+        config=config,
+        count=count,
+        problems=problems,
+        src_vcs=VCSFactory.from_settings(config.src, api_cache),
+        dest_vcs=VCSFactory.from_settings(config.dest, api_cache),
+        src_limiter=HostLimiter(settings.max_per_src_host),
+        dest_limiter=HostLimiter(settings.max_per_dest_host),
+    )
@@ -0,0 +1,293 @@
+'''
+Git LFS objects of the migrated repositories.
+
+A mirror clone and push only move the git objects, the LFS pointers then point at content the
+destination does not have. The LFS stage runs between the clone and the push:
+
+scan_mirror: finds the LFS usage in the .gitattributes of the mirror, then every LFS pointer
+    reachable from its refs
+LfsTransfer: copies the objects from the source to the destination LFS server through the
+    batch API (basic transfer), with a pool of transfers shared by the whole run. The objects
+    the destination already has are skipped, and an object is downloaded once per run into a
+    local store, whatever the number of repos using it
+'''
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import requests
+
+from utils import shell
+from utils.vcs.http import DEFAULT_TIMEOUT, new_session
+from utils.vcs.ratelimit import RequestScheduler, get_scheduler
+
+
+POINTER_VERSION = "version https://git-lfs.github.com/spec/v1"
+# Pointer files are ~130 bytes, the spec caps them at 1024
+MAX_POINTER_SIZE = 1024
+DEFAULT_WORKERS = 8
+DEFAULT_BATCH_SIZE = 100
+MEDIA_TYPE = "application/vnd.git-lfs+json"
+CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass(frozen=True, order=True)
+class LfsObject:
+    oid: str
+    size: int
+
+
+def parse_pointer(data: bytes) -> Optional[LfsObject]:
+    '''
+    Parse the content of an LFS pointer file.
+
+    Input: b"version https://git-lfs.github.com/spec/v1\\noid sha256:4d7a...\\nsize 12345\\n"
+
+    Output: LfsObject("4d7a...", 12345), None when the blob is not a pointer
+    '''
+    try:
+        lines = data.decode("utf-8").splitlines()
+    except UnicodeDecodeError:
+        return None
+    if not lines or lines[0] != POINTER_VERSION:
+        return None
+    fields = dict(line.split(" ", 1) for line in lines[1:] if " " in line)
+    oid = fields.get("oid", "").removeprefix("sha256:")
+    if len(oid) != 64 or not fields.get("size", "").isdigit():
+        return None
+    return LfsObject(oid, int(fields["size"]))
+
+
+def _objects(mirror: Path) -> Iterator[Tuple[str, str, int, str]]:
+    '''
+    Every object reachable from the refs of the mirror, streamed from git rev-list --objects
+    piped into git cat-file --batch-check.
+
+    Output: (sha, type, size, path) tuples, the path is empty for the commits
+    '''
+    with tempfile.TemporaryFile() as errors:
+        rev_list = subprocess.Popen(["git", "-C", str(mirror), "rev-list", "--objects", "--all"],
+                                    stdout=subprocess.PIPE, stderr=errors)
+        check = subprocess.Popen(["git", "-C", str(mirror), "cat-file",
+                                  "--batch-check=%(objectname) %(objecttype) %(objectsize) %(rest)"],
+                                 stdin=rev_list.stdout, stdout=subprocess.PIPE, stderr=errors)
+        rev_list.stdout.close()
+        try:
+            for line in check.stdout:
+                sha, kind, size, path = line.decode("utf-8", errors="replace").rstrip("\n").split(" ", 3)
+                yield sha, kind, int(size), path
+        finally:
+            check.stdout.close()
+            for process in (check, rev_list):
+                if process.poll() is None:
+                    process.kill()
+                process.wait()
+        if rev_list.returncode != 0 or check.returncode != 0:
+            errors.seek(0)
+            raise Exception(f"Listing the objects of {mirror} failed: {errors.read().decode(errors='replace')}")
+
+
+def _blobs(mirror: Path, shas: List[str]) -> Iterator[Tuple[str, bytes]]:
+    '''Content of the blobs, streamed from a single git cat-file --batch, the shas go through stdin.'''
+    if not shas:
+        return
+    process = subprocess.Popen(["git", "-C", str(mirror), "cat-file", "--batch"],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def write():
+        try:
+            for sha in shas:
+                process.stdin.write(f"{sha}\n".encode())
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+
+    writer = threading.Thread(target=write, daemon=True)
+    writer.start()
+    try:
+        for _ in shas:
+            sha, _, size = process.stdout.readline().decode().split(" ")
+            content = process.stdout.read(int(size) + 1)[:-1]
+            yield sha, content
+    finally:
+        process.stdout.close()
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+        writer.join()
+
+
+def scan_mirror(mirror: Path) -> List[LfsObject]:
+    '''
+    Every LFS object the refs of a mirror point to. The object listing is streamed, only the
+    shas of the .gitattributes and of the blobs small enough to be pointers are kept.
+
+    Input: the local mirror
+
+    Output: the LFS objects, empty when no .gitattributes of the history routes files through LFS
+    '''
+    attributes, candidates = [], []
+    for sha, kind, size, path in _objects(mirror):
+        if kind != "blob":
+            continue
+        if path == ".gitattributes" or path.endswith("/.gitattributes"):
+            attributes.append(sha)
+        if size <= MAX_POINTER_SIZE:
+            candidates.append(sha)
+
+    uses_lfs = False
+    for _, content in _blobs(mirror, attributes):
+        uses_lfs = uses_lfs or b"filter=lfs" in content
+    if not uses_lfs:
+        return []
+
+    pointers = {parse_pointer(content) for _, content in _blobs(mirror, candidates)}
+    pointers.discard(None)
+    return sorted(pointers)
+
+
+class LfsTransfer:
+    '''
+    Copies LFS objects between the LFS servers of the repos of a run, safe to share between the workers.
+
+    Input: the number of concurrent object transfers of the run, the number of objects per batch
+    request, and the directory of the local object store (a throwaway temp directory when None)
+    '''
+    def __init__(self, workers: int = DEFAULT_WORKERS, batch_size: int = DEFAULT_BATCH_SIZE,
+                 store_dir: Optional[str] = None, session: Optional[requests.Session] = None,
+                 timeout: float = DEFAULT_TIMEOUT, scheduler: Optional[RequestScheduler] = None):
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.session = session or new_session(workers)
+        # Shared with the VCS clients, a throttled LFS server is backed off like the APIs
+        self.scheduler = scheduler or get_scheduler()
+        self._own_dir = store_dir is None
+        self.store = Path(store_dir or tempfile.mkdtemp(prefix="vecto-lfs-"))
+        self.store.mkdir(parents=True, exist_ok=True)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vecto-lfs")
+        self._lock = threading.Lock()
+        self._locks: Dict[str, threading.Lock] = {}
+        # (destination endpoint, oid) already uploaded by this run
+        self._uploaded: Set[Tuple[str, str]] = set()
+
+    def close(self):
+        self._pool.shutdown()
+        if self._own_dir:
+            shutil.rmtree(self.store, ignore_errors=True)
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        return self.scheduler.request(self.session, method, url, timeout=self.timeout, **kwargs)
+
+    def _path(self, oid: str) -> Path:
+        return self.store / oid[:2] / oid[2:4] / oid
+
+    def _batch(self, endpoint: str, operation: str, objects: List[LfsObject]) -> Dict[str, dict]:
+        '''
+        Ask the batch API of endpoint about the objects.
+
+        Output: the actions by oid, an object without action needs no transfer
+        '''
+        actions = {}
+        for start in range(0, len(objects), self.batch_size):
+            chunk = objects[start:start + self.batch_size]
+            response = self._request(
+                "POST", f"{endpoint}/objects/batch",
+                headers={"Accept": MEDIA_TYPE, "Content-Type": MEDIA_TYPE},
+                json={"operation": operation, "transfers": ["basic"],
+                      "objects": [{"oid": lfs_object.oid, "size": lfs_object.size} for lfs_object in chunk]})
+            if response.status_code != 200:
+                raise Exception(f"LFS batch {operation} at {shell.redact(endpoint)} failed: "
+                                f"{response.status_code} {response.text[:200]}")
+            for answer in response.json().get("objects", []):
+                if answer.get("error"):
+                    raise Exception(f"LFS object {answer['oid']} cannot be {operation}ed: "
+                                    f"{answer['error'].get('message')}")
+                actions[answer["oid"]] = answer.get("actions") or {}
+        return actions
+
+    def _download(self, lfs_object: LfsObject, action: dict) -> Path:
+        '''Download an object into the store, once per run, and check its hash and size.'''
+        with self._lock:
+            lock = self._locks.setdefault(lfs_object.oid, threading.Lock())
+        with lock:
+            path = self._path(lfs_object.oid)
+            if path.exists():
+                return path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{path.name}.tmp")
+            digest, size = hashlib.sha256(), 0
+            with self._request("GET", action["href"], headers=action.get("header", {}), stream=True) as response:
+                response.raise_for_status()
+                with open(tmp, "wb") as f:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        digest.update(chunk)
+                        size += len(chunk)
+                        f.write(chunk)
+            if digest.hexdigest() != lfs_object.oid or size != lfs_object.size:
+                tmp.unlink()
+                raise Exception(f"LFS object {lfs_object.oid} downloaded corrupted ({size} bytes).")
+            os.replace(tmp, path)
+            return path
+
+    def _upload(self, path: Path, lfs_object: LfsObject, actions: dict):
+        upload = actions["upload"]
+        with open(path, "rb") as f:
+            response = self._request("PUT", upload["href"], data=f,
+                                     headers={"Content-Type": "application/octet-stream", **upload.get("header", {})})
+        response.raise_for_status()
+        verify = actions.get("verify")
+        if verify:
+            response = self._request("POST", verify["href"],
+                                     headers={"Accept": MEDIA_TYPE, "Content-Type": MEDIA_TYPE,
+                                              **verify.get("header", {})},
+                                     json={"oid": lfs_object.oid, "size": lfs_object.size})
+            response.raise_for_status()
+
+    def migrate(self, objects: Iterable[LfsObject], src_endpoint: str, dest_endpoint: str,
+                log=print) -> Tuple[int, int]:
+        '''
+        Copy the objects the destination misses.
+
+        Input: the LFS objects of a repo, the LFS endpoints of its source and destination
+        (e.g. https://github.com/org/repo.git/info/lfs)
+
+        Output: the number and the total size of the objects uploaded
+        '''
+        with self._lock:
+            objects = [lfs_object for lfs_object in objects if (dest_endpoint, lfs_object.oid) not in self._uploaded]
+        if not objects:
+            return 0, 0
+
+        uploads = self._batch(dest_endpoint, "upload", objects)
+        missing = [lfs_object for lfs_object in objects if uploads.get(lfs_object.oid, {}).get("upload")]
+        log(f"LFS: {len(objects) - len(missing)} of {len(objects)} objects already at the destination.")
+
+        stored = {lfs_object.oid for lfs_object in missing if self._path(lfs_object.oid).exists()}
+        downloads = self._batch(src_endpoint, "download",
+                                [lfs_object for lfs_object in missing if lfs_object.oid not in stored])
+
+        def transfer(lfs_object: LfsObject):
+            path = self._path(lfs_object.oid)
+            if not path.exists():
+                action = downloads.get(lfs_object.oid, {}).get("download")
+                if action is None:
+                    raise Exception(f"LFS object {lfs_object.oid} is missing from the source.")
+                path = self._download(lfs_object, action)
+            self._upload(path, lfs_object, uploads[lfs_object.oid])
+
+        # Wait for every transfer, the first failure fails the repo
+        errors = [result.exception() for result in [self._pool.submit(transfer, lfs_object) for lfs_object in missing]]
+        errors = [error for error in errors if error is not None]
+        if errors:
+            raise errors[0]
+
+        with self._lock:
+            self._uploaded.update((dest_endpoint, lfs_object.oid) for lfs_object in objects)
+        return len(missing), sum(lfs_object.size for lfs_object in missing)
@@ -3,90 +3,539 @@ import os
 from pathlib import Path
 import tempfile
 import shutil
-import json # Import json module
+import threading
+from contextlib import ExitStack, contextmanager, nullcontext
+from dataclasses import asdict, dataclass, field
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional
 
-from utils.config import parse as parse_config
+from utils.config import ChunkedPushSettings, Config, StageSettings, load_and_report
+from utils.repo_map import read_repo_map
+from utils.vcs.base import BaseVCS
+from utils.vcs.api_cache import ApiCache
 from utils.vcs.factory import VCSFactory
-from utils.shell import run_command
+from utils import shell
+from migration.cache import MirrorCache, dir_size, fetch_mirror
+from migration.chunked import push_in_chunks
+from migration.concurrency import HostLimiter, RepoLog
+from migration.context import check_repo_map
+from migration.metrics import RepoMetrics, RunReport, STATUS_FAILED, STATUS_SKIPPED, STATUS_SUCCESS
+from migration.pipeline import Stage, run_pipeline
+from migration.pools import ObjectPools, dissociate
+from migration.refs import RefRules, ref_rules
+from migration.scheduling import DiskBudget, estimate_sizes, largest_first
+from migration.ssh import SSHMultiplexer
+from migration.state import StateStore, tips_hash
+from migration.workqueue import QUEUE_LEASED, QUEUE_PENDING, Heartbeat, Lease, WorkQueue, claims, open_queue, \
+    queue_settings, worker_name
 
-def migration():
+if TYPE_CHECKING:
+    # requests is only imported by the runs copying LFS objects
+    from migration.lfs import LfsTransfer
+
+
+@dataclass
+class MigrationRun:
+    '''Everything the migration of a single repo needs, shared by all the workers of a run.'''
+    src_vcs: BaseVCS
+    dest_vcs: BaseVCS
+    src_auth: str
+    dest_auth: str
+    src_limiter: HostLimiter
+    dest_limiter: HostLimiter
+    state: StateStore
+    # Refs fetched from the source and pushed to the destination
+    refs: RefRules
+    work_dir: Optional[str] = None
+    mirrors: Optional[MirrorCache] = None
+    resume: bool = False
+    command_timeout: Optional[float] = None
+    progress_interval: float = 10.0
+    # Estimated bytes by (src_project, src_repo), and the share of the work dir the clones may use
+    sizes: dict = field(default_factory=dict)
+    disk_budget: DiskBudget = field(default_factory=lambda: DiskBudget(None))
+    # Shared ssh connections of the git commands, None for a connection per command
+    ssh: Optional[SSHMultiplexer] = None
+    # Copies the LFS objects of the repos, None leaves them behind
+    lfs: Optional["LfsTransfer"] = None
+    # Pushes the history of the large repos in chunks, None for a single push
+    chunked_push: Optional[ChunkedPushSettings] = None
+    # Object pools shared by the forks, None clones every repo on its own
+    pools: Optional[ObjectPools] = None
+    # Shared queue the jobs are leased from by a worker of a distributed run
+    work_queue: Optional[WorkQueue] = None
+    # Set to kill the running git commands, e.g. on Ctrl-C
+    cancel: threading.Event = field(default_factory=threading.Event)
+    report: RunReport = field(default_factory=RunReport)
+
+    @contextmanager
+    def git_env(self, vcs: BaseVCS, url: str):
+        '''Yield the environment of a git command talking to url of vcs, held for the whole command.'''
+        if self.ssh is None:
+            yield vcs.git_env()
+            return
+        with self.ssh.session(url) as ssh_env:
+            yield {**vcs.git_env(), **ssh_env}
+
+    def run_options(self, job: "RepoJob", phase: str, env: Dict[str, str]) -> dict:
+        '''Options of utils.shell.run for a git command of the job, env comes from git_env.'''
+        reporter = shell.ProgressReporter(f"[{job.src_project}/{job.src_repo}] {phase}: ", self.progress_interval)
+
+        def on_progress(event: shell.ProgressEvent):
+            reporter(event)
+            job.metrics.on_progress(event)
+
+        return {"timeout": self.command_timeout, "cancel": self.cancel, "on_progress": on_progress, "env": env}
+
+
+@dataclass
+class RepoJob:
+    '''A single entry of the repository map on its way through the migration phases.'''
+    entry: dict
+    log: RepoLog
+    # Found by the validation pass of the map, fails the job before any network call
+    problem: Optional[str] = None
+    src_clone_url: Optional[str] = None
+    dest_push_url: Optional[str] = None
+    source_tips: Optional[str] = None
+    # Object pool of the repo when the run pools the forks
+    pool: Optional[str] = None
+    local_path: Optional[Path] = None
+    # Holds the local mirror from the clone until the push is done
+    resources: ExitStack = field(default_factory=ExitStack)
+    metrics: RepoMetrics = field(default_factory=RepoMetrics)
+    # The lease of the entry when it comes from the work queue
+    lease: Optional[Lease] = None
+
+    @property
+    def src_repo(self) -> str:
+        return self.entry.get('src_repo')
+
+    @property
+    def src_project(self) -> str:
+        return self.entry.get('src_project')
+
+    @property
+    def dest_repo(self) -> str:
+        return self.entry.get('dest_repo')
+
+    @property
+    def dest_project(self) -> str:
+        return self.entry.get('dest_project')
+
+    @property
+    def is_valid(self) -> bool:
+        return all([self.src_repo, self.src_project, self.dest_repo, self.dest_project]) and not self.problem
+
+
+@contextmanager
+def _local_mirror(run: MigrationRun, src_clone_url: str, src_project: str, src_repo: str, log=print):
+    '''
+    Yield the local path of the source mirror. It comes from the mirror cache when enabled,
+    otherwise it is a throwaway directory under the work dir removed once the repo is done.
+    '''
+    if run.mirrors:
+        try:
+            with run.mirrors.checkout(src_clone_url) as path:
+                yield path
+        finally:
+            # The cache stays within its budget during the run, the mirrors in use are kept
+            run.mirrors.evict(log)
+        return
+
+    # Entries of different projects can share a repo name, keep their mirrors apart
+    path = Path(run.work_dir) / src_project / src_repo
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _remove_work_dir(work_dir: str):
+    print("Cleaning up temporary directory...")
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _prepare(run: MigrationRun, job: RepoJob) -> bool:
+    '''
+    Resolve the clone URLs and the source ref tips of the job.
+
+    Output: False when the repo is already in sync on resume and needs no further phase
+    '''
+    if not job.is_valid:
+        raise ValueError(f"Invalid repo map entry: {job.entry}" + (f" ({job.problem})." if job.problem else "."))
+
+    job.log(f"\n--- Migrating '{job.src_repo}' (Project: {job.src_project}) "
+            f"to '{job.dest_repo}' (Project: {job.dest_project}) ---")
+    with job.metrics.phase("prepare"):
+        job.src_clone_url = run.src_vcs.get_clone_url(job.src_repo, run.src_auth, job.src_project)
+        job.dest_push_url = run.dest_vcs.get_clone_url(job.dest_repo, run.dest_auth, job.dest_project)
+
+        # Skip the repos whose source did not change since their last successful migration
+        with run.src_limiter.slot(job.src_clone_url), run.git_env(run.src_vcs, job.src_clone_url) as env:
+            ls_remote = shell.run(["git", "ls-remote", job.src_clone_url], f"Listing source refs of '{job.src_repo}'.",
+                                  log=lambda *_: None, timeout=run.command_timeout, cancel=run.cancel, env=env)
+        ls_remote = run.refs.filter_ls_remote(ls_remote)
+        job.source_tips = tips_hash(ls_remote)
+        if run.pools:
+            job.pool = run.pools.assign(job.entry, ls_remote)
+
+    if run.resume and run.state.is_synced(job.entry, job.source_tips):
+        job.log(f"UP-TO-DATE: '{job.src_repo}' (Project: {job.src_project}) did not change since its last migration. "
+                "Skipping.")
+        return False
+
+    run.state.start(job.entry)
+    return True
+
+
+def _create(run: MigrationRun, job: RepoJob) -> bool:
+    '''1. Create destination repo'''
+    with run.dest_limiter.slot(job.dest_push_url), job.metrics.phase("create"):
+        if not run.dest_vcs.create_repo(job.dest_repo, job.dest_project):
+            raise Exception(f"Failed to create destination repo '{job.dest_repo}' in project '{job.dest_project}'.")
+    return True
+
+
+def _clone(run: MigrationRun, job: RepoJob) -> bool:
+    '''2. Clone source repo, or fetch the deltas into the cached mirror'''
+    # Wait until the clone fits in the disk budget. A cached mirror only fetches the deltas
+    cached = run.mirrors is not None and run.mirrors.path(job.src_clone_url).exists()
+    job.resources.enter_context(run.disk_budget.reserve(
+        None if cached else run.sizes.get((job.src_project, job.src_repo)), run.cancel))
+
+    job.local_path = job.resources.enter_context(
+        _local_mirror(run, job.src_clone_url, job.src_project, job.src_repo, job.log))
+
+    # A new mirror borrows the objects of its pool, the forks of a pool are cloned one after the other
+    pooled = run.pools is not None and not cached
+    with (run.pools.checkout(job.pool, job.log) if pooled else nullcontext()) as pool:
+        with run.src_limiter.slot(job.src_clone_url), run.git_env(run.src_vcs, job.src_clone_url) as env, \
+                job.metrics.phase("clone"):
+            if run.mirrors:
+                run.mirrors.sync(job.src_clone_url, job.local_path, f"source repository '{job.src_repo}'", job.log,
+                                 run.refs.refspecs(), pool, **run.run_options(job, "clone", env))
+            else:
+                fetch_mirror(job.src_clone_url, job.local_path, run.refs.refspecs(),
+                             f"source repository '{job.src_repo}'", job.log, pool, **run.run_options(job, "clone", env))
+        if pooled:
+            with job.metrics.phase("clone"):
+                run.pools.update(pool, job.local_path, job.src_clone_url, job.log)
+                dissociate(job.local_path, job.log)
+    return True
+
+
+def _lfs(run: MigrationRun, job: RepoJob) -> bool:
+    '''LFS objects of the mirror to the destination, before the push of the pointers'''
+    if run.lfs is None:
+        return True
+    with job.metrics.phase("lfs"):
+        from migration.lfs import scan_mirror
+        objects = scan_mirror(job.local_path)
+        if not objects:
+            return True
+        src_url = run.src_vcs.lfs_url(job.src_repo, run.src_auth, job.src_project)
+        dest_url = run.dest_vcs.lfs_url(job.dest_repo, run.dest_auth, job.dest_project)
+        if not src_url or not dest_url:
+            raise Exception(f"'{job.src_repo}' uses LFS but {'source' if not src_url else 'destination'} "
+                            "has no LFS endpoint (LFS needs the https clone URLs of pat auth).")
+        job.log(f"LFS: '{job.src_repo}' points to {len(objects)} objects.")
+        job.metrics.lfs_objects, job.metrics.lfs_bytes = run.lfs.migrate(objects, src_url, dest_url, job.log)
+    return True
+
+
+def _push(run: MigrationRun, job: RepoJob) -> bool:
+    '''
+    3. Push to the destination. Like --mirror within the ref rules: forced updates, and --prune
+    deletes the destination refs under the rules that the source no longer has
+    '''
+    job.metrics.mirror_bytes = dir_size(job.local_path)
+    push_cmd = ["git", "-C", str(job.local_path), "push", "--prune", "--progress", job.dest_push_url,
+                *run.refs.refspecs()]
+    with run.dest_limiter.slot(job.dest_push_url), run.git_env(run.dest_vcs, job.dest_push_url) as env, \
+            job.metrics.phase("push"):
+        chunked = run.chunked_push
+        try:
+            if chunked and job.metrics.mirror_bytes > chunked.threshold_mb * 2**20:
+                job.log(f"'{job.src_repo}' is {job.metrics.mirror_bytes / 2**20:.0f} MiB, pushing its history "
+                        f"in chunks of {chunked.chunk_mb:g} MiB.")
+                push_in_chunks(job.local_path, job.dest_push_url, run.refs, int(chunked.chunk_mb * 2**20),
+                               run.state, job.entry, job.log, **run.run_options(job, "push", env))
+            # The remaining refs, e.g. the tags, and the deletions
+            shell.run(push_cmd, f"Pushing '{job.src_repo}' to destination.", job.log,
+                      **run.run_options(job, "push", env))
+        except Exception:
+            # The destination may have been deleted since it was created, create it again next time
+            run.dest_vcs.forget_repo(job.dest_repo, job.dest_project)
+            raise
+    return True
+
+
+def _finish(run: MigrationRun, job: RepoJob, error: Optional[Exception]) -> bool:
+    '''
+    Release the local mirror, record the outcome in the state store and flush the log of the job.
+
+    Output: True if the repository got migrated (or was already in sync on resume), False otherwise
+    '''
+    try:
+        with job.metrics.phase("cleanup"):
+            job.resources.close()
+    except Exception as e:
+        error = error or e
+
+    metrics = job.metrics
+    metrics.src_project, metrics.src_repo = job.src_project, job.src_repo
+    metrics.dest_project, metrics.dest_repo = job.dest_project, job.dest_repo
+    if not job.is_valid:
+        job.log(f"ERROR: {error} Skipping.")
+        metrics.status, metrics.error = STATUS_FAILED, str(error)
+    elif error:
+        job.log(f"ERROR: Failed to migrate '{job.src_repo}' (Project: {job.src_project}): {error}")
+        run.state.finish(job.entry, job.source_tips, error=str(error))
+        metrics.status, metrics.error = STATUS_FAILED, str(error)
+    elif job.local_path is not None:
+        run.state.finish(job.entry, job.source_tips)
+        job.log(f"SUCCESS: Migrated '{job.src_repo}' (Project: {job.src_project}) "
+                f"to '{job.dest_repo}' (Project: {job.dest_project}).")
+        metrics.status = STATUS_SUCCESS
+    else:
+        metrics.status = STATUS_SKIPPED
+
+    run.report.add(metrics)
+    if job.lease is not None and not run.work_queue.complete(job.lease, asdict(metrics)):
+        job.log(f"WARNING: The lease of '{job.src_repo}' expired meanwhile, "
+                "the result of the worker that took it over is kept.")
+    job.log.flush()
+    return error is None
+
+
+def _migrate_repo(run: MigrationRun, job: RepoJob) -> bool:
+    '''
+    Run all the phases of a single job one after the other.
+
+    Output: True if the repository got migrated (or was already in sync on resume), False otherwise
+    '''
+    try:
+        if _prepare(run, job):
+            _create(run, job)
+            _clone(run, job)
+            _lfs(run, job)
+            _push(run, job)
+    except Exception as e:
+        return _finish(run, job, e)
+    return _finish(run, job, None)
+
+
+def _run_jobs(run: MigrationRun, jobs: Iterable[RepoJob], stages: List[Stage], queue_depth: int) -> list:
+    '''
+    Run the jobs through the stages. The jobs are pulled as the first queue frees up, so a
+    generator of jobs is never materialized.
+
+    Output: the result of every job
+    '''
+    results = []
+    results_lock = threading.Lock()
+
+    def finish(job: RepoJob, error: Optional[Exception]):
+        success = _finish(run, job, error)
+        with results_lock:
+            results.append(success)
+
+    for job, error in run_pipeline(jobs, stages, queue_depth, finish):
+        # e.g. the state store failed, the outcome of the job is unknown
+        print(f"ERROR: Could not record the outcome of '{job.src_repo}' (Project: {job.src_project}): {error}")
+        results.append(False)
+    return results
+
+
+def _run_pool(run: MigrationRun, jobs: Iterable[RepoJob], count: int, concurrency: int) -> list:
+    '''
+    Migrate the jobs with a pool of workers, each running all the phases of one repo at a time.
+
+    Output: the result of every job
+    '''
+    print(f"Migrating {count} repositories with {concurrency} parallel jobs.")
+    migrate = Stage("migrate", lambda job: _prepare(run, job) and _create(run, job) and _clone(run, job)
+                    and _lfs(run, job) and _push(run, job), concurrency)
+    return _run_jobs(run, jobs, [migrate], concurrency)
+
+
+def _run_stages(run: MigrationRun, jobs: Iterable[RepoJob], count: int, stages_config: StageSettings) -> list:
+    '''
+    Migrate the jobs through the create -> clone -> push pipeline, every stage with its own workers.
+
+    Output: the result of every job
+    '''
+    queue_depth = stages_config.queue_depth
+    stages = [
+        Stage("create", lambda job: _prepare(run, job) and _create(run, job), stages_config.create),
+        Stage("clone", lambda job: _clone(run, job), stages_config.clone),
+        Stage("push", lambda job: _push(run, job), stages_config.push),
+    ]
+    if run.lfs:
+        stages.insert(2, Stage("lfs", lambda job: _lfs(run, job), stages_config.lfs))
+    print("Migrating {} repositories through the pipeline: {} (queue depth {}).".format(
+        count, ", ".join(f"{stage.workers} {stage.name}" for stage in stages), queue_depth))
+    return _run_jobs(run, jobs, stages, queue_depth)
+
+
+def migration(config: Optional[Config] = None, jobs: Optional[int] = None, resume: bool = False,
+              worker: bool = False):
     '''
     Migrate repositories from one repo to another repo from once vcs to another vcs. It will decide the src and dest repo from the config.yml and do the migration. The main use of this ditincition is to perform the different auth to clone the repos
 
-    Input: config.yml, and repo_maps.json
+    Input: the loaded Config (config.yml is loaded when None), and repo_maps.json. jobs overrides
+    migration.concurrency of the config, resume skips the repos already in sync according to the state file,
+    worker migrates the entries leased from the shared queue of migration.queue instead of the map
 
     Output: State of the migration either True / False
     '''
     print("Starting migration process...")
-    config = parse_config()
-    if not config:
+    config = config or load_and_report()
+    if config is None:
         print("Error: Invalid or missing configuration. Aborting migration.")
         return False
 
-    map_file_path = config.get("repos", {}).get("map")
-    if not map_file_path or not Path(map_file_path).exists():
-        print(f"Error: Repository map file '{map_file_path}' not found. Aborting.")
-        return False
+    settings = config.migration
+    concurrency = jobs or settings.concurrency
 
-    with open(map_file_path, 'r') as f:
-        repo_map = json.load(f) # Use json.load
+    map_file_path = config.repos_map
+    # Every resource is released as soon as it is made, whatever fails afterwards, setup included
+    with ExitStack() as cleanup:
+        work_queue = None
+        if worker:
+            # The coordinator validated and ordered the map, the entries come from the queue
+            work_queue = open_queue(queue_settings(config))
+            cleanup.callback(work_queue.close)
+            counts = work_queue.counts()
+            count = counts[QUEUE_PENDING] + counts[QUEUE_LEASED]
+            print(f"Leasing repositories from the work queue: {work_queue.path}")
+        else:
+            checked = check_repo_map(map_file_path)
+            if checked is None:
+                return False
+            count, problems = checked
+            if not count:
+                print("Repository map is empty. Nothing to migrate.")
+                return True
 
-    if not repo_map:
-        print("Repository map is empty. Nothing to migrate.")
-        return True
+        print(f"Recording the migration state in: {settings.state_file}")
+
+        api_cache = None
+        if config.api_cache:
+            # Reruns reuse the inventories and skip creating the repos created by an earlier pass
+            api_cache = ApiCache(config.api_cache.path, config.api_cache.ttl_seconds)
+            cleanup.callback(api_cache.close)
+            print(f"Using API cache: {api_cache.path}")
+
+        state = StateStore(settings.state_file)
+        cleanup.callback(state.close)
+        src_vcs = VCSFactory.from_settings(config.src, api_cache)
+        dest_vcs = VCSFactory.from_settings(config.dest, api_cache)
+        run = MigrationRun(
+            src_vcs=src_vcs,
+            dest_vcs=dest_vcs,
+            src_auth=config.src.auth,
+            dest_auth=config.dest.auth,
+            src_limiter=HostLimiter(settings.max_per_src_host),
+            dest_limiter=HostLimiter(settings.max_per_dest_host),
+            state=state,
+            refs=ref_rules(settings.refs, (src_vcs, dest_vcs)),
+            resume=resume,
+            command_timeout=settings.command_timeout,
+            progress_interval=settings.progress_interval,
+            chunked_push=settings.chunked_push,
+            work_queue=work_queue,
+        )
+
+        buffered = settings.stages is not None or concurrency > 1
+        if work_queue:
+            name = worker_name()
+            cleanup.callback(Heartbeat(work_queue, name).stop)
+
+            def leased_jobs():
+                # Leased one at a time as the workers free up, the order of the coordinator is kept
+                for lease in claims(work_queue, name, queue_settings(config).poll_seconds, run.cancel):
+                    # The sizes found by the coordinator are in the entries
+                    run.sizes.update(estimate_sizes([lease.entry]))
+                    yield RepoJob(lease.entry, RepoLog(buffered=buffered), problem=lease.problem, lease=lease)
+
+            repo_jobs = leased_jobs()
+        else:
+            if settings.schedule == 'largest_first' or settings.disk_budget_gb:
+                run.sizes = estimate_sizes(read_repo_map(map_file_path),
+                                           run.src_vcs if settings.size_probe else None)
+                print(f"Found the size of {len(run.sizes)} source repositories.")
+
+            # The map is streamed again, only the largest first order needs all of it in memory
+            indexed_map = enumerate(read_repo_map(map_file_path))
+            if settings.schedule == 'largest_first':
+                # Longest jobs first, the workers pick the next largest repo as they free up
+                indexed_map = largest_first(indexed_map, run.sizes, entry=lambda item: item[1])
+
+            # Parallel migrations keep the output of each repo together
+            repo_jobs = (RepoJob(entry, RepoLog(buffered=buffered), problem=problems.get(index))
+                         for index, entry in indexed_map)
+
+        if settings.disk_budget_gb:
+            run.disk_budget = DiskBudget(int(settings.disk_budget_gb * 2**30))
+            print(f"Starting the clones within a disk budget of {settings.disk_budget_gb} GiB.")
+
+        excluded = f" except {', '.join(run.refs.exclude)}" if run.refs.exclude else ""
+        print(f"Transferring the refs {', '.join(run.refs.include)}{excluded}.")
+
+        if settings.lfs:
+            from migration.lfs import LfsTransfer
+            run.lfs = LfsTransfer(settings.lfs.workers, settings.lfs.batch_size, settings.lfs.store_dir)
+            cleanup.callback(run.lfs.close)
+            print(f"Copying the LFS objects with {settings.lfs.workers} parallel transfers.")
+
+        if settings.ssh:
+            run.ssh = SSHMultiplexer(settings.ssh.command, settings.ssh.max_sessions, settings.ssh.persist_seconds,
+                                     settings.ssh.control_dir, settings.ssh.check_interval)
+            cleanup.callback(run.ssh.close)
+            print(f"Sharing ssh connections, up to {settings.ssh.max_sessions} git commands per connection.")
+
+        if settings.pools:
+            # Kept with the mirror cache, the next runs then find the objects in the pools too
+            pools_dir = settings.pools.dir or (str(Path(settings.cache_dir) / "pools") if settings.cache_dir else None)
+            run.pools = ObjectPools(pools_dir)
+            cleanup.callback(run.pools.close)
+            print(f"Sharing the objects of the forks through the object pools in: {run.pools.root}")
+
+        if settings.cache_dir:
+            max_gb = settings.cache_max_gb
+            run.mirrors = MirrorCache(settings.cache_dir, int(max_gb * 2**30) if max_gb else None)
+            # Also after an interrupted or failed run, the repos evict as they finish otherwise
+            cleanup.callback(run.mirrors.evict)
+            print(f"Using mirror cache: {run.mirrors.root}")
+        else:
+            if settings.work_dir:
+                Path(settings.work_dir).mkdir(parents=True, exist_ok=True)
+            run.work_dir = tempfile.mkdtemp(prefix="vecto-migration-", dir=settings.work_dir)
+            cleanup.callback(_remove_work_dir, run.work_dir)
+            print(f"Created temporary working directory: {run.work_dir}")
 
-    src_vcs = VCSFactory.get_vcs(config['src']['vcs'], config['src'].get('config', {}))
-    dest_vcs = VCSFactory.get_vcs(config['dest']['vcs'], config['dest'].get('config', {}))
-    
-    src_auth = config['src'].get('auth', 'pat') # Default to pat if not specified
-    dest_auth = config['dest'].get('auth', 'pat')
-
-    overall_success = True
-    work_dir = tempfile.mkdtemp(prefix="vecto-migration-")
-    print(f"Created temporary working directory: {work_dir}")
-
-    # The repo_map is now a list of dictionaries
-    for repo_entry in repo_map:
-        src_repo = repo_entry.get('src_repo')
-        src_project = repo_entry.get('src_project')
-        dest_repo = repo_entry.get('dest_repo')
-        dest_project = repo_entry.get('dest_project')
-
-        if not all([src_repo, src_project, dest_repo, dest_project]):
-            print(f"ERROR: Invalid repo map entry: {repo_entry}. Skipping.")
-            overall_success = False
-            continue
-
-        print(f"\n--- Migrating '{src_repo}' (Project: {src_project}) to '{dest_repo}' (Project: {dest_project}) ---")
         try:
-            # 1. Create destination repo
-            if not dest_vcs.create_repo(dest_repo, dest_project):
-                raise Exception(f"Failed to create destination repo '{dest_repo}' in project '{dest_project}'.")
-
-            # 2. Clone source repo
-            src_clone_url = src_vcs.get_clone_url(src_repo, src_auth, src_project)
-            repo_local_path = Path(work_dir) / src_repo
-            
-            clone_cmd = f"git clone --mirror {src_clone_url} {repo_local_path}"
-            run_command(clone_cmd, f"Cloning source repository '{src_repo}'.")
-
-            # 3. Set new remote and push
-            dest_push_url = dest_vcs.get_clone_url(dest_repo, dest_auth, dest_project)
-            
-            remote_cmd = f"git -C {repo_local_path} remote set-url origin {dest_push_url}"
-            run_command(remote_cmd, f"Setting new remote URL for '{src_repo}'.")
-
-            push_cmd = f"git -C {repo_local_path} push --mirror"
-            run_command(push_cmd, f"Pushing '{src_repo}' to destination.")
-            
-            print(f"SUCCESS: Migrated '{src_repo}' (Project: {src_project}) to '{dest_repo}' (Project: {dest_project}).")
-
-        except Exception as e:
-            print(f"ERROR: Failed to migrate '{src_repo}' (Project: {src_project}): {e}")
-            overall_success = False
-
-    # Cleanup
-    print("Cleaning up temporary directory...")
-    shutil.rmtree(work_dir)
+            if settings.stages is not None:
+                results = _run_stages(run, repo_jobs, count, settings.stages)
+            elif concurrency > 1:
+                results = _run_pool(run, repo_jobs, count, concurrency)
+            else:
+                results = [_migrate_repo(run, job) for job in repo_jobs]
+        except KeyboardInterrupt:
+            # Kill the running git commands, the workers then fail their repos quickly
+            print("\nInterrupted, cancelling the running git commands...")
+            run.cancel.set()
+            raise
+
+    overall_success = all(results)
+
+    run.report.print_summary()
+    if settings.report.jsonl:
+        run.report.write_jsonl(settings.report.jsonl)
+        print(f"Run report written to: {settings.report.jsonl}")
+    if settings.report.prometheus:
+        run.report.write_prometheus(settings.report.prometheus)
+        print(f"Prometheus metrics written to: {settings.report.prometheus}")
 
     return overall_success
@@ -0,0 +1,204 @@
+'''
+Per-repo, per-phase timing and transfer metrics of a migration run.
+
+The run report is written as JSON lines (one line per repo, then a summary line) and as a
+Prometheus textfile-collector file with the fleet-level aggregates.
+'''
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from utils.shell import ProgressEvent
+
+
+PHASES = ("prepare", "create", "clone", "lfs", "push", "cleanup")
+
+STATUS_SUCCESS = "success"
+STATUS_FAILED = "failed"
+STATUS_SKIPPED = "skipped"
+
+# Counters (objects, bytes) of RepoMetrics fed by a git progress phase
+_COUNTED_PHASES = {
+    "Receiving objects": ("objects_received", "bytes_received"),
+    "Writing objects": ("objects_sent", "bytes_sent"),
+}
+
+
+def percentile(values: List[float], percent: float) -> float:
+    '''Nearest-rank percentile, 0 for no values.'''
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+@dataclass
+class RepoMetrics:
+    '''Timings and transfer counters of a single repository.'''
+    src_project: Optional[str] = None
+    src_repo: Optional[str] = None
+    dest_project: Optional[str] = None
+    dest_repo: Optional[str] = None
+    status: Optional[str] = None
+    phases: Dict[str, float] = field(default_factory=dict)
+    bytes_received: int = 0
+    objects_received: int = 0
+    bytes_sent: int = 0
+    objects_sent: int = 0
+    mirror_bytes: int = 0
+    # LFS objects uploaded to the destination
+    lfs_objects: int = 0
+    lfs_bytes: int = 0
+    error: Optional[str] = None
+
+    @contextmanager
+    def phase(self, name: str):
+        '''Time a phase, the time of a phase entered twice adds up.'''
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.monotonic() - started
+
+    def __post_init__(self):
+        # Counters before the running transfer by counted phase, not part of the report
+        self._before: Dict[str, Tuple[int, int]] = {}
+
+    def on_progress(self, event: ProgressEvent):
+        '''
+        Keep the transfer counters from the git progress of the clones/fetches and pushes. The
+        progress of a transfer is cumulative, the transfers of a repo (e.g. the chunks of a chunked
+        push) add up: any other phase, like the Enumerating objects of the next push, ends a transfer.
+        '''
+        counters = _COUNTED_PHASES.get(event.phase)
+        if counters is None:
+            self._before.clear()
+            return
+        objects_field, bytes_field = counters
+        objects, size = self._before.setdefault(event.phase, (getattr(self, objects_field), getattr(self, bytes_field)))
+        setattr(self, objects_field, max(getattr(self, objects_field), objects + event.current))
+        setattr(self, bytes_field, max(getattr(self, bytes_field), size + (event.bytes or 0)))
+
+
+class RunReport:
+    '''
+    Collects the RepoMetrics of every repo of a run, safe to share between the workers.
+    '''
+    def __init__(self):
+        self.started = time.time()
+        # End of the run for a report written afterwards, e.g. merged from the workers of a distributed run
+        self.finished: Optional[float] = None
+        self.repos: List[RepoMetrics] = []
+        self._lock = threading.Lock()
+
+    def add(self, metrics: RepoMetrics):
+        with self._lock:
+            self.repos.append(metrics)
+
+    def summary(self) -> dict:
+        with self._lock:
+            repos = list(self.repos)
+        duration = max((self.finished or time.time()) - self.started, 1e-9)
+        statuses = {status: 0 for status in (STATUS_SUCCESS, STATUS_FAILED, STATUS_SKIPPED)}
+        for repo in repos:
+            statuses[repo.status] = statuses.get(repo.status, 0) + 1
+
+        phases = {}
+        for phase in PHASES:
+            values = [repo.phases[phase] for repo in repos if phase in repo.phases]
+            phases[phase] = {
+                "count": len(values),
+                "sum": sum(values),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+            }
+
+        bytes_received = sum(repo.bytes_received for repo in repos)
+        bytes_sent = sum(repo.bytes_sent for repo in repos)
+        return {
+            "type": "summary",
+            "started_at": self.started,
+            "duration_seconds": duration,
+            "repos": statuses,
+            "phases": phases,
+            "bytes_received": bytes_received,
+            "bytes_sent": bytes_sent,
+            "mirror_bytes": sum(repo.mirror_bytes for repo in repos),
+            "lfs_bytes": sum(repo.lfs_bytes for repo in repos),
+            "received_mb_per_second": bytes_received / 2**20 / duration,
+            "sent_mb_per_second": bytes_sent / 2**20 / duration,
+        }
+
+    def write_jsonl(self, path: str):
+        summary = self.summary()
+        with self._lock:
+            repos = list(self.repos)
+        _write_atomic(path, "".join(
+            json.dumps({"type": "repo", **asdict(repo)}) + "\n" for repo in repos
+        ) + json.dumps(summary) + "\n")
+
+    def write_prometheus(self, path: str):
+        summary = self.summary()
+        lines = [
+            "# HELP vecto_repos Repositories of the last migration run by status.",
+            "# TYPE vecto_repos gauge",
+        ]
+        lines += [f'vecto_repos{{status="{status}"}} {count}' for status, count in summary["repos"].items()]
+
+        lines += [
+            "# HELP vecto_phase_duration_seconds Duration of the migration phases of the last run.",
+            "# TYPE vecto_phase_duration_seconds summary",
+        ]
+        for phase, stats in summary["phases"].items():
+            lines.append(f'vecto_phase_duration_seconds{{phase="{phase}",quantile="0.5"}} {stats["p50"]:.6f}')
+            lines.append(f'vecto_phase_duration_seconds{{phase="{phase}",quantile="0.95"}} {stats["p95"]:.6f}')
+            lines.append(f'vecto_phase_duration_seconds_sum{{phase="{phase}"}} {stats["sum"]:.6f}')
+            lines.append(f'vecto_phase_duration_seconds_count{{phase="{phase}"}} {stats["count"]}')
+
+        lines += [
+            "# HELP vecto_transfer_bytes Bytes transferred by the last run.",
+            "# TYPE vecto_transfer_bytes gauge",
+            f'vecto_transfer_bytes{{direction="received"}} {summary["bytes_received"]}',
+            f'vecto_transfer_bytes{{direction="sent"}} {summary["bytes_sent"]}',
+            "# HELP vecto_transfer_mb_per_second Transfer rate of the last run over its wall time, in MiB per second.",
+            "# TYPE vecto_transfer_mb_per_second gauge",
+            f'vecto_transfer_mb_per_second{{direction="received"}} {summary["received_mb_per_second"]:.6f}',
+            f'vecto_transfer_mb_per_second{{direction="sent"}} {summary["sent_mb_per_second"]:.6f}',
+            "# HELP vecto_mirror_bytes On-disk size of the mirrors of the last run.",
+            "# TYPE vecto_mirror_bytes gauge",
+            f'vecto_mirror_bytes {summary["mirror_bytes"]}',
+            "# HELP vecto_run_duration_seconds Wall time of the last run.",
+            "# TYPE vecto_run_duration_seconds gauge",
+            f'vecto_run_duration_seconds {summary["duration_seconds"]:.6f}',
+            "# HELP vecto_run_started_timestamp_seconds Start of the last run.",
+            "# TYPE vecto_run_started_timestamp_seconds gauge",
+            f'vecto_run_started_timestamp_seconds {summary["started_at"]:.3f}',
+        ]
+        _write_atomic(path, "\n".join(lines) + "\n")
+
+    def print_summary(self):
+        summary = self.summary()
+        print(f"\nMigrated {summary['repos'][STATUS_SUCCESS]} repositories, {summary['repos'][STATUS_FAILED]} failed, "
+              f"{summary['repos'][STATUS_SKIPPED]} already up to date in {summary['duration_seconds']:.1f}s.")
+        for phase, stats in summary["phases"].items():
+            if stats["count"]:
+                print(f"  {phase:<8} p50 {stats['p50']:.2f}s  p95 {stats['p95']:.2f}s  total {stats['sum']:.1f}s")
+        print(f"  received {summary['bytes_received'] / 2**20:.1f} MiB "
+              f"({summary['received_mb_per_second']:.2f} MiB/s), "
+              f"sent {summary['bytes_sent'] / 2**20:.1f} MiB ({summary['sent_mb_per_second']:.2f} MiB/s)")
+
+
+def _write_atomic(path: str, content: str):
+    # The textfile collector must never read a half written file
+    target = Path(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+    tmp.write_text(content)
+    os.replace(tmp, target)
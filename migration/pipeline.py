@@ -0,0 +1,87 @@
+'''
+Staged producer/consumer pipeline.
+
+Each stage has its own pool of worker threads and reads its work from a bounded queue
+filled by the previous stage. While the clone stage downloads repo N+1, the push stage
+uploads repo N, so the ingress and egress links are busy at the same time. The queue
+depth bounds how many finished clones wait on disk for the push stage.
+'''
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+
+_DONE = object()
+
+
+@dataclass
+class Stage:
+    '''
+    A stage of the pipeline.
+
+    func gets the item and returns True to hand it to the next stage, or False when the
+    item is done early (e.g. already in sync). Raising marks the item as failed.
+    '''
+    name: str
+    func: Callable[[Any], bool]
+    workers: int = 1
+
+
+def run_pipeline(items: Iterable[Any], stages: List[Stage], queue_depth: int,
+                 finish: Callable[[Any, Optional[Exception]], None]) -> List[Tuple[Any, Exception]]:
+    '''
+    Run every item through the stages in order.
+
+    Input: the items, the stages, the depth of the queue in front of every stage and the
+    callback called exactly once per item with the exception that failed it (or None)
+
+    Output: the items whose finish callback raised, with its exception. The worker keeps
+    draining its queue, a dead worker would block the feeder once the queue is full
+    '''
+    queues = [queue.Queue(maxsize=queue_depth) for _ in stages]
+    finish_errors: List[Tuple[Any, Exception]] = []
+    lock = threading.Lock()
+
+    def finish_safely(item: Any, error: Optional[Exception]):
+        try:
+            finish(item, error)
+        except Exception as e:
+            with lock:
+                finish_errors.append((item, e))
+
+    def worker(index: int):
+        stage = stages[index]
+        while True:
+            item = queues[index].get()
+            if item is _DONE:
+                return
+            try:
+                forward = stage.func(item)
+            except Exception as e:
+                finish_safely(item, e)
+                continue
+            if forward and index + 1 < len(stages):
+                queues[index + 1].put(item)
+            else:
+                finish_safely(item, None)
+
+    threads = []
+    for index, stage in enumerate(stages):
+        threads.append([
+            threading.Thread(target=worker, args=(index,), name=f"vecto-{stage.name}-{number}", daemon=True)
+            for number in range(stage.workers)
+        ])
+        for thread in threads[-1]:
+            thread.start()
+
+    for item in items:
+        queues[0].put(item)
+
+    # Drain the stages in order, a stage is done once all the stages before it are done
+    for index, stage in enumerate(stages):
+        for _ in range(stage.workers):
+            queues[index].put(_DONE)
+        for thread in threads[index]:
+            thread.join()
+    return finish_errors
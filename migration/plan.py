@@ -0,0 +1,250 @@
+'''
+Dry run of a sync pass.
+
+Lists the refs of the source and the destination of every map entry with git ls-remote,
+concurrently, and classifies the repo:
+
+up-to-date: same ref tips on both sides, nothing to transfer
+fast-forward: the destination only misses refs or commits on top of its tips
+divergent: the destination has refs the source deleted or rewrote, the push rewrites them
+new: the destination is missing or empty, the whole repo is transferred
+
+The ancestry of the updated refs and the exact size of the delta need the objects. They are
+checked in the cached source mirror when the mirror cache is enabled, otherwise an updated
+ref counts as fast-forward and the whole repo size is the upper bound of its transfer.
+
+The plan is written as JSON lines, and the repos that need a transfer as a work list map,
+largest transfer first, that migration() consumes like any other map.
+'''
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from utils import shell
+from utils.config import Config
+from utils.repo_map import REQUIRED_FIELDS, read_repo_map, write_repo_map
+from utils.vcs.base import BaseVCS
+from migration.cache import MirrorCache, dir_size
+from migration.concurrency import HostLimiter
+from migration.context import open_context
+from migration.refs import ref_rules
+from migration.scheduling import estimate_sizes
+
+
+PLAN_UP_TO_DATE = "up-to-date"
+PLAN_FAST_FORWARD = "fast-forward"
+PLAN_DIVERGENT = "divergent"
+PLAN_NEW = "new"
+PLAN_INVALID = "invalid"
+PLAN_ERROR = "error"
+PLAN_STATUSES = (PLAN_UP_TO_DATE, PLAN_FAST_FORWARD, PLAN_DIVERGENT, PLAN_NEW, PLAN_INVALID, PLAN_ERROR)
+# Statuses of the repos migration() has to touch
+NEEDS_TRANSFER = (PLAN_FAST_FORWARD, PLAN_DIVERGENT, PLAN_NEW)
+
+DEFAULT_PLAN_FILE = "plan.jsonl"
+DEFAULT_WORK_LIST = "plan-worklist.jsonl"
+DEFAULT_WORKERS = 8
+
+# Answers of git and of the hosts for a repository that does not exist, anything else (credentials,
+# network, timeout) says nothing about the destination
+_NOT_FOUND_RE = re.compile(
+    r"repository not found|repository '[^']*' not found|does not appear to be a git repository|TF401019",
+    re.IGNORECASE)
+
+
+@dataclass
+class RepoPlan:
+    '''What a sync pass would do to a single entry of the map.'''
+    entry: dict
+    status: str
+    added_refs: List[str] = field(default_factory=list)
+    updated_refs: List[str] = field(default_factory=list)
+    deleted_refs: List[str] = field(default_factory=list)
+    # Bytes expected on the wire, None when unknown
+    estimated_bytes: Optional[int] = None
+    # False when estimated_bytes is an upper bound or the ancestry could not be checked
+    exact: bool = False
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        plan = asdict(self)
+        entry = plan.pop("entry")
+        return {**{key: entry.get(key) for key in REQUIRED_FIELDS}, **plan}
+
+
+def parse_ls_remote(output: str) -> Dict[str, str]:
+    '''
+    Ref tips printed by git ls-remote (or for-each-ref with the same format).
+
+    Output: sha by ref name. HEAD is left out, it only mirrors the default branch and an empty
+    destination does not advertise it. So are the peeled tags (^{}), they follow their tag
+    '''
+    refs = {}
+    for line in output.splitlines():
+        sha, _, ref = line.strip().partition("\t")
+        if ref and ref != "HEAD" and not ref.endswith("^{}"):
+            refs[ref] = sha
+    return refs
+
+
+def _git(mirror: Path, *args: str) -> str:
+    return shell.run(["git", "-C", str(mirror), *args], f"git {args[0]} in the cached mirror.", log=lambda *_: None)
+
+
+def _is_ancestor(mirror: Path, ancestor: str, descendant: str) -> Optional[bool]:
+    '''Whether ancestor is an ancestor of descendant, None when the mirror misses one of them.'''
+    try:
+        _git(mirror, "merge-base", "--is-ancestor", ancestor, descendant)
+        return True
+    except shell.CommandError as e:
+        # 1 means not an ancestor, anything else is an unknown object
+        return False if e.returncode == 1 else None
+
+
+def _delta_bytes(mirror: Path, src_refs: Dict[str, str], dest_refs: Dict[str, str]) -> Optional[int]:
+    '''
+    Size on disk of the objects reachable from the source tips and not from the destination tips.
+
+    Output: the size, None when the mirror is not at the source tips
+    '''
+    try:
+        mirror_refs = parse_ls_remote(_git(mirror, "for-each-ref", "--format=%(objectname)\t%(refname)"))
+        if any(mirror_refs.get(ref) != sha for ref, sha in src_refs.items()):
+            return None
+        # Destination tips unknown to the mirror were rewritten away, they do not reduce the delta
+        output = _git(mirror, "rev-list", "--objects", "--disk-usage", "--ignore-missing",
+                      *sorted(set(src_refs.values())), "--not", *sorted(set(dest_refs.values())))
+    except shell.CommandError:
+        return None
+    return int(output.strip() or 0)
+
+
+def classify(entry: dict, src_refs: Dict[str, str], dest_refs: Dict[str, str], size: Optional[int] = None,
+             mirror: Optional[Path] = None) -> RepoPlan:
+    '''
+    Compare the ref tips of the source and the destination of an entry.
+
+    Input: the map entry, the refs of both sides, the size of the source repo if known and its
+    cached mirror if any
+
+    Output: the plan of the entry
+    '''
+    if not dest_refs:
+        return RepoPlan(entry, PLAN_NEW, added_refs=sorted(src_refs), estimated_bytes=size, exact=False)
+
+    plan = RepoPlan(
+        entry, PLAN_UP_TO_DATE,
+        added_refs=sorted(ref for ref in src_refs if ref not in dest_refs),
+        updated_refs=sorted(ref for ref in src_refs if ref in dest_refs and dest_refs[ref] != src_refs[ref]),
+        deleted_refs=sorted(ref for ref in dest_refs if ref not in src_refs),
+    )
+    if not (plan.added_refs or plan.updated_refs or plan.deleted_refs):
+        plan.estimated_bytes, plan.exact = 0, True
+        return plan
+
+    ancestry = [_is_ancestor(mirror, dest_refs[ref], src_refs[ref]) if mirror else None for ref in plan.updated_refs]
+    plan.status = PLAN_DIVERGENT if plan.deleted_refs or False in ancestry else PLAN_FAST_FORWARD
+
+    delta = _delta_bytes(mirror, src_refs, dest_refs) if mirror else None
+    if delta is not None:
+        plan.estimated_bytes, plan.exact = delta, None not in ancestry
+    else:
+        # Without the objects, the whole repo is the upper bound of the transfer
+        plan.estimated_bytes = size
+    return plan
+
+
+def list_refs(url: str, vcs: BaseVCS, limiter: HostLimiter, timeout: Optional[float]) -> Dict[str, str]:
+    '''Ref tips of a remote, listed with git ls-remote within the host limit.'''
+    with limiter.slot(url):
+        return parse_ls_remote(shell.run(["git", "ls-remote", url], "Listing refs.", log=lambda *_: None,
+                                         timeout=timeout, env=vcs.git_env()))
+
+
+def is_repo_not_found(error: shell.CommandError) -> bool:
+    '''Whether a failed ls-remote says the repository does not exist.'''
+    return bool(_NOT_FOUND_RE.search(error.output))
+
+
+def plan(config: Optional[Config] = None, jobs: Optional[int] = None, plan_file: str = DEFAULT_PLAN_FILE,
+         work_list: str = DEFAULT_WORK_LIST) -> bool:
+    '''
+    Plan the next sync pass of the repo map without transferring anything.
+
+    Input: the loaded Config (config.yml is loaded when None), the number of parallel ls-remote
+    (defaults to 8 or migration.concurrency if larger), the files of the plan and of the work list
+
+    Output: True when every entry could be planned
+    '''
+    print("Planning the migration...")
+    context = open_context(config, "plan")
+    if context is None:
+        return False
+    config, count, problems = context.config, context.count, context.problems
+    src_vcs, dest_vcs = context.src_vcs, context.dest_vcs
+    src_limiter, dest_limiter = context.src_limiter, context.dest_limiter
+
+    map_file_path = config.repos_map
+    settings = config.migration
+    # Only the refs a migration would transfer are compared
+    rules = ref_rules(settings.refs, (src_vcs, dest_vcs))
+    # The cached mirrors are only read, never synced
+    mirrors = MirrorCache(settings.cache_dir) if settings.cache_dir else None
+    sizes = estimate_sizes(read_repo_map(map_file_path), src_vcs if settings.size_probe else None)
+
+    def plan_entry(indexed: tuple) -> RepoPlan:
+        index, entry = indexed
+        if index in problems:
+            return RepoPlan(entry, PLAN_INVALID, error=problems[index])
+
+        src_url = src_vcs.get_clone_url(entry['src_repo'], config.src.auth, entry['src_project'])
+        dest_url = dest_vcs.get_clone_url(entry['dest_repo'], config.dest.auth, entry['dest_project'])
+        try:
+            src_refs = rules.filter(list_refs(src_url, src_vcs, src_limiter, settings.command_timeout))
+        except Exception as e:
+            return RepoPlan(entry, PLAN_ERROR, error=str(e))
+        try:
+            dest_refs = rules.filter(list_refs(dest_url, dest_vcs, dest_limiter, settings.command_timeout))
+        except shell.CommandError as e:
+            if not is_repo_not_found(e):
+                return RepoPlan(entry, PLAN_ERROR, error=str(e))
+            # A destination repo that does not exist yet
+            dest_refs = {}
+        except Exception as e:
+            return RepoPlan(entry, PLAN_ERROR, error=str(e))
+
+        mirror = mirrors.path(src_url) if mirrors else None
+        if mirror is not None and not (mirror / "HEAD").exists():
+            mirror = None
+        size = sizes.get((entry['src_project'], entry['src_repo']))
+        if size is None and mirror is not None:
+            size = dir_size(mirror)
+        return classify(entry, src_refs, dest_refs, size, mirror)
+
+    workers = jobs or max(settings.concurrency, DEFAULT_WORKERS)
+    print(f"Listing the refs of {count} repositories with {workers} parallel jobs.")
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vecto-plan") as pool:
+        plans = list(pool.map(plan_entry, enumerate(read_repo_map(map_file_path))))
+
+    with open(plan_file, 'w') as f:
+        for repo_plan in plans:
+            f.write(json.dumps(repo_plan.to_dict()) + "\n")
+
+    # Largest transfer first, unknown sizes last
+    work = sorted((repo_plan for repo_plan in plans if repo_plan.status in NEEDS_TRANSFER),
+                  key=lambda repo_plan: -(repo_plan.estimated_bytes if repo_plan.estimated_bytes is not None else -1))
+    write_repo_map(work_list, ({**repo_plan.entry, "plan": repo_plan.status} for repo_plan in work))
+
+    counts = {status: sum(1 for repo_plan in plans if repo_plan.status == status) for status in PLAN_STATUSES}
+    known = [repo_plan.estimated_bytes for repo_plan in work if repo_plan.estimated_bytes is not None]
+    exact = all(repo_plan.exact for repo_plan in work)
+    print("\n--- Plan ---")
+    print(", ".join(f"{counts[status]} {status}" for status in PLAN_STATUSES if counts[status]))
+    print(f"Estimated transfer: {'' if exact else 'up to '}{sum(known) / 2**20:.1f} MiB"
+          f"{f' ({len(work) - len(known)} repos of unknown size)' if len(known) < len(work) else ''}")
+    print(f"Plan written to: {plan_file}")
+    print(f"Work list of {len(work)} repositories written to: {work_list}")
+    return counts[PLAN_INVALID] == 0 and counts[PLAN_ERROR] == 0
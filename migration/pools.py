@@ -0,0 +1,98 @@
+'''
+Shared object pools of the forks and near-copies of a repository.
+
+A fleet of forks holds the same objects many times. Every repo is assigned to a pool, a bare
+repo holding the objects of its group:
+
+- the repos whose map entry names a fork parent (the parent field written by the map
+  generator) join the pool of that parent
+- the other repos join the pool of the first repo advertising one of their ref tips, two
+  repos sharing a commit share its whole history
+
+The mirror of a repo is created with the pool as its alternate object store, so the fetch only
+downloads what the pool misses. The pool then takes in the new objects of the mirror, and the
+mirror is dissociated (repacked without its alternate) before the push. The clones of a pool
+run one at a time, each one finds the objects of the previous ones in the pool.
+'''
+import hashlib
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional
+
+from utils.shell import run
+from migration.cache import ALTERNATES_FILE, strip_credentials
+
+
+def dissociate(mirror: Path, log=print):
+    '''Copy the objects the mirror borrows from its pool into its own pack, then drop the pool.'''
+    alternates = mirror / ALTERNATES_FILE
+    if not alternates.exists():
+        return
+    run(["git", "-C", str(mirror), "repack", "-a", "-d", "-q"], "Dissociating the mirror from its object pool.", log)
+    alternates.unlink()
+
+
+class ObjectPools:
+    '''
+    Pools of the repos of a run, safe to share between the workers.
+
+    Input: directory of the pools (a throwaway temp directory when None)
+    '''
+    def __init__(self, root: Optional[str] = None):
+        self._own_dir = root is None
+        self.root = Path(root or tempfile.mkdtemp(prefix="vecto-pools-"))
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._locks: Dict[str, threading.Lock] = {}
+        # Pool by ref tip sha of the repos assigned so far
+        self._tips: Dict[str, str] = {}
+
+    def close(self):
+        if self._own_dir:
+            shutil.rmtree(self.root, ignore_errors=True)
+
+    def assign(self, entry: dict, ls_remote: str) -> str:
+        '''
+        Pick the pool of a map entry.
+
+        Input: the entry, the git ls-remote output of its source
+
+        Output: the pool name, <project>/<repo> of the parent or of the first repo of the group
+        '''
+        tips = [line.split("\t", 1)[0] for line in ls_remote.splitlines() if line.strip()]
+        with self._lock:
+            pool = entry.get('parent') or next((self._tips[tip] for tip in tips if tip in self._tips),
+                                               f"{entry['src_project']}/{entry['src_repo']}")
+            for tip in tips:
+                self._tips.setdefault(tip, pool)
+        return pool
+
+    def path(self, pool: str) -> Path:
+        return self.root / f"{hashlib.sha256(pool.encode()).hexdigest()[:24]}.git"
+
+    @contextmanager
+    def checkout(self, pool: str, log=print):
+        '''
+        Reserve the pool, created on its first use. The repos of a pool are cloned one at a time.
+
+        Output: the path of the pool
+        '''
+        with self._lock:
+            lock = self._locks.setdefault(pool, threading.Lock())
+        with lock:
+            path = self.path(pool)
+            if not (path / "HEAD").exists():
+                run(["git", "init", "--quiet", "--bare", str(path)], f"Creating the object pool of {pool}.", log)
+            yield path
+
+    def update(self, pool_path: Path, mirror: Path, src_url: str, log=print):
+        '''
+        Take the new objects of a mirror into the pool, under refs of their own. The refs let
+        the next fetches with the pool as alternate negotiate the objects already there.
+        '''
+        namespace = hashlib.sha256(strip_credentials(src_url).encode()).hexdigest()[:24]
+        run(["git", "-C", str(pool_path), "fetch", "--quiet", "--no-tags", str(mirror.resolve()),
+             f"+refs/*:refs/pools/{namespace}/*"], "Adding the mirror objects to its pool.", log)
@@ -0,0 +1,61 @@
+'''
+Rules on the refs a migration transfers.
+
+git clone --mirror and git push --mirror move every ref of the server, including the ones
+that are not history of the repo: the pull requests of GitHub and Azure DevOps (refs/pull/*)
+and other internal refs. They cost bandwidth, and the destination usually rejects them, which
+fails the whole push.
+
+The rules give the refs to transfer (include) and the refs to leave out (exclude). They turn
+into the refspecs of the fetch, so the hidden refs never reach the mirror, and into an explicit
+list of refspecs for the push, with --prune deleting only the destination refs under the rules.
+Excluded patterns become negative refspecs (^refs/pull/*, git 2.29 or later).
+'''
+from fnmatch import fnmatchcase
+from typing import Dict, Iterable, List, Sequence
+
+from utils.config import RefSettings
+from utils.vcs.base import BaseVCS
+
+
+class RefRules:
+    '''
+    Include/exclude patterns on full ref names, a * matches any part of the name (slashes too).
+    '''
+    def __init__(self, include: Sequence[str], exclude: Sequence[str] = ()):
+        self.include = tuple(include)
+        self.exclude = tuple(exclude)
+
+    def __repr__(self) -> str:
+        return f"RefRules(include={list(self.include)}, exclude={list(self.exclude)})"
+
+    def matches(self, ref: str) -> bool:
+        return (any(fnmatchcase(ref, pattern) for pattern in self.include)
+                and not any(fnmatchcase(ref, pattern) for pattern in self.exclude))
+
+    def filter(self, refs: Dict[str, str]) -> Dict[str, str]:
+        '''Keep the refs (sha by ref name) under the rules.'''
+        return {ref: sha for ref, sha in refs.items() if self.matches(ref)}
+
+    def filter_ls_remote(self, output: str) -> str:
+        '''Keep the lines of git ls-remote whose ref is under the rules, peeled tags follow their tag.'''
+        return "\n".join(line for line in output.splitlines()
+                         if "\t" in line and self.matches(line.split("\t", 1)[1].removesuffix("^{}")))
+
+    def refspecs(self) -> List[str]:
+        '''Forced refspecs mapping every included ref to itself, then the negative ones.'''
+        return [f"+{pattern}:{pattern}" for pattern in self.include] + [f"^{pattern}" for pattern in self.exclude]
+
+
+def ref_rules(settings: RefSettings, vcs: Iterable[BaseVCS]) -> RefRules:
+    '''
+    Rules of a run: the refs section of the config, the exclude list defaults to the hidden refs of the VCS involved.
+
+    Input: migration.refs of the config, the source and destination VCS
+
+    Output: the RefRules
+    '''
+    exclude = settings.exclude
+    if exclude is None:
+        exclude = sorted({pattern for client in vcs for pattern in client.hidden_refs()})
+    return RefRules(settings.include, exclude)
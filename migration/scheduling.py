@@ -0,0 +1,101 @@
+'''
+Size-aware scheduling of the repository map.
+
+estimate_sizes: size of every entry, from the map itself or a probe of the source inventory
+largest_first: orders the map so the longest migrations start first (LPT), the small repos then
+    fill the gaps of the workers instead of a big repo stretching the end of the run
+DiskBudget: admission control of the clones, a clone starts once its estimated size fits in the budget
+'''
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from utils.vcs.base import BaseVCS
+
+
+def _source_key(entry: dict) -> Tuple[str, str]:
+    return entry.get('src_project'), entry.get('src_repo')
+
+
+def estimate_sizes(repo_map: Iterable[dict], src_vcs: Optional[BaseVCS] = None,
+                   log: Callable[[str], None] = print) -> Dict[Tuple[str, str], int]:
+    '''
+    Estimate the size in bytes of every source repo of the map.
+
+    The "size" field of the map entries wins (e.g. written by the map generator). The other repos
+    are looked up in the inventory of their source project, listed once per project.
+    The map is read once, so it can be a generator.
+
+    Input: the repo map, the source VCS to probe (None to only use the map)
+
+    Output: size by (src_project, src_repo), repos of unknown size are missing
+    '''
+    sizes = {}
+    projects = set()
+    for entry in repo_map:
+        if isinstance(entry.get('size'), int) and not isinstance(entry['size'], bool):
+            sizes[_source_key(entry)] = entry['size']
+        elif entry.get('src_project'):
+            projects.add(entry['src_project'])
+
+    if src_vcs is None:
+        return sizes
+
+    for project in sorted(projects):
+        try:
+            inventory = src_vcs.get_inventory(project)
+        except Exception as e:
+            log(f"WARNING: Could not probe the size of the repositories of project '{project}': {e}")
+            continue
+        for repo in inventory:
+            if repo.size is not None:
+                sizes.setdefault((project, repo.name), repo.size)
+    return sizes
+
+
+def largest_first(items: Iterable[Any], sizes: Dict[Tuple[str, str], int],
+                  entry: Callable[[Any], dict] = lambda item: item) -> List[Any]:
+    '''
+    Order the map by decreasing size. Repos of unknown size come last, in map order.
+
+    Input: the map entries (or items holding them, entry gives the map entry of an item) and their sizes
+
+    Output: the ordered items
+    '''
+    return sorted(items, key=lambda item: -sizes.get(_source_key(entry(item)), -1))
+
+
+class DiskBudget:
+    '''
+    Bytes of the work dir reserved by the running clones. A limit of None means no cap.
+
+    A reservation larger than the whole budget is admitted once nothing else is reserved,
+    so a single huge repo still runs instead of blocking forever.
+    '''
+    def __init__(self, limit: Optional[int]):
+        self.limit = limit
+        self.reserved = 0
+        self._condition = threading.Condition()
+
+    def _fits(self, size: int) -> bool:
+        return self.reserved == 0 or self.reserved + size <= self.limit
+
+    @contextmanager
+    def reserve(self, size: Optional[int], cancel: Optional[threading.Event] = None):
+        if not self.limit or not size:
+            yield
+            return
+
+        with self._condition:
+            while not self._fits(size):
+                if cancel is not None and cancel.is_set():
+                    raise Exception("Cancelled while waiting for disk budget.")
+                # Wake up regularly to notice a cancellation
+                self._condition.wait(timeout=1.0)
+            self.reserved += size
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.reserved -= size
+                self._condition.notify_all()
@@ -0,0 +1,145 @@
+'''
+Pool of OpenSSH ControlMaster sessions shared by the git commands of a run.
+
+Every git clone/fetch/push over ssh opens its own connection, so thousands of repos pay
+thousands of handshakes against the same host. The pool hands out a GIT_SSH_COMMAND that
+points ssh at a control socket: the first command of a socket becomes its master (kept alive
+by ControlPersist), the next ones open a session over the master's connection.
+
+A master carries at most max_sessions commands at a time (the sshd MaxSessions, 10 by
+default), more concurrent commands get another master of the same host. A master is checked
+with ssh -O check before being reused, a dead one has its socket removed so the next command
+starts a fresh master. close() stops every master and removes the sockets.
+'''
+import shlex
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+
+DEFAULT_MAX_SESSIONS = 8
+DEFAULT_PERSIST_SECONDS = 60
+DEFAULT_CHECK_INTERVAL = 30.0
+
+
+def is_ssh_url(url: str) -> bool:
+    '''
+    Whether git talks ssh to the remote of a clone URL.
+
+    Input: ssh://git@github.com/org/repo.git, git@ssh.dev.azure.com:v3/org/project/repo, https://dev.azure.com/...
+
+    Output: True, True, False
+    '''
+    if "://" in url:
+        return url.startswith(("ssh://", "git+ssh://", "ssh+git://"))
+    # scp-like syntax, a local path has no colon before its first slash
+    return ":" in url and "/" not in url.split(":", 1)[0] and not url.startswith("ext::")
+
+
+def _destination(url: str) -> str:
+    '''user@host of an ssh URL, a master only carries the sessions of the user it logged in.'''
+    if "://" in url:
+        parsed = urlparse(url)
+        return f"{parsed.username}@{parsed.hostname}" if parsed.username else parsed.hostname
+    return url.split(":", 1)[0]
+
+
+@dataclass
+class _Master:
+    socket: Path
+    # Commands running over the master
+    sessions: int = 0
+    checked_at: Optional[float] = None
+
+
+class SSHMultiplexer:
+    '''
+    ControlMaster sessions by user@host, shared by the workers of a run.
+    '''
+    def __init__(self, command: str = "ssh", max_sessions: int = DEFAULT_MAX_SESSIONS,
+                 persist_seconds: int = DEFAULT_PERSIST_SECONDS, control_dir: Optional[str] = None,
+                 check_interval: float = DEFAULT_CHECK_INTERVAL, clock=time.monotonic):
+        self.command = command
+        self.max_sessions = max_sessions
+        self.persist_seconds = persist_seconds
+        self.check_interval = check_interval
+        self.clock = clock
+        # Unix sockets paths are limited to ~100 bytes, keep them short
+        self._own_dir = control_dir is None
+        self.control_dir = Path(control_dir or tempfile.mkdtemp(prefix="vecto-ssh-"))
+        self.control_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._masters: Dict[str, List[_Master]] = {}
+
+    def _ssh(self, *args: str) -> List[str]:
+        return [*shlex.split(self.command), *args]
+
+    def _ssh_command(self, socket: Path) -> str:
+        return " ".join([
+            self.command,
+            "-o", "ControlMaster=auto",
+            "-o", shlex.quote(f"ControlPath={socket}"),
+            "-o", f"ControlPersist={self.persist_seconds}",
+        ])
+
+    def _control(self, operation: str, destination: str, socket: Path) -> bool:
+        '''Send a control command (check, exit) to the master of a socket.'''
+        result = subprocess.run(self._ssh("-O", operation, "-o", f"ControlPath={socket}", destination),
+                                stdin=subprocess.DEVNULL, capture_output=True, text=True)
+        return result.returncode == 0
+
+    def _acquire(self, destination: str) -> _Master:
+        with self._lock:
+            masters = self._masters.setdefault(destination, [])
+            master = min((master for master in masters if master.sessions < self.max_sessions),
+                         key=lambda master: master.sessions, default=None)
+            if master is None:
+                master = _Master(self.control_dir / f"{destination}-{len(masters)}")
+                masters.append(master)
+            master.sessions += 1
+            due = master.socket.exists() and (
+                master.checked_at is None or self.clock() - master.checked_at >= self.check_interval)
+            if due:
+                master.checked_at = self.clock()
+        if due and not self._control("check", destination, master.socket):
+            # A stale socket would make every session fall back to its own connection
+            print(f"WARNING: SSH master of {destination} is gone, starting a new one.")
+            master.socket.unlink(missing_ok=True)
+        return master
+
+    def _release(self, master: _Master):
+        with self._lock:
+            master.sessions -= 1
+
+    @contextmanager
+    def session(self, url: str):
+        '''
+        Yield the environment variables of a git command talking to url, empty when it does not use ssh.
+        '''
+        if not is_ssh_url(url):
+            yield {}
+            return
+
+        master = self._acquire(_destination(url))
+        try:
+            yield {"GIT_SSH_COMMAND": self._ssh_command(master.socket)}
+        finally:
+            self._release(master)
+
+    def close(self):
+        '''Stop every master and remove the control sockets.'''
+        with self._lock:
+            masters = [(destination, master) for destination, pool in self._masters.items() for master in pool]
+            self._masters = {}
+        for destination, master in masters:
+            if master.socket.exists():
+                self._control("exit", destination, master.socket)
+        if self._own_dir:
+            shutil.rmtree(self.control_dir, ignore_errors=True)
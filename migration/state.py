@@ -0,0 +1,144 @@
+'''
+Durable state of the migrated repositories.
+
+Every entry of the repository map gets a row with its status, timestamps and a hash of
+the source ref tips (git ls-remote) that were pushed. A resumed run skips the entries
+whose source did not change since their last successful migration.
+
+A chunked push also checkpoints every chunk, so an interrupted push resumes after the last
+chunk the destination accepted.
+'''
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+
+STATUS_IN_PROGRESS = "in_progress"
+STATUS_SUCCESS = "success"
+STATUS_FAILED = "failed"
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS repos (
+    src_project TEXT NOT NULL,
+    src_repo TEXT NOT NULL,
+    dest_project TEXT NOT NULL,
+    dest_repo TEXT NOT NULL,
+    status TEXT NOT NULL,
+    source_tips TEXT,
+    started_at REAL,
+    finished_at REAL,
+    error TEXT,
+    PRIMARY KEY (src_project, src_repo, dest_project, dest_repo)
+)
+'''
+
+# Last commit of every branch pushed by a chunked push, cleared once the repo succeeds
+_CHECKPOINTS_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS push_checkpoints (
+    src_project TEXT NOT NULL,
+    src_repo TEXT NOT NULL,
+    dest_project TEXT NOT NULL,
+    dest_repo TEXT NOT NULL,
+    ref TEXT NOT NULL,
+    sha TEXT NOT NULL,
+    pushed_at REAL NOT NULL,
+    PRIMARY KEY (src_project, src_repo, dest_project, dest_repo, ref)
+)
+'''
+
+
+def tips_hash(ls_remote_output: str) -> str:
+    '''Hash of the ref tips printed by git ls-remote, independent of the line order.'''
+    lines = sorted(line.strip() for line in ls_remote_output.splitlines() if line.strip())
+    return hashlib.sha256("\n".join(lines).encode()).hexdigest()
+
+
+def _key(repo_entry: dict) -> tuple:
+    return (repo_entry['src_project'], repo_entry['src_repo'], repo_entry['dest_project'], repo_entry['dest_repo'])
+
+
+class StateStore:
+    '''
+    SQLite backed state store, safe to share between the migration workers.
+
+    Input: path of the database file, created with its parent directory if missing
+    '''
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(_SCHEMA)
+        self._conn.execute(_CHECKPOINTS_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get(self, repo_entry: dict) -> Optional[dict]:
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT status, source_tips, started_at, finished_at, error FROM repos "
+                "WHERE src_project = ? AND src_repo = ? AND dest_project = ? AND dest_repo = ?",
+                _key(repo_entry))
+            row = cursor.fetchone()
+        if not row:
+            return None
+        return dict(zip(("status", "source_tips", "started_at", "finished_at", "error"), row))
+
+    def is_synced(self, repo_entry: dict, source_tips: str) -> bool:
+        '''True if the entry was migrated successfully with the very same source tips.'''
+        state = self.get(repo_entry)
+        return bool(state) and state["status"] == STATUS_SUCCESS and state["source_tips"] == source_tips
+
+    def start(self, repo_entry: dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO repos (src_project, src_repo, dest_project, dest_repo, status, started_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT DO UPDATE SET status = excluded.status, started_at = excluded.started_at, "
+                "finished_at = NULL, error = NULL",
+                (*_key(repo_entry), STATUS_IN_PROGRESS, time.time()))
+
+    def finish(self, repo_entry: dict, source_tips: Optional[str], error: Optional[str] = None):
+        '''Record the outcome of the entry. The source tips are only kept on success.'''
+        status = STATUS_FAILED if error else STATUS_SUCCESS
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO repos (src_project, src_repo, dest_project, dest_repo, status, source_tips, "
+                "finished_at, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT DO UPDATE SET status = excluded.status, source_tips = excluded.source_tips, "
+                "finished_at = excluded.finished_at, error = excluded.error",
+                (*_key(repo_entry), status, None if error else source_tips, time.time(), error))
+            if not error:
+                self._conn.execute(
+                    "DELETE FROM push_checkpoints "
+                    "WHERE src_project = ? AND src_repo = ? AND dest_project = ? AND dest_repo = ?",
+                    _key(repo_entry))
+
+    def checkpoint(self, repo_entry: dict, ref: str, sha: str):
+        '''Record that the destination ref got pushed up to sha.'''
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO push_checkpoints (src_project, src_repo, dest_project, dest_repo, ref, sha, pushed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT DO UPDATE SET sha = excluded.sha, pushed_at = excluded.pushed_at",
+                (*_key(repo_entry), ref, sha, time.time()))
+
+    def checkpoints(self, repo_entry: dict) -> Dict[str, str]:
+        '''Pushed sha by ref of an unfinished chunked push.'''
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT ref, sha FROM push_checkpoints "
+                "WHERE src_project = ? AND src_repo = ? AND dest_project = ? AND dest_repo = ?",
+                _key(repo_entry)).fetchall()
+        return dict(rows)
+
+    def counts(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM repos GROUP BY status").fetchall()
+        return dict(rows)
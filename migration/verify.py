@@ -0,0 +1,210 @@
+'''
+Verification of a migration against the repo map.
+
+Every entry gets its source and destination refs listed with git ls-remote, concurrently, and
+compared under the ref rules of the run: a ref missing at the destination, at another sha, or
+left over there (the push prunes them) is a mismatch.
+
+A sampled subset also gets a deep check: both sides are fetched fresh, the destination copy
+goes through git fsck and both count their commits (git rev-list --count). The sample is a
+stable hash of the entry, so reruns check the same repos.
+
+The results go to a JSON lines report. The mismatching entries go to a re-sync map, and are
+marked failed in the state store so a --resume run migrates them again.
+'''
+import hashlib
+import json
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from utils import shell
+from utils.config import Config
+from utils.repo_map import REQUIRED_FIELDS, read_repo_map, write_repo_map
+from utils.vcs.base import BaseVCS
+from migration.cache import fetch_mirror
+from migration.context import open_context
+from migration.plan import list_refs
+from migration.refs import RefRules, ref_rules
+from migration.state import StateStore
+
+
+VERIFY_MATCH = "match"
+VERIFY_MISMATCH = "mismatch"
+VERIFY_INVALID = "invalid"
+VERIFY_ERROR = "error"
+VERIFY_STATUSES = (VERIFY_MATCH, VERIFY_MISMATCH, VERIFY_INVALID, VERIFY_ERROR)
+
+DEFAULT_REPORT = "verify-report.jsonl"
+DEFAULT_RESYNC = "verify-resync.jsonl"
+DEFAULT_SAMPLE = 0.05
+DEFAULT_WORKERS = 8
+
+
+@dataclass
+class RepoVerification:
+    '''Outcome of the verification of a single entry of the map.'''
+    entry: dict
+    status: str
+    missing_refs: List[str] = field(default_factory=list)
+    mismatched_refs: List[str] = field(default_factory=list)
+    extra_refs: List[str] = field(default_factory=list)
+    # fsck and commit counts of the sampled entries, None when not sampled
+    deep: Optional[dict] = None
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        verification = asdict(self)
+        entry = verification.pop("entry")
+        return {**{key: entry.get(key) for key in REQUIRED_FIELDS}, **verification}
+
+
+def compare_refs(src_refs: Dict[str, str], dest_refs: Dict[str, str]) -> Tuple[List[str], List[str], List[str]]:
+    '''
+    Input: sha by ref name of the source and of the destination
+
+    Output: the refs missing at the destination, at another sha there, and only at the destination
+    '''
+    missing = sorted(ref for ref in src_refs if ref not in dest_refs)
+    mismatched = sorted(ref for ref in src_refs if ref in dest_refs and dest_refs[ref] != src_refs[ref])
+    extra = sorted(ref for ref in dest_refs if ref not in src_refs)
+    return missing, mismatched, extra
+
+
+def is_sampled(entry: dict, rate: float) -> bool:
+    '''Whether the entry is in the deep check sample, stable across runs.'''
+    key = json.dumps([entry.get(key) for key in REQUIRED_FIELDS])
+    return int(hashlib.sha256(key.encode()).hexdigest()[:8], 16) < rate * 2**32
+
+
+def _commit_count(mirror: Path) -> int:
+    return int(shell.run(["git", "-C", str(mirror), "rev-list", "--all", "--count"], "Counting commits.",
+                         log=lambda *_: None).strip() or 0)
+
+
+def _quiet(*_):
+    pass
+
+
+def deep_check(src_url: str, dest_url: str, src_vcs: BaseVCS, dest_vcs: BaseVCS, rules: RefRules,
+               timeout: Optional[float] = None) -> dict:
+    '''
+    Fetch both sides fresh, fsck the destination copy and count the commits of both.
+
+    Output: {"fsck": True or the fsck output, "src_commits": ..., "dest_commits": ...}
+    '''
+    work_dir = Path(tempfile.mkdtemp(prefix="vecto-verify-"))
+    try:
+        fetch_mirror(src_url, work_dir / "src.git", rules.refspecs(), "the source", _quiet,
+                     timeout=timeout, env=src_vcs.git_env())
+        fetch_mirror(dest_url, work_dir / "dest.git", rules.refspecs(), "the destination", _quiet,
+                     timeout=timeout, env=dest_vcs.git_env())
+        try:
+            shell.run(["git", "-C", str(work_dir / "dest.git"), "fsck", "--no-dangling", "--no-progress"],
+                      "Checking the destination objects.", _quiet, timeout=timeout)
+            fsck = True
+        except shell.CommandError as e:
+            fsck = e.output.strip() or str(e)
+        return {"fsck": fsck, "src_commits": _commit_count(work_dir / "src.git"),
+                "dest_commits": _commit_count(work_dir / "dest.git")}
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _reason(verification: RepoVerification) -> str:
+    if verification.error:
+        return verification.error
+    if verification.deep:
+        return f"deep check {verification.deep}"
+    return ", ".join(f"{len(refs)} {kind} refs" for kind, refs in (
+        ("missing", verification.missing_refs), ("mismatched", verification.mismatched_refs),
+        ("extra", verification.extra_refs)) if refs)
+
+
+def verify(config: Optional[Config] = None, jobs: Optional[int] = None, sample: float = DEFAULT_SAMPLE,
+           report: str = DEFAULT_REPORT, resync: str = DEFAULT_RESYNC) -> bool:
+    '''
+    Verify that the destination of every entry of the map has the refs of its source.
+
+    Input: the loaded Config (config.yml is loaded when None), the number of repos verified in
+    parallel (defaults to 8 or migration.concurrency if larger), the share of the repos deep
+    checked, the files of the report and of the re-sync map
+
+    Output: True when every entry matches
+    '''
+    print("Verifying the migration...")
+    context = open_context(config, "verification")
+    if context is None:
+        return False
+    config, count, problems = context.config, context.count, context.problems
+    src_vcs, dest_vcs = context.src_vcs, context.dest_vcs
+    src_limiter, dest_limiter = context.src_limiter, context.dest_limiter
+
+    map_file_path = config.repos_map
+    settings = config.migration
+    rules = ref_rules(settings.refs, (src_vcs, dest_vcs))
+
+    def verify_entry(indexed: tuple) -> RepoVerification:
+        index, entry = indexed
+        if index in problems:
+            return RepoVerification(entry, VERIFY_INVALID, error=problems[index])
+
+        src_url = src_vcs.get_clone_url(entry['src_repo'], config.src.auth, entry['src_project'])
+        dest_url = dest_vcs.get_clone_url(entry['dest_repo'], config.dest.auth, entry['dest_project'])
+        try:
+            src_refs = rules.filter(list_refs(src_url, src_vcs, src_limiter, settings.command_timeout))
+        except Exception as e:
+            return RepoVerification(entry, VERIFY_ERROR, error=f"Source: {e}")
+        try:
+            dest_refs = rules.filter(list_refs(dest_url, dest_vcs, dest_limiter, settings.command_timeout))
+        except Exception as e:
+            # An unreachable destination is a repo to migrate again
+            return RepoVerification(entry, VERIFY_MISMATCH, missing_refs=sorted(src_refs), error=f"Destination: {e}")
+
+        verification = RepoVerification(entry, VERIFY_MATCH, *compare_refs(src_refs, dest_refs))
+        if verification.missing_refs or verification.mismatched_refs or verification.extra_refs:
+            verification.status = VERIFY_MISMATCH
+        elif is_sampled(entry, sample):
+            try:
+                with src_limiter.slot(src_url), dest_limiter.slot(dest_url):
+                    verification.deep = deep_check(src_url, dest_url, src_vcs, dest_vcs, rules,
+                                                   settings.command_timeout)
+            except Exception as e:
+                return RepoVerification(entry, VERIFY_ERROR, error=f"Deep check: {e}")
+            if verification.deep["fsck"] is not True or \
+                    verification.deep["src_commits"] != verification.deep["dest_commits"]:
+                verification.status = VERIFY_MISMATCH
+        return verification
+
+    workers = jobs or max(settings.concurrency, DEFAULT_WORKERS)
+    print(f"Comparing the refs of {count} repositories with {workers} parallel jobs, "
+          f"deep checking {sample:.0%} of them.")
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vecto-verify") as pool:
+        results = list(pool.map(verify_entry, enumerate(read_repo_map(map_file_path))))
+
+    with open(report, 'w') as f:
+        for verification in results:
+            f.write(json.dumps(verification.to_dict()) + "\n")
+
+    # Queue the mismatches for re-sync, a --resume run no longer takes them as in sync
+    mismatches = [verification for verification in results if verification.status == VERIFY_MISMATCH]
+    write_repo_map(resync, (verification.entry for verification in mismatches))
+    state = StateStore(settings.state_file)
+    try:
+        for verification in mismatches:
+            state.finish(verification.entry, None, error=f"Verification mismatch: {_reason(verification)}")
+    finally:
+        state.close()
+
+    counts = {status: sum(1 for verification in results if verification.status == status)
+              for status in VERIFY_STATUSES}
+    print("\n--- Verification ---")
+    print(", ".join(f"{counts[status]} {status}" for status in VERIFY_STATUSES if counts[status]))
+    print(f"Deep checked {sum(1 for verification in results if verification.deep)} repositories.")
+    print(f"Report written to: {report}")
+    if mismatches:
+        print(f"{len(mismatches)} repositories queued for re-sync in: {resync}")
+    return counts[VERIFY_MATCH] == len(results)
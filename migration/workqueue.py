@@ -0,0 +1,341 @@
+'''
+Shared work queue of a distributed migration.
+
+A single host is bound by its network link and disk. A distributed run spreads the map over
+several machines running the same config:
+
+coordinate: validates the map and loads it into the queue, largest repos first
+workers (main.py --worker): lease the next entry, migrate it and record its metrics in the
+    queue, until every entry is done. A heartbeat renews the leases of the running entries,
+    the entries of a crashed worker are leased again once their lease expires
+merge_report: the run report of all the workers, from the metrics recorded in the queue
+
+The queue is a SQLite file on a volume every node mounts. It keeps the rollback journal, WAL
+needs shared memory that network filesystems do not have, and every lease is taken in an
+immediate transaction.
+'''
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from utils.config import Config, QueueSettings, load_and_report
+from utils.repo_map import read_repo_map
+from migration.context import open_context
+from migration.metrics import RepoMetrics, RunReport, STATUS_FAILED
+from migration.scheduling import estimate_sizes, largest_first
+
+
+QUEUE_PENDING = "pending"
+QUEUE_LEASED = "leased"
+QUEUE_DONE = "done"
+
+DEFAULT_MERGED_REPORT = "queue-report.jsonl"
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS work (
+    id INTEGER PRIMARY KEY,
+    entry TEXT NOT NULL,
+    problem TEXT,
+    status TEXT NOT NULL,
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    finished_at REAL
+)
+'''
+
+_META_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+)
+'''
+
+
+def worker_name() -> str:
+    '''Name of the worker of this process, unique across the nodes of a run.'''
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+@dataclass(frozen=True)
+class Lease:
+    '''An entry of the queue leased by a worker.'''
+    id: int
+    entry: dict
+    worker: str
+    attempt: int
+    # Found by the validation of the coordinator
+    problem: Optional[str] = None
+
+
+def _metrics(entry: dict, status: str, error: Optional[str] = None) -> dict:
+    return asdict(RepoMetrics(src_project=entry.get('src_project'), src_repo=entry.get('src_repo'),
+                              dest_project=entry.get('dest_project'), dest_repo=entry.get('dest_repo'),
+                              status=status, error=error))
+
+
+class WorkQueue:
+    '''
+    SQLite backed queue of the map entries, shared by the nodes and by the threads of a worker.
+
+    Input: path of the database file, the lease duration, the number of leases an entry gets
+    before it is failed (a repo crashing its workers every time), and the clock
+    '''
+    def __init__(self, path: str, lease_seconds: float = 300.0, max_attempts: int = 3,
+                 clock: Callable[[], float] = time.time):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.clock = clock
+        self._lock = threading.Lock()
+        # Other nodes hold the database lock for the few milliseconds of a lease
+        self._conn = sqlite3.connect(str(self.path), timeout=60, check_same_thread=False, isolation_level=None)
+        self._conn.execute(_SCHEMA)
+        self._conn.execute(_META_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _transaction(self, statements: Callable[[sqlite3.Connection], object]):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = statements(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def load(self, entries: Iterable[Tuple[dict, Optional[str]]]) -> int:
+        '''
+        Replace the content of the queue with the entries, leased in the given order.
+
+        Input: every map entry with its validation problem (None when valid)
+
+        Output: the number of entries loaded
+        '''
+        def statements(conn: sqlite3.Connection) -> int:
+            conn.execute("DELETE FROM work")
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('created_at', ?)", (str(self.clock()),))
+            count = 0
+            for entry, problem in entries:
+                conn.execute("INSERT INTO work (entry, problem, status) VALUES (?, ?, ?)",
+                             (json.dumps(entry), problem, QUEUE_PENDING))
+                count += 1
+            return count
+        return self._transaction(statements)
+
+    def claim(self, worker: str) -> Optional[Lease]:
+        '''
+        Lease the next entry to worker: a pending one, or one whose lease expired.
+
+        Output: the lease, None when no entry is available right now
+        '''
+        def statements(conn: sqlite3.Connection) -> Optional[Lease]:
+            now = self.clock()
+            while True:
+                row = conn.execute(
+                    "SELECT id, entry, problem, attempts FROM work "
+                    "WHERE status = ? OR (status = ? AND lease_expires < ?) ORDER BY id LIMIT 1",
+                    (QUEUE_PENDING, QUEUE_LEASED, now)).fetchone()
+                if row is None:
+                    return None
+                work_id, entry, problem, attempts = row
+                entry = json.loads(entry)
+                if attempts >= self.max_attempts:
+                    # Every worker leasing it so far died on it
+                    error = f"Lease expired {attempts} times, the workers died on this repo."
+                    conn.execute("UPDATE work SET status = ?, result = ?, finished_at = ? WHERE id = ?",
+                                 (QUEUE_DONE, json.dumps(_metrics(entry, STATUS_FAILED, error)), now, work_id))
+                    continue
+                conn.execute("UPDATE work SET status = ?, worker = ?, lease_expires = ?, attempts = ? WHERE id = ?",
+                             (QUEUE_LEASED, worker, now + self.lease_seconds, attempts + 1, work_id))
+                return Lease(work_id, entry, worker, attempts + 1, problem)
+        return self._transaction(statements)
+
+    def renew(self, worker: str) -> int:
+        '''Extend the leases held by worker. Output: the number of leases renewed'''
+        with self._lock:
+            cursor = self._conn.execute("UPDATE work SET lease_expires = ? WHERE status = ? AND worker = ?",
+                                        (self.clock() + self.lease_seconds, QUEUE_LEASED, worker))
+            return cursor.rowcount
+
+    def complete(self, lease: Lease, metrics: dict) -> bool:
+        '''
+        Record the outcome of a leased entry.
+
+        Output: False when the lease was lost, e.g. expired and leased to another worker,
+        the result of that worker then wins
+        '''
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE work SET status = ?, result = ?, finished_at = ? "
+                "WHERE id = ? AND status = ? AND worker = ? AND attempts = ?",
+                (QUEUE_DONE, json.dumps(metrics), self.clock(), lease.id, QUEUE_LEASED, lease.worker, lease.attempt))
+            return cursor.rowcount == 1
+
+    def counts(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM work GROUP BY status").fetchall()
+        return {status: 0 for status in (QUEUE_PENDING, QUEUE_LEASED, QUEUE_DONE)} | dict(rows)
+
+    def results(self) -> List[dict]:
+        '''Metrics of the finished entries, in queue order.'''
+        with self._lock:
+            rows = self._conn.execute("SELECT result FROM work WHERE status = ? ORDER BY id", (QUEUE_DONE,)).fetchall()
+        return [json.loads(result) for result, in rows]
+
+    def timespan(self) -> Tuple[Optional[float], Optional[float]]:
+        '''When the queue got loaded, and when its last entry finished.'''
+        with self._lock:
+            created = self._conn.execute("SELECT value FROM meta WHERE key = 'created_at'").fetchone()
+            finished, = self._conn.execute("SELECT MAX(finished_at) FROM work").fetchone()
+        return (float(created[0]) if created else None), finished
+
+
+class Heartbeat:
+    '''
+    Renews the leases of a worker in the background, every third of the lease duration.
+    '''
+    def __init__(self, queue: WorkQueue, worker: str):
+        self.queue = queue
+        self.worker = worker
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat, name="vecto-heartbeat", daemon=True)
+        self._thread.start()
+
+    def _beat(self):
+        while not self._stop.wait(self.queue.lease_seconds / 3):
+            try:
+                self.queue.renew(self.worker)
+            except sqlite3.Error as e:
+                # The next beat retries, the lease only expires after missing three of them
+                print(f"WARNING: Could not renew the leases of {self.worker}: {e}")
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def claims(queue: WorkQueue, worker: str, poll_seconds: float = 5.0,
+           cancel: Optional[threading.Event] = None) -> Iterator[Lease]:
+    '''
+    Lease the entries one at a time, as the caller asks for the next one.
+
+    While other workers still hold leases, wait for them to finish or to expire instead of
+    stopping: a crashed worker's entries are taken over. Stops once every entry is done.
+    '''
+    while cancel is None or not cancel.is_set():
+        lease = queue.claim(worker)
+        if lease is not None:
+            yield lease
+            continue
+        counts = queue.counts()
+        if not counts[QUEUE_PENDING] and not counts[QUEUE_LEASED]:
+            return
+        time.sleep(poll_seconds)
+
+
+def queue_settings(config: Config) -> QueueSettings:
+    return config.migration.queue or QueueSettings()
+
+
+def open_queue(settings: QueueSettings) -> WorkQueue:
+    return WorkQueue(settings.path, settings.lease_seconds, settings.max_attempts)
+
+
+def coordinate(config: Optional[Config] = None) -> bool:
+    '''
+    Load the repo map into the shared queue of a distributed run, replacing the earlier run.
+
+    Input: the loaded Config (config.yml is loaded when None)
+
+    Output: True when the queue got loaded
+    '''
+    print("Loading the work queue...")
+    context = open_context(config, "coordination")
+    if context is None:
+        return False
+    config, problems = context.config, context.problems
+
+    map_file_path = config.repos_map
+    settings = config.migration
+    indexed_map = enumerate(read_repo_map(map_file_path))
+    sizes = {}
+    if settings.schedule == 'largest_first' or settings.disk_budget_gb:
+        sizes = estimate_sizes(read_repo_map(map_file_path), context.src_vcs if settings.size_probe else None)
+        print(f"Found the size of {len(sizes)} source repositories.")
+    if settings.schedule == 'largest_first':
+        indexed_map = largest_first(indexed_map, sizes, entry=lambda item: item[1])
+
+    def entries():
+        for index, entry in indexed_map:
+            # The workers read the sizes back for their disk budget
+            size = sizes.get((entry.get('src_project'), entry.get('src_repo')))
+            yield ({**entry, "size": size} if size is not None else entry), problems.get(index)
+
+    queue_config = queue_settings(config)
+    queue = open_queue(queue_config)
+    try:
+        previous = queue.counts()
+        if previous[QUEUE_PENDING] or previous[QUEUE_LEASED]:
+            print(f"WARNING: Dropping {previous[QUEUE_PENDING] + previous[QUEUE_LEASED]} unfinished entries "
+                  "of the previous run.")
+        loaded = queue.load(entries())
+    finally:
+        queue.close()
+    print(f"Loaded {loaded} repositories into the work queue: {queue_config.path}")
+    print("Start the workers with: python main.py --worker")
+    return True
+
+
+def merge_report(config: Optional[Config] = None) -> bool:
+    '''
+    Write the run report of all the workers of a distributed run.
+
+    Input: the loaded Config (config.yml is loaded when None). The JSON lines report goes to
+    migration.report.jsonl (queue-report.jsonl when not set), the Prometheus file to
+    migration.report.prometheus when set
+
+    Output: True when every entry of the queue is done and none failed
+    '''
+    config = config or load_and_report()
+    if config is None:
+        print("Error: Invalid or missing configuration. Aborting.")
+        return False
+
+    queue = open_queue(queue_settings(config))
+    try:
+        counts = queue.counts()
+        results = queue.results()
+        started, finished = queue.timespan()
+    finally:
+        queue.close()
+
+    report = RunReport()
+    report.started = started or report.started
+    report.finished = finished
+    for metrics in results:
+        report.add(RepoMetrics(**metrics))
+    report.print_summary()
+    unfinished = counts[QUEUE_PENDING] + counts[QUEUE_LEASED]
+    if unfinished:
+        print(f"{unfinished} repositories are not migrated yet ({counts[QUEUE_LEASED]} leased by the workers).")
+
+    jsonl = config.migration.report.jsonl or DEFAULT_MERGED_REPORT
+    report.write_jsonl(jsonl)
+    print(f"Run report written to: {jsonl}")
+    if config.migration.report.prometheus:
+        report.write_prometheus(config.migration.report.prometheus)
+        print(f"Prometheus metrics written to: {config.migration.report.prometheus}")
+    return not unfinished and all(metrics["status"] != STATUS_FAILED for metrics in results)
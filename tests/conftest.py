@@ -0,0 +1,52 @@
+import json
+import subprocess
+import pytest
+
+
+def git(*args, cwd=None):
+    return subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True).stdout.strip()
+
+
+@pytest.fixture
+def make_bare_repo(tmp_path):
+    '''
+    Create a bare repository <root>/<project>/<name>.git with a few commits on main and a tag.
+    Returns the path of the bare repository.
+    '''
+    def _make(root, project, name, commits=2):
+        work = tmp_path / "work" / project / name
+        git("init", "-q", "-b", "main", str(work))
+        for number in range(commits):
+            (work / "file.txt").write_text(f"{name} {number}\n")
+            git("add", ".", cwd=work)
+            git("-c", "user.name=t", "-c", "user.email=t@t", "commit", "-q", "-m", f"commit {number}", cwd=work)
+        git("tag", "v1", cwd=work)
+        bare = root / project / f"{name}.git"
+        git("clone", "-q", "--bare", str(work), str(bare))
+        return bare
+    return _make
+
+
+@pytest.fixture
+def local_config(tmp_path, make_bare_repo):
+    '''
+    Build the config dict (load it with utils.config.from_dict) of a Local to Local migration of the
+    repos proj/<name> under tmp_path/src to dest/<name> under tmp_path/dest, with the repo map
+    tmp_path/repos_map.json and the state file tmp_path/state.db.
+    repos=False when the test created the source repos itself.
+    '''
+    def _make(names=("repo0", "repo1", "repo2"), migration=None, src_config=None, dest_config=None,
+              extra_entries=(), repos=True, commits=2):
+        if repos:
+            for name in names:
+                make_bare_repo(tmp_path / "src", "proj", name, commits)
+        repo_map = [{"src_repo": name, "src_project": "proj", "dest_repo": name, "dest_project": "dest"}
+                    for name in names]
+        (tmp_path / "repos_map.json").write_text(json.dumps(repo_map + list(extra_entries)))
+        return {
+            "src": {"vcs": "Local", "config": {"root": str(tmp_path / "src"), **(src_config or {})}},
+            "dest": {"vcs": "Local", "config": {"root": str(tmp_path / "dest"), **(dest_config or {})}},
+            "repos": {"map": str(tmp_path / "repos_map.json")},
+            "migration": {"state_file": str(tmp_path / "state.db"), **(migration or {})},
+        }
+    return _make
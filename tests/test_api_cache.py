@@ -0,0 +1,177 @@
+import requests
+import pytest
+from utils.config import ApiCacheSettings, VCSSettings, from_dict
+from utils.vcs.api_cache import ApiCache, CachedVCS
+from utils.vcs.base import BaseVCS, RepoInfo
+from utils.vcs.factory import VCSFactory
+from utils.vcs.http import conditional_get
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class CountingVCS(BaseVCS):
+    def __init__(self, config):
+        super().__init__(config)
+        self.calls = []
+
+    def get_inventory(self, project):
+        self.calls.append(("inventory", project))
+        return [RepoInfo("api", project, size=42, default_branch="main")]
+
+    def list_projects(self):
+        self.calls.append(("projects",))
+        return ["alpha", "beta"]
+
+    def get_clone_url(self, repo_name, auth_method, project):
+        return f"file:///{project}/{repo_name}"
+
+    def create_repo(self, repo_name, project):
+        self.calls.append(("create", project, repo_name))
+        return repo_name != "forbidden"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    clock = Clock()
+    cache = ApiCache(str(tmp_path / "cache" / "api.db"), ttl=60, clock=clock)
+    yield cache, clock
+    cache.close()
+
+
+def test_api_cache_ttl(cache):
+    cache, clock = cache
+    cache.store("key", {"a": 1}, etag='"v1"')
+    assert cache.fresh("key").value == {"a": 1}
+    clock.now += 60
+    assert cache.fresh("key") is None
+    assert cache.lookup("key").etag == '"v1"'
+    cache.touch("key")
+    assert cache.fresh("key") is not None
+    cache.delete("key")
+    assert cache.lookup("key") is None
+
+
+def test_cached_vcs_answers_from_cache_while_fresh(cache):
+    cache, clock = cache
+    vcs = CountingVCS({"root": "/srv"})
+    cached = CachedVCS(vcs, cache)
+
+    for _ in range(2):
+        assert cached.get_inventory("alpha") == [RepoInfo("api", "alpha", size=42, default_branch="main")]
+        assert cached.list_projects() == ["alpha", "beta"]
+        assert cached.create_repo("api", "alpha") is True
+        assert cached.create_repo("forbidden", "alpha") is False
+    assert vcs.calls == [("inventory", "alpha"), ("projects",), ("create", "alpha", "api"),
+                         ("create", "alpha", "forbidden"), ("create", "alpha", "forbidden")]
+
+    clock.now += 61
+    cached.get_inventory("alpha")
+    cached.create_repo("api", "alpha")
+    assert vcs.calls[-2:] == [("inventory", "alpha"), ("create", "alpha", "api")]
+
+    # Another config is another scope
+    CachedVCS(CountingVCS({"root": "/other"}), cache).get_inventory("alpha")
+    assert cached.get_clone_url("api", "pat", "alpha") == "file:///alpha/api"
+
+
+def _response(status, body="", headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response._content = body.encode()
+    response.headers.update(headers or {})
+    return response
+
+
+def test_conditional_get_revalidates_with_etag(cache):
+    cache, _ = cache
+    sent = []
+    answers = [
+        _response(200, '[{"name": "api"}]', {"ETag": '"v1"', "Link": '<https://x/?page=2>; rel="next"'}),
+        _response(304),
+        _response(200, '[{"name": "web"}]', {"ETag": '"v2"'}),
+    ]
+
+    def request(method, url, **kwargs):
+        sent.append(kwargs.get("headers", {}))
+        return answers.pop(0)
+
+    first = conditional_get(request, "https://x/repos", {"page": 1}, cache, "scope")
+    second = conditional_get(request, "https://x/repos", {"page": 1}, cache, "scope")
+    third = conditional_get(request, "https://x/repos", {"page": 1}, cache, "scope")
+
+    assert sent == [{}, {"If-None-Match": '"v1"'}, {"If-None-Match": '"v1"'}]
+    assert first.json() == second.json() == [{"name": "api"}]
+    assert second.status_code == 200 and second.headers["Link"] == first.headers["Link"]
+    assert third.json() == [{"name": "web"}]
+    assert cache.lookup('http:scope:https://x/repos?page=1').etag == '"v2"'
+
+
+def test_conditional_get_raises_http_errors(cache):
+    cache, _ = cache
+    with pytest.raises(requests.HTTPError):
+        conditional_get(lambda method, url, **kwargs: _response(404), "https://x/repos", None, cache, "scope")
+
+
+def test_factory_wraps_with_cache_and_config(tmp_path, cache):
+    cache, _ = cache
+    vcs = VCSFactory.from_settings(VCSSettings(vcs="Local", config={"root": str(tmp_path)}), cache)
+    assert isinstance(vcs, CachedVCS) and vcs.vcs.api_cache is cache
+    assert not isinstance(VCSFactory.from_settings(VCSSettings(vcs="Local", config={"root": str(tmp_path)})), CachedVCS)
+
+    config = from_dict({"src": {"vcs": "Github", "config": {}}, "dest": {"vcs": "Github", "config": {}},
+                        "repos": {"map": "m.json"}, "api_cache": {"ttl_seconds": 600}})
+    assert config.api_cache == ApiCacheSettings(path=".vecto/api-cache.db", ttl_seconds=600)
+
+
+class HookedVCS(CountingVCS):
+    def hidden_refs(self):
+        return ["refs/pull/*"]
+
+    def lfs_url(self, repo_name, auth_method, project):
+        return f"https://lfs/{project}/{repo_name}"
+
+    def git_env(self):
+        return {"GIT_TERMINAL_PROMPT": "0"}
+
+
+def test_cached_vcs_forwards_the_hooks_of_the_backend(cache):
+    cache, _ = cache
+    vcs = HookedVCS({"root": "/srv"})
+    cached = CachedVCS(vcs, cache)
+
+    assert cached.hidden_refs() == ["refs/pull/*"]
+    assert cached.lfs_url("api", "pat", "alpha") == "https://lfs/alpha/api"
+    assert cached.git_env() == {"GIT_TERMINAL_PROMPT": "0"}
+    assert cached.cache_scope() == vcs.cache_scope()
+    # A hook the backend does not override keeps the default of BaseVCS
+    assert CachedVCS(CountingVCS({"root": "/srv"}), cache).hidden_refs() == []
+
+
+def test_cached_vcs_forgets_the_repos_it_could_not_use(cache):
+    cache, _ = cache
+    vcs = CountingVCS({"root": "/srv"})
+    cached = CachedVCS(vcs, cache)
+
+    assert cached.create_repo("api", "alpha") is True
+    assert cached.create_repo("api", "alpha") is True
+    assert vcs.calls == [("create", "alpha", "api")]
+
+    # The push failed, the next run creates the repo again
+    cached.forget_repo("api", "alpha")
+    assert cached.create_repo("api", "alpha") is True
+    assert vcs.calls == [("create", "alpha", "api")] * 2
+
+    def fail(repo_name, project):
+        raise RuntimeError("API down")
+
+    cached.forget_repo("api", "alpha")
+    vcs.create_repo = fail
+    with pytest.raises(RuntimeError):
+        cached.create_repo("api", "alpha")
+    assert cache.lookup(cached._key("exists", "alpha", "api")) is None
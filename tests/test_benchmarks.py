@@ -0,0 +1,43 @@
+import tempfile
+from conftest import git
+from benchmarks.fleet import FleetSpec, generate_fleet
+from benchmarks.run import cache_dir, run_benchmark
+
+
+def test_generate_fleet(tmp_path):
+    spec = FleetSpec(repos=2, commits=5, blob_kb=1, branches=2, tags=3, large_files=1, large_file_mb=1)
+    root = generate_fleet(tmp_path, spec)
+
+    repo = root / "bench" / "repo-0.git"
+    refs = git("--git-dir", str(repo), "for-each-ref", "--format=%(refname)").splitlines()
+    assert sorted(refs) == ["refs/heads/branch-0", "refs/heads/branch-1", "refs/heads/main",
+                            "refs/tags/v0", "refs/tags/v1", "refs/tags/v2"]
+    assert git("--git-dir", str(repo), "rev-list", "--count", "main") == "5"
+    assert (root / "bench" / "repo-1.git").exists()
+
+    # Same spec, same fleet
+    assert generate_fleet(tmp_path, spec) == root
+
+
+def test_run_benchmark(tmp_path):
+    spec = FleetSpec(repos=2, commits=3, blob_kb=1, branches=1, tags=1)
+    result = run_benchmark(spec, {"concurrency": 2}, fleets_dir=tmp_path)
+
+    assert result["success"] is True
+    assert result["repos_per_minute"] > 0
+    assert result["fleet"]["repos"] == 2
+    assert result["peak_work_dir_mb"] >= 0
+
+
+def test_run_benchmark_keeps_the_cache_between_runs(tmp_path):
+    spec = FleetSpec(repos=2, commits=3, blob_kb=1, branches=1, tags=1)
+    tempdir = tempfile.tempdir
+    cold = run_benchmark(spec, {"cache_dir": True}, fleets_dir=tmp_path)
+    warm = run_benchmark(spec, {"cache_dir": True}, fleets_dir=tmp_path)
+
+    assert (cold["success"], warm["success"]) == (True, True)
+    assert (cold["warm_cache"], warm["warm_cache"]) == (False, True)
+    # The config as given, so the results of the same scenario compare
+    assert cold["migration"] == warm["migration"] == {"cache_dir": True}
+    assert cache_dir(tmp_path, spec, {"cache_dir": True}).parent == tmp_path
+    assert tempfile.tempdir == tempdir
@@ -0,0 +1,102 @@
+import dataclasses
+from conftest import git
+from migration.bundles import MANIFEST_FILE, export_bundles, import_bundles
+from utils.config import from_dict
+from utils.repo_map import read_repo_map
+
+
+def _manifest(bundle_dir):
+    return {line["src_repo"]: line for line in read_repo_map(bundle_dir / MANIFEST_FILE)}
+
+
+def _refs(tmp_path, side, project, name):
+    return git("--git-dir", str(tmp_path / side / project / f"{name}.git"), "show-ref")
+
+
+def test_incremental_export_and_import(tmp_path, local_config):
+    config = from_dict(local_config(["repo0", "repo1"], {"concurrency": 2}, commits=3))
+    bundle_dir = tmp_path / "bundles"
+    assert export_bundles(str(bundle_dir), config) is True
+    assert import_bundles(str(bundle_dir), config) is True
+    for name in ("repo0", "repo1"):
+        assert _refs(tmp_path, "dest", "dest", name) == _refs(tmp_path, "src", "proj", name)
+
+    # Nothing new, no new bundle
+    assert export_bundles(str(bundle_dir), config) is True
+    assert [len(line["bundles"]) for line in _manifest(bundle_dir).values()] == [1, 1]
+
+    # repo0 gets a new commit and loses its tag, repo1 rewinds its branch
+    work = tmp_path / "work" / "proj" / "repo0"
+    (work / "file.txt").write_text("new\n")
+    git("-c", "user.name=t", "-c", "user.email=t@t", "commit", "-q", "-am", "new", cwd=work)
+    git("push", "-q", str(tmp_path / "src" / "proj" / "repo0.git"), "main", cwd=work)
+    git("--git-dir", str(tmp_path / "src" / "proj" / "repo0.git"), "tag", "-d", "v1")
+    git("--git-dir", str(tmp_path / "src" / "proj" / "repo1.git"), "update-ref", "refs/heads/main", "main~1")
+
+    assert export_bundles(str(bundle_dir), config) is True
+    manifest = _manifest(bundle_dir)
+    assert len(manifest["repo0"]["bundles"]) == 2
+    assert len(manifest["repo1"]["bundles"]) == 1
+    # The second bundle only holds the new commit, on top of the first one
+    second = bundle_dir / manifest["repo0"]["bundles"][1]["file"]
+    assert git("bundle", "list-heads", str(second)).endswith("refs/heads/main")
+    assert git("rev-list", "--count", "refs/heads/main", "--not", "main~1",
+               cwd=tmp_path / "src" / "proj" / "repo0.git") == "1"
+    assert manifest["repo0"]["bundles"][1]["size"] < manifest["repo0"]["bundles"][0]["size"]
+
+    assert import_bundles(str(bundle_dir), config) is True
+    for name in ("repo0", "repo1"):
+        assert _refs(tmp_path, "dest", "dest", name) == _refs(tmp_path, "src", "proj", name)
+    # Imported already
+    assert import_bundles(str(bundle_dir), config) is True
+
+
+def test_import_rejects_corrupted_bundle(tmp_path, local_config):
+    config = from_dict(local_config(["repo0"], {"concurrency": 2}, commits=3))
+    bundle_dir = tmp_path / "bundles"
+    assert export_bundles(str(bundle_dir), config) is True
+    bundle = bundle_dir / _manifest(bundle_dir)["repo0"]["bundles"][0]["file"]
+    bundle.write_bytes(bundle.read_bytes()[:-10])
+
+    assert import_bundles(str(bundle_dir), config) is False
+    assert not (tmp_path / "dest" / "dest" / "repo0.git" / "refs" / "heads" / "main").exists()
+
+
+def _new_commit(tmp_path, name):
+    work = tmp_path / "work" / "proj" / name
+    (work / "file.txt").write_text("new\n")
+    git("-c", "user.name=t", "-c", "user.email=t@t", "commit", "-q", "-am", "new", cwd=work)
+    git("push", "-q", str(tmp_path / "src" / "proj" / f"{name}.git"), "main", cwd=work)
+
+
+def test_kept_import_mirror_only_needs_the_new_bundles(tmp_path, local_config):
+    config = from_dict(local_config(["repo0"], {"concurrency": 2}, commits=3))
+    import_config = dataclasses.replace(
+        config, migration=dataclasses.replace(config.migration, cache_dir=str(tmp_path / "import-mirrors")))
+    bundle_dir = tmp_path / "bundles"
+    assert export_bundles(str(bundle_dir), config) is True
+    assert import_bundles(str(bundle_dir), import_config) is True
+
+    # The first bundle was carried over already, only the new one makes the trip
+    _new_commit(tmp_path, "repo0")
+    assert export_bundles(str(bundle_dir), config) is True
+    first, second = _manifest(bundle_dir)["repo0"]["bundles"]
+    (bundle_dir / first["file"]).unlink()
+
+    assert import_bundles(str(bundle_dir), import_config) is True
+    assert _refs(tmp_path, "dest", "dest", "repo0") == _refs(tmp_path, "src", "proj", "repo0")
+
+
+def test_import_without_kept_mirror_needs_the_whole_chain(tmp_path, local_config):
+    config = from_dict(local_config(["repo0"], {"concurrency": 2}, commits=3))
+    bundle_dir = tmp_path / "bundles"
+    assert export_bundles(str(bundle_dir), config) is True
+    assert import_bundles(str(bundle_dir), config) is True
+
+    _new_commit(tmp_path, "repo0")
+    assert export_bundles(str(bundle_dir), config) is True
+    dest_refs = _refs(tmp_path, "dest", "dest", "repo0")
+    (bundle_dir / _manifest(bundle_dir)["repo0"]["bundles"][0]["file"]).unlink()
+
+    assert import_bundles(str(bundle_dir), config) is False
+    assert _refs(tmp_path, "dest", "dest", "repo0") == dest_refs
@@ -0,0 +1,99 @@
+import os
+import threading
+import pytest
+from conftest import git
+import migration.chunked as chunked
+from migration.chunked import plan_chunks
+from migration.main import migration
+from migration.state import StateStore
+from utils import shell
+from utils.config import from_dict
+
+CHUNK_BYTES = 20 * 1024
+
+
+def _large_repo(tmp_path, commits=12):
+    '''A bare repo whose every commit adds ~8 KiB of incompressible data, plus a side branch and a tag.'''
+    work = tmp_path / "work"
+    git("init", "-q", "-b", "main", str(work))
+    for number in range(commits):
+        (work / f"blob{number}").write_bytes(os.urandom(8 * 1024))
+        git("add", ".", cwd=work)
+        git("-c", "user.name=t", "-c", "user.email=t@t", "commit", "-q", "-m", f"commit {number}", cwd=work)
+    git("branch", "side", "HEAD~4", cwd=work)
+    git("tag", "v1", cwd=work)
+    bare = tmp_path / "src" / "proj" / "big.git"
+    git("clone", "-q", "--bare", str(work), str(bare))
+    return bare
+
+
+def test_plan_chunks_stay_under_chunk_size(tmp_path):
+    bare = _large_repo(tmp_path)
+    tip = git("--git-dir", str(bare), "rev-parse", "main")
+
+    chunks = plan_chunks(bare, tip, [], CHUNK_BYTES)
+    assert len(chunks) > 2
+    assert chunks[-1] == tip
+    done = []
+    for commit in chunks:
+        usage = git("--git-dir", str(bare), "rev-list", "--objects", "--disk-usage", commit, "--not", *done)
+        assert int(usage) <= CHUNK_BYTES
+        done.append(commit)
+
+    # Commits the destination has are left out
+    assert plan_chunks(bare, tip, [tip], CHUNK_BYTES) == []
+
+
+def test_plan_chunks_with_more_excluded_commits_than_a_command_line_holds(tmp_path):
+    bare = _large_repo(tmp_path, commits=6)
+    tip = git("--git-dir", str(bare), "rev-parse", "main")
+    # ~3 MB of unknown shas, e.g. the tips of thousands of destination refs
+    unknown = [f"{number:040x}" for number in range(80000)]
+    assert plan_chunks(bare, tip, unknown, 1 << 30) == [tip]
+    assert plan_chunks(bare, tip, unknown + [tip], 1 << 30) == []
+
+
+def test_plan_chunks_stop_once_cancelled(tmp_path):
+    bare = _large_repo(tmp_path, commits=6)
+    tip = git("--git-dir", str(bare), "rev-parse", "main")
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(shell.CommandError) as error:
+        plan_chunks(bare, tip, [], CHUNK_BYTES, cancel=cancel, timeout=60)
+    assert error.value.reason == "cancelled"
+
+
+def test_chunked_push_resumes_after_last_chunk(tmp_path, monkeypatch, local_config):
+    bare = _large_repo(tmp_path)
+    config = from_dict(local_config(["big"], {"chunked_push": {"threshold_mb": 0.01, "chunk_mb": CHUNK_BYTES / 2**20}},
+                                    repos=False))
+
+    # The destination drops the connection after the second chunk
+    real_run, pushes, failures = chunked.shell.run, [], [3]
+
+    def flaky_run(argv, description, *args, **kwargs):
+        if "push" in argv:
+            pushes.append(argv[-1])
+            if failures and len(pushes) == failures[0]:
+                failures.pop()
+                raise chunked.shell.CommandError(description, argv, 1, "fatal: the remote end hung up unexpectedly")
+        return real_run(argv, description, *args, **kwargs)
+
+    monkeypatch.setattr(chunked.shell, "run", flaky_run)
+    assert migration(config) is False
+    state = StateStore(str(tmp_path / "state.db"))
+    assert len(state.checkpoints({"src_project": "proj", "src_repo": "big", "dest_project": "dest",
+                                  "dest_repo": "big"})) == 1
+    state.close()
+
+    first_attempt, pushes[:] = list(pushes), []
+    assert migration(config) is True
+    # The resumed push starts after the second chunk
+    assert pushes[0] == first_attempt[2]
+
+    dest = tmp_path / "dest" / "dest" / "big.git"
+    assert git("--git-dir", str(dest), "show-ref") == git("--git-dir", str(bare), "show-ref")
+    state = StateStore(str(tmp_path / "state.db"))
+    assert state.checkpoints({"src_project": "proj", "src_repo": "big", "dest_project": "dest",
+                              "dest_repo": "big"}) == {}
+    state.close()
@@ -0,0 +1,67 @@
+import threading
+import time
+import pytest
+from migration.concurrency import HostLimiter, RepoLog, url_host
+
+
+@pytest.mark.parametrize("url, host", [
+    ("https://pat@dev.azure.com/org/project/_git/repo", "dev.azure.com"),
+    ("https://github.com/org/repo.git", "github.com"),
+    ("git@github.com:org/repo.git", "github.com"),
+    ("git@ssh.dev.azure.com:v3/org/project/repo", "ssh.dev.azure.com"),
+    ("file:///srv/repos/repo.git", "localhost"),
+])
+def test_url_host(url, host):
+    assert url_host(url) == host
+
+
+def test_host_limiter_caps_per_host():
+    limiter = HostLimiter(2)
+    active = {"github.com": 0, "dev.azure.com": 0}
+    peak = {"github.com": 0, "dev.azure.com": 0}
+    lock = threading.Lock()
+
+    def work(url, host):
+        with limiter.slot(url):
+            with lock:
+                active[host] += 1
+                peak[host] = max(peak[host], active[host])
+            time.sleep(0.02)
+            with lock:
+                active[host] -= 1
+
+    threads = [
+        threading.Thread(target=work, args=(url, host))
+        for _ in range(5)
+        for url, host in (("https://github.com/o/r.git", "github.com"),
+                          ("https://dev.azure.com/o/p/_git/r", "dev.azure.com"))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert peak == {"github.com": 2, "dev.azure.com": 2}
+
+
+def test_host_limiter_without_limit():
+    limiter = HostLimiter(None)
+    with limiter.slot("https://github.com/o/r.git"):
+        with limiter.slot("https://github.com/o/r.git"):
+            pass
+
+
+def test_repo_log_buffers_until_flush(capsys):
+    log = RepoLog(buffered=True)
+    log("first")
+    log("second")
+    assert capsys.readouterr().out == ""
+
+    log.flush()
+    assert capsys.readouterr().out == "first\nsecond\n"
+
+
+def test_repo_log_unbuffered_prints(capsys):
+    log = RepoLog()
+    log("line")
+    assert capsys.readouterr().out == "line\n"
@@ -244,3 +244,155 @@ def test_validate_github_mandatory_empty_config(tmp_path, monkeypatch, mock_conf
     
     monkeypatch.setattr(config, "_get_config_path", mock_config_path)
     assert validate() is True
+
+def _config_with_migration(migration):
+    return {
+        "src": {"vcs": "Github", "config": {}},
+        "dest": {"vcs": "Github", "config": {}},
+        "repos": {"map": "repos_map.json"},
+        "migration": migration
+    }
+
+@pytest.mark.parametrize("migration", [
+    pytest.param({"concurrency": 8, "max_per_src_host": 4, "max_per_dest_host": 2}, id="concurrency"),
+    pytest.param({"cache_dir": ".vecto/mirrors", "cache_max_gb": 0.5}, id="cache"),
+    pytest.param({"stages": {"create": 2, "clone": 4, "lfs": 2, "push": 4, "queue_depth": 2}}, id="stages"),
+    pytest.param({"report": {"jsonl": "run.jsonl", "prometheus": "vecto.prom"}}, id="report"),
+    pytest.param({"schedule": "largest_first", "size_probe": True, "disk_budget_gb": 20}, id="schedule"),
+    pytest.param({"refs": {"include": ["refs/heads/*"], "exclude": ["refs/heads/tmp-*"]}}, id="refs"),
+    pytest.param({"ssh": {"max_sessions": 4, "control_dir": "/tmp/vecto"}}, id="ssh"),
+    pytest.param({"chunked_push": {"threshold_mb": 2048, "chunk_mb": 1000}}, id="chunked_push"),
+    pytest.param({"lfs": {"workers": 16, "batch_size": 50}}, id="lfs"),
+    pytest.param({"queue": {"path": "/mnt/shared/queue.db", "lease_seconds": 120}}, id="queue"),
+    pytest.param({"pools": {"dir": ".vecto/pools"}}, id="pools"),
+])
+def test_validate_migration_valid(tmp_path, monkeypatch, mock_config_path, migration):
+    config_file = tmp_path / "config.yml"
+    config_file.write_text(yaml.dump(_config_with_migration(migration)))
+
+    monkeypatch.setattr(config, "_get_config_path", mock_config_path)
+    assert validate() is True
+
+@pytest.mark.parametrize("migration", [
+    {"concurrency": 0},
+    {"concurrency": "8"},
+    {"concurrency": True},
+    {"max_per_src_host": -1},
+    ["concurrency"],
+    {"cache_dir": 5},
+    {"cache_max_gb": 0},
+    {"state_file": None},
+    {"stages": {"clone": 0}},
+    {"stages": {"download": 2}},
+    {"command_timeout": "1h"},
+    {"report": {"csv": "report.csv"}},
+    {"schedule": "smallest_first"},
+    {"size_probe": "yes"},
+    {"disk_budget_gb": 0},
+    {"refs": {"include": ["heads/*"]}},
+    {"refs": {"exclude": "refs/pull/*"}},
+    {"refs": {"include": ["refs/*/*"]}},
+    {"ssh": {"max_sessions": 0}},
+    {"ssh": {"multiplex": True}},
+    {"chunked_push": {"chunk_mb": 0}},
+    {"chunked_push": {"max_commits": 100}},
+    {"lfs": {"workers": 0}},
+    {"lfs": {"store_dir": 1}},
+    {"queue": {"lease_seconds": 0}},
+    {"queue": {"host": "coordinator"}},
+    {"pools": {"dir": ""}},
+    {"pools": {"by": "root_commit"}},
+])
+def test_validate_migration_invalid(tmp_path, monkeypatch, mock_config_path, migration):
+    config_file = tmp_path / "config.yml"
+    config_file.write_text(yaml.dump(_config_with_migration(migration)))
+
+    monkeypatch.setattr(config, "_get_config_path", mock_config_path)
+    assert validate() is False
+
+@pytest.mark.parametrize("local_config, expected", [
+    ({"root": "/srv/repos"}, True),
+    ({"root": "/srv/repos", "latency_ms": 50, "bandwidth_mbps": 100}, True),
+    ({}, False),
+    ({"root": "/srv/repos", "bandwidth_mbps": 0}, False),
+])
+def test_validate_local_config(tmp_path, monkeypatch, mock_config_path, local_config, expected):
+    config_data = {
+        "src": {"vcs": "Local", "config": local_config},
+        "dest": {"vcs": "Github", "config": {}},
+        "repos": {"map": "repos_map.json"}
+    }
+    config_file = tmp_path / "config.yml"
+    config_file.write_text(yaml.dump(config_data))
+
+    monkeypatch.setattr(config, "_get_config_path", mock_config_path)
+    assert validate() is expected
+
+def test_load_collects_every_error(tmp_path, monkeypatch, mock_config_path):
+    config_data = {
+        "src": {"vcs": "Gitea", "auth": "password", "config": {}},
+        "dest": {"vcs": "Local", "config": {}},
+        "migration": {"concurrency": 0, "concurency": 4}
+    }
+    (tmp_path / "config.yml").write_text(yaml.dump(config_data))
+    monkeypatch.setattr(config, "_get_config_path", mock_config_path)
+
+    with pytest.raises(config.ConfigError) as error:
+        config.load()
+    assert error.value.errors == [
+        "src.vcs invalid: Gitea",
+        "src.auth invalid: password",
+        "Local specific dest config",
+        "repos section structure or map key",
+        "migration.unknown key concurency",
+        "migration.concurrency not a positive integer",
+    ]
+
+def test_load_typed_config(tmp_path, monkeypatch, mock_config_path):
+    config_data = _config_with_migration({"concurrency": 4, "stages": {"clone": 3},
+                                          "report": {"jsonl": "run.jsonl"}})
+    config_data["src"]["get_inventory"] = True
+    (tmp_path / "config.yml").write_text(yaml.dump(config_data))
+    monkeypatch.setattr(config, "_get_config_path", mock_config_path)
+
+    loaded = config.load()
+    assert loaded.src == config.VCSSettings(vcs="Github", get_inventory=True)
+    assert loaded.dest.auth == "pat"
+    assert loaded.repos_map == "repos_map.json"
+    assert loaded.migration.concurrency == 4
+    assert loaded.migration.stages == config.StageSettings(clone=3)
+    assert loaded.migration.report == config.ReportSettings(jsonl="run.jsonl")
+    assert loaded.migration.state_file == ".vecto/state.db"
+    assert loaded.path == tmp_path / "config.yml"
+
+    with pytest.raises(Exception):
+        loaded.migration.concurrency = 8
+    with pytest.raises(TypeError):
+        loaded.src.config["token"] = "s3cret"
+    assert not hasattr(loaded, "__dict__")
+
+def test_from_dict_defaults():
+    loaded = config.from_dict(_config_with_migration({}))
+    assert loaded.migration == config.MigrationSettings()
+    assert loaded.migration.stages is None
+    assert loaded.path is None
+
+def test_from_dict_empty_stages_enable_default_stages():
+    loaded = config.from_dict(_config_with_migration({"stages": {}}))
+    assert loaded.migration.stages == config.StageSettings()
+
+@pytest.mark.parametrize("repos, expected", [
+    ({"include": ["svc-*", "re:^lib"], "exclude": ["proj/*-old"], "skip_forks": True, "inventory_workers": 4}, []),
+    ({"include": "svc-*"}, ["repos.include not a list of patterns"]),
+    ({"exclude": ["re:("]},
+     ["repos.exclude invalid regular expression re:(: missing ), unterminated subpattern at position 0"]),
+    ({"skip_empty": "yes", "inventory_workers": 0},
+     ["repos.skip_empty not bool", "repos.inventory_workers not a positive integer"]),
+])
+def test_check_repos_rules(repos, expected):
+    raw = _config_with_migration({})
+    raw["repos"].update(repos)
+    assert config.check(raw) == expected
+    if not expected:
+        assert config.from_dict(raw).repo_filter == config.RepoFilter(
+            include=("svc-*", "re:^lib"), exclude=("proj/*-old",), skip_forks=True, inventory_workers=4)
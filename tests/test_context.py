@@ -0,0 +1,30 @@
+import json
+from migration.context import check_repo_map, open_context
+from utils.config import from_dict
+from utils.vcs.local import LocalVCS
+
+
+def test_check_repo_map_reports_missing_file(tmp_path, capsys):
+    assert check_repo_map(str(tmp_path / "missing.json")) is None
+    assert "not found" in capsys.readouterr().out
+
+
+def test_check_repo_map_reports_invalid_entries(tmp_path, capsys):
+    entry = {"src_repo": "api", "src_project": "proj", "dest_repo": "api", "dest_project": "dest"}
+    (tmp_path / "repos_map.json").write_text(json.dumps([entry, {"src_repo": "web"}]))
+
+    count, problems = check_repo_map(str(tmp_path / "repos_map.json"))
+    assert count == 2 and list(problems) == [1]
+    assert "Invalid repo map entry #2" in capsys.readouterr().out
+
+
+def test_open_context_builds_both_sides(tmp_path, local_config, capsys):
+    config = from_dict(local_config(["repo0"], {"max_per_src_host": 2}))
+    context = open_context(config, "plan")
+    assert context.count == 1 and context.problems == {}
+    assert isinstance(context.src_vcs, LocalVCS) and isinstance(context.dest_vcs, LocalVCS)
+    assert context.src_limiter.limit == 2
+
+    (tmp_path / "repos_map.json").unlink()
+    assert open_context(config, "plan") is None
+    assert "not found. Aborting." in capsys.readouterr().out
@@ -0,0 +1,69 @@
+import subprocess
+import sys
+from importlib.metadata import EntryPoint
+from pathlib import Path
+import pytest
+import utils.vcs.factory as factory
+from utils.config import from_dict
+from utils.vcs.factory import VCSFactory
+from utils.vcs.local import LocalVCS
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+class PluginVCS(LocalVCS):
+    '''Stands in for a backend of a third-party package.'''
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(VCSFactory, "_registry", dict(VCSFactory._registry))
+    monkeypatch.setattr(factory, "entry_points", lambda group: [
+        EntryPoint(name="Plugin", value="test_factory:PluginVCS", group=group)])
+
+
+def _imported_modules(code):
+    return subprocess.run([sys.executable, "-c", f"import sys\n{code}\nprint(' '.join(sys.modules))"], cwd=ROOT,
+                          check=True, capture_output=True, text=True).stdout.split()
+
+
+def test_startup_imports_no_backend():
+    for code in ("import utils.vcs.factory", "import main"):
+        modules = _imported_modules(code)
+        assert "requests" not in modules
+        assert not {"utils.vcs.github", "utils.vcs.azure_devops", "utils.vcs.local"} & set(modules)
+
+    modules = _imported_modules("from utils.vcs.factory import VCSFactory\nVCSFactory.get_vcs('Local', {'root': '.'})")
+    assert "utils.vcs.local" in modules and "utils.vcs.github" not in modules
+
+
+def test_register_by_class_or_dotted_path(registry, tmp_path):
+    VCSFactory.register("Mine", PluginVCS)
+    assert type(VCSFactory.get_vcs("Mine", {"root": str(tmp_path)})) is PluginVCS
+
+    VCSFactory.register("Dotted", "utils.vcs.local:LocalVCS")
+    assert type(VCSFactory.get_vcs("Dotted", {"root": str(tmp_path)})) is LocalVCS
+    # Imported once, the class replaces the path
+    assert VCSFactory._registry["Dotted"] is LocalVCS
+
+    VCSFactory.register("Broken", "utils.vcs.local")
+    with pytest.raises(ValueError, match="Invalid VCS backend path"):
+        VCSFactory.get_vcs("Broken")
+    VCSFactory.register("NotVCS", "utils.vcs.base:RepoInfo")
+    with pytest.raises(ValueError, match="not a BaseVCS subclass"):
+        VCSFactory.get_vcs("NotVCS")
+
+
+def test_entry_point_backends(registry, tmp_path):
+    assert "Plugin" in VCSFactory.names() and "Github" in VCSFactory.names()
+    assert type(VCSFactory.get_vcs("Plugin", {"root": str(tmp_path)})) is PluginVCS
+    with pytest.raises(ValueError, match="Unsupported VCS: Unknown"):
+        VCSFactory.get_vcs("Unknown")
+
+    # The config accepts the installed backends
+    config = from_dict({
+        "src": {"vcs": "Plugin", "config": {}},
+        "dest": {"vcs": "Local", "config": {"root": str(tmp_path)}},
+        "repos": {"map": "repos.json"},
+    })
+    assert config.src.vcs == "Plugin"
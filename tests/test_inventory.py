@@ -0,0 +1,171 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import pytest
+from utils.vcs.azure_devops import AzureDevOpsVCS
+from utils.vcs.github import GitHubVCS
+from utils.vcs.http import parse_link_header
+
+
+class StubAPI:
+    '''Local HTTP server answering the GitHub and Azure DevOps inventory endpoints.'''
+    def __init__(self, routes):
+        self.routes = routes
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                stub.requests.append((url.path, query, dict(self.headers)))
+                route = stub.routes.get(url.path)
+                if route is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body, headers = route(query, stub.url)
+                payload = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub_api():
+    servers = []
+
+    def _start(routes):
+        servers.append(StubAPI(routes))
+        return servers[-1]
+    yield _start
+    for server in servers:
+        server.close()
+
+
+def _github_repo(number):
+    return {"name": f"repo-{number}", "size": number, "default_branch": "main",
+            "fork": number % 2 == 1, "disabled": number == 4}
+
+
+def _github_pages(query, url):
+    page = int(query.get("page", 1))
+    last = 3
+    links = []
+    if page < last:
+        links.append(f'<{url}/orgs/acme/repos?per_page=100&type=all&page={page + 1}>; rel="next"')
+    links.append(f'<{url}/orgs/acme/repos?per_page=100&type=all&page={last}>; rel="last"')
+    repos = [_github_repo(number) for number in range((page - 1) * 2, page * 2)]
+    return repos, {"Link": ", ".join(links)}
+
+
+def test_parse_link_header():
+    links = parse_link_header('<https://a/?page=2>; rel="next", <https://a/?page=5>; rel="last"')
+    assert links == {"next": "https://a/?page=2", "last": "https://a/?page=5"}
+    assert parse_link_header(None) == {}
+
+
+def test_github_inventory_fetches_all_pages(stub_api, monkeypatch):
+    monkeypatch.setenv("GITHUB_TOKEN", "s3cret")
+    api = stub_api({"/orgs/acme/repos": _github_pages,
+                    "/repos/acme/repo-1": lambda query, url: ({"parent": {"full_name": "upstream/repo"}}, {})})
+
+    inventory = GitHubVCS({"api_url": api.url}).get_inventory("acme")
+
+    assert [repo.name for repo in inventory] == [f"repo-{number}" for number in range(6)]
+    pages = [int(query.get("page", 1)) for path, query, _ in api.requests if path == "/orgs/acme/repos"]
+    assert sorted(pages) == [1, 2, 3]
+    # The parents come from the repo endpoint of the forks only, repo-3 and repo-5 are gone meanwhile
+    assert sorted(path for path, _, _ in api.requests if path.startswith("/repos/")) == \
+        ["/repos/acme/repo-1", "/repos/acme/repo-3", "/repos/acme/repo-5"]
+    assert [repo.parent for repo in inventory] == [None, "upstream/repo", None, None, None, None]
+    assert all(headers["Authorization"] == "Bearer s3cret" for _, _, headers in api.requests)
+    assert inventory[0].is_empty and inventory[0].size == 0
+    assert inventory[3].size == 3 * 1024 and inventory[3].is_fork
+    assert inventory[4].is_disabled
+    assert inventory[1].default_branch == "main"
+
+
+def test_github_inventory_falls_back_to_user(stub_api):
+    api = stub_api({"/users/someone/repos": lambda query, url: ([_github_repo(2)], {})})
+    inventory = GitHubVCS({"api_url": api.url}).get_inventory("someone")
+    assert [repo.name for repo in inventory] == ["repo-2"]
+
+
+def test_github_clone_url_follows_the_enterprise_host(monkeypatch):
+    monkeypatch.delenv("GITHUB_TOKEN", raising=False)
+    assert GitHubVCS({}).get_clone_url("app", "ssh", "acme") == "git@github.com:acme/app.git"
+    enterprise = GitHubVCS({"api_url": "https://git.example.com/api/v3"})
+    assert enterprise.get_clone_url("app", "ssh", "acme") == "git@git.example.com:acme/app.git"
+    assert enterprise.get_clone_url("app", "pat", "acme") == "https://git.example.com/acme/app.git"
+
+
+def test_github_list_projects(stub_api):
+    api = stub_api({"/user/orgs": lambda query, url: ([{"login": "acme"}, {"login": "globex"}], {})})
+    assert GitHubVCS({"api_url": api.url}).list_projects() == ["acme", "globex"]
+    assert GitHubVCS({"api_url": api.url, "orgs": ["initech"]}).list_projects() == ["initech"]
+
+
+def _ado_projects(query, url):
+    if query.get("continuationToken") == "next":
+        return {"value": [{"name": "beta"}]}, {}
+    return {"value": [{"name": "alpha"}]}, {"x-ms-continuationtoken": "next"}
+
+
+def _ado_repos(project):
+    def route(query, url):
+        assert query["api-version"] == "7.1"
+        return {"value": [
+            {"name": f"{project}-app", "size": 2048, "defaultBranch": "refs/heads/develop"},
+            {"name": f"{project}-fork", "size": 0, "isFork": True, "isDisabled": True,
+             "parentRepository": {"name": "upstream", "project": {"name": "core"}}},
+        ]}, {}
+    return route
+
+
+def test_azure_inventory(stub_api, monkeypatch):
+    monkeypatch.setenv("ADO_PAT", "s3cret")
+    api = stub_api({"/myorg/alpha/_apis/git/repositories": _ado_repos("alpha")})
+
+    inventory = AzureDevOpsVCS({"org_url": f"{api.url}/myorg"}).get_inventory("alpha")
+
+    assert [repo.name for repo in inventory] == ["alpha-app", "alpha-fork"]
+    app, fork = inventory
+    assert (app.size, app.default_branch, app.is_empty) == (2048, "develop", False)
+    assert (fork.is_fork, fork.is_disabled, fork.is_empty, fork.parent) == (True, True, True, "core/upstream")
+    assert api.requests[0][2]["Authorization"].startswith("Basic ")
+
+
+def test_azure_projects_follow_continuation_token(stub_api):
+    api = stub_api({"/myorg/_apis/projects": _ado_projects})
+    assert AzureDevOpsVCS({"org_url": f"{api.url}/myorg"}).list_projects() == ["alpha", "beta"]
+
+
+def test_azure_inventory_of_all_projects(stub_api):
+    api = stub_api({
+        "/myorg/_apis/projects": _ado_projects,
+        "/myorg/alpha/_apis/git/repositories": _ado_repos("alpha"),
+        "/myorg/beta/_apis/git/repositories": _ado_repos("beta"),
+    })
+    inventory = AzureDevOpsVCS({"org_url": f"{api.url}/myorg"}).get_inventory(None)
+    assert [(repo.project, repo.name) for repo in inventory] == [
+        ("alpha", "alpha-app"), ("alpha", "alpha-fork"), ("beta", "beta-app"), ("beta", "beta-fork")]
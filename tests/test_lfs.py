@@ -0,0 +1,179 @@
+import hashlib
+import json
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from conftest import git
+from migration.lfs import LfsObject, LfsTransfer, parse_pointer, scan_mirror
+from migration.main import migration
+from utils.config import from_dict
+from utils.vcs.ratelimit import RequestScheduler
+
+
+class LfsStub:
+    '''
+    Minimal LFS server: the batch API with the basic transfer, objects stored by repo path and oid.
+    '''
+    def __init__(self):
+        self.objects = {}
+        self.requests = Counter()
+        # Methods answered once with a 429 before being served
+        self.throttle = set()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, body=b"", content_type="application/vnd.git-lfs+json"):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _body(self):
+                return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            def _throttled(self):
+                if self.command not in stub.throttle:
+                    return False
+                stub.throttle.discard(self.command)
+                self._body()
+                self.send_response(429)
+                self.send_header("Retry-After", "0")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return True
+
+            def do_POST(self):
+                if self._throttled():
+                    return
+                body = json.loads(self._body())
+                if self.path.endswith("/verify"):
+                    repo = self.path[:-len("/verify")]
+                    return self._reply(200 if (repo, body["oid"]) in stub.objects else 422)
+
+                repo = self.path[:-len("/objects/batch")]
+                stub.requests[("batch", body["operation"], repo)] += 1
+                answers = []
+                for item in body["objects"]:
+                    href = f"http://127.0.0.1:{stub.port}{repo}/objects/{item['oid']}"
+                    present = (repo, item["oid"]) in stub.objects
+                    if body["operation"] == "download":
+                        answers.append({**item, "actions": {"download": {"href": href}}} if present
+                                       else {**item, "error": {"code": 404, "message": "Object does not exist"}})
+                    elif present:
+                        answers.append(item)
+                    else:
+                        answers.append({**item, "actions": {
+                            "upload": {"href": href, "header": {"Authorization": "Basic token"}},
+                            "verify": {"href": f"http://127.0.0.1:{stub.port}{repo}/verify"}}})
+                self._reply(200, json.dumps({"transfer": "basic", "objects": answers}).encode())
+
+            def do_GET(self):
+                if self._throttled():
+                    return
+                repo, _, oid = self.path.rpartition("/objects/")
+                stub.requests[("GET", oid)] += 1
+                self._reply(200, stub.objects[(repo, oid)], "application/octet-stream")
+
+            def do_PUT(self):
+                if self._throttled():
+                    return
+                repo, _, oid = self.path.rpartition("/objects/")
+                stub.requests[("PUT", oid)] += 1
+                assert self.headers["Authorization"] == "Basic token"
+                stub.objects[(repo, oid)] = self._body()
+                self._reply(200)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def add(self, repo, content):
+        oid = hashlib.sha256(content).hexdigest()
+        self.objects[(repo, oid)] = content
+        return oid
+
+
+def _pointer(content):
+    return (f"version https://git-lfs.github.com/spec/v1\noid sha256:{hashlib.sha256(content).hexdigest()}\n"
+            f"size {len(content)}\n")
+
+
+def _lfs_repo(tmp_path, name, files):
+    work = tmp_path / "work" / name
+    git("init", "-q", "-b", "main", str(work))
+    (work / ".gitattributes").write_text("*.bin filter=lfs diff=lfs merge=lfs -text\n")
+    for file_name, content in files.items():
+        (work / file_name).write_text(_pointer(content))
+    git("add", ".", cwd=work)
+    git("-c", "user.name=t", "-c", "user.email=t@t", "commit", "-q", "-m", "lfs", cwd=work)
+    bare = tmp_path / "src" / "proj" / f"{name}.git"
+    git("clone", "-q", "--bare", str(work), str(bare))
+    return bare
+
+
+def test_parse_pointer():
+    assert parse_pointer(_pointer(b"data").encode()) == LfsObject(hashlib.sha256(b"data").hexdigest(), 4)
+    assert parse_pointer(b"plain text\n") is None
+    assert parse_pointer(b"version https://git-lfs.github.com/spec/v1\noid sha256:abc\nsize 1\n") is None
+    assert parse_pointer(b"\xff\xfe") is None
+
+
+def test_scan_mirror_needs_lfs_attributes(tmp_path, make_bare_repo):
+    bare = _lfs_repo(tmp_path, "lfs", {"a.bin": b"a", "b c.bin": b"b"})
+    assert {lfs_object.size for lfs_object in scan_mirror(bare)} == {1}
+    assert len(scan_mirror(bare)) == 2
+    assert scan_mirror(make_bare_repo(tmp_path / "src", "proj", "plain")) == []
+
+
+def test_migration_copies_lfs_objects_once(tmp_path, make_bare_repo, local_config):
+    shared, own = b"shared " * 1000, b"own " * 1000
+    _lfs_repo(tmp_path, "repo0", {"shared.bin": shared, "own.bin": own})
+    _lfs_repo(tmp_path, "repo1", {"copy.bin": shared})
+    make_bare_repo(tmp_path / "src", "proj", "plain")
+
+    src, dest = LfsStub(), LfsStub()
+    for repo in ("repo0", "repo1"):
+        shared_oid = src.add(f"/src/proj/{repo}", shared)
+    own_oid = src.add("/src/proj/repo0", own)
+    # The destination already has this one
+    dest.add("/dest/dest/repo0", own)
+
+    config = from_dict(local_config(["repo0", "repo1", "plain"], {"concurrency": 2, "lfs": {"workers": 4}},
+                                    src_config={"lfs_url": f"{src.url}/src"},
+                                    dest_config={"lfs_url": f"{dest.url}/dest"}, repos=False))
+    assert migration(config) is True
+
+    assert dest.objects[("/dest/dest/repo0", shared_oid)] == shared
+    assert dest.objects[("/dest/dest/repo1", shared_oid)] == shared
+    # Downloaded once for both repos, never uploaded where it already was
+    assert src.requests[("GET", shared_oid)] == 1
+    assert src.requests[("GET", own_oid)] == 0
+    assert dest.requests[("PUT", own_oid)] == 0
+    assert not any(key[-1].endswith("plain") for key in src.requests + dest.requests)
+
+
+def test_lfs_transfer_backs_off_throttled_requests(tmp_path):
+    content = b"large " * 1000
+    src, dest = LfsStub(), LfsStub()
+    oid = src.add("/src/repo", content)
+    src.throttle.update({"POST", "GET"})
+    dest.throttle.update({"POST", "PUT"})
+
+    transfer = LfsTransfer(workers=2, store_dir=str(tmp_path / "store"),
+                           scheduler=RequestScheduler(sleep=lambda seconds: None))
+    try:
+        assert transfer.migrate([LfsObject(oid, len(content))], f"{src.url}/src/repo",
+                                f"{dest.url}/dest/repo", log=lambda *_: None) == (1, len(content))
+    finally:
+        transfer.close()
+    # The retried upload sends the whole file again
+    assert dest.objects[("/dest/repo", oid)] == content
+    assert not src.throttle and not dest.throttle
@@ -0,0 +1,72 @@
+import time
+from conftest import git
+from utils.vcs.factory import VCSFactory
+from utils.vcs.local import LocalVCS
+
+
+def test_factory_knows_local(tmp_path):
+    assert isinstance(VCSFactory.get_vcs("Local", {"root": str(tmp_path)}), LocalVCS)
+
+
+def test_inventory_lists_bare_repos(tmp_path, make_bare_repo):
+    make_bare_repo(tmp_path / "repos", "proj", "beta")
+    make_bare_repo(tmp_path / "repos", "proj", "alpha")
+    (tmp_path / "repos" / "proj" / "not-a-repo.git").mkdir()
+
+    LocalVCS({"root": str(tmp_path / "repos")}).create_repo("empty", "proj")
+
+    vcs = LocalVCS({"root": str(tmp_path / "repos")})
+    inventory = vcs.get_inventory("proj")
+    assert [repo.name for repo in inventory] == ["alpha", "beta", "empty"]
+    assert [repo.is_empty for repo in inventory] == [False, False, True]
+    assert inventory[0].default_branch == "main"
+    assert inventory[0].size > 0
+    assert vcs.get_inventory("missing") == []
+
+
+def test_clone_url_is_file_uri(tmp_path):
+    vcs = LocalVCS({"root": str(tmp_path)})
+    assert vcs.get_clone_url("repo", "ssh", "proj") == (tmp_path / "proj" / "repo.git").as_uri()
+    assert vcs.git_env() == {}
+
+
+def test_create_repo_is_idempotent(tmp_path):
+    vcs = LocalVCS({"root": str(tmp_path)})
+    assert vcs.create_repo("repo", "proj") is True
+    assert vcs.create_repo("repo", "proj") is True
+    assert git("--git-dir", str(tmp_path / "proj" / "repo.git"), "rev-parse", "--is-bare-repository") == "true"
+
+
+def test_throttled_clone(tmp_path, make_bare_repo, monkeypatch):
+    bare = make_bare_repo(tmp_path / "repos", "proj", "repo")
+    vcs = LocalVCS({"root": str(tmp_path / "repos"), "latency_ms": 200, "bandwidth_mbps": 100})
+    url = vcs.get_clone_url("repo", "pat", "proj")
+    assert url.startswith("ext::")
+
+    for key, value in vcs.git_env().items():
+        monkeypatch.setenv(key, value)
+    started = time.monotonic()
+    git("clone", "-q", "--mirror", url, str(tmp_path / "mirror.git"))
+
+    assert time.monotonic() - started >= 0.2
+    mirror = tmp_path / "mirror.git"
+    assert git("--git-dir", str(mirror), "rev-parse", "main") == git("--git-dir", str(bare), "rev-parse", "main")
+
+
+def test_throttled_clone_with_spaces_in_paths(tmp_path, make_bare_repo, monkeypatch):
+    # The user's own config entries are kept
+    monkeypatch.setenv("GIT_CONFIG_COUNT", "1")
+    monkeypatch.setenv("GIT_CONFIG_KEY_0", "user.name")
+    monkeypatch.setenv("GIT_CONFIG_VALUE_0", "someone")
+    root = tmp_path / "my repos"
+    bare = make_bare_repo(root, "my proj", "repo")
+    vcs = LocalVCS({"root": str(root), "latency_ms": 1})
+    env = vcs.git_env()
+    assert env == {"GIT_CONFIG_COUNT": "2", "GIT_CONFIG_KEY_1": "protocol.ext.allow", "GIT_CONFIG_VALUE_1": "always"}
+
+    for key, value in env.items():
+        monkeypatch.setenv(key, value)
+    git("clone", "-q", "--mirror", vcs.get_clone_url("repo", "pat", "my proj"), str(tmp_path / "mirror.git"))
+    mirror = tmp_path / "mirror.git"
+    assert git("--git-dir", str(mirror), "rev-parse", "main") == git("--git-dir", str(bare), "rev-parse", "main")
+    assert git("config", "user.name") == "someone"
@@ -0,0 +1,78 @@
+import json
+from dataclasses import asdict
+from migration.metrics import RepoMetrics, RunReport, percentile, STATUS_FAILED, STATUS_SKIPPED, STATUS_SUCCESS
+from utils.shell import parse_progress
+
+
+def test_percentile_nearest_rank():
+    values = [float(value) for value in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 95) == 95.0
+    assert percentile([3.0], 95) == 3.0
+    assert percentile([], 50) == 0.0
+
+
+def test_phase_timer_adds_up():
+    metrics = RepoMetrics()
+    with metrics.phase("clone"):
+        pass
+    with metrics.phase("clone"):
+        pass
+    assert set(metrics.phases) == {"clone"}
+    assert metrics.phases["clone"] >= 0
+
+
+def test_metrics_from_progress():
+    metrics = RepoMetrics()
+    metrics.on_progress(parse_progress("Receiving objects:  50% (5/10), 1.00 MiB | 1.00 MiB/s"))
+    metrics.on_progress(parse_progress("Receiving objects: 100% (10/10), 2.00 MiB | 1.00 MiB/s, done."))
+    metrics.on_progress(parse_progress("Writing objects: 100% (10/10), 512.00 KiB | 1.00 MiB/s, done."))
+    assert (metrics.objects_received, metrics.bytes_received) == (10, 2 * 2**20)
+    assert (metrics.objects_sent, metrics.bytes_sent) == (10, 512 * 2**10)
+
+
+def test_metrics_add_up_the_pushes_of_a_repo():
+    metrics = RepoMetrics()
+    for chunk in range(3):
+        metrics.on_progress(parse_progress("Enumerating objects: 100% (4/4), done."))
+        metrics.on_progress(parse_progress("Writing objects:  50% (2/4), 512.00 KiB | 1.00 MiB/s"))
+        metrics.on_progress(parse_progress("Writing objects: 100% (4/4), 1.00 MiB | 1.00 MiB/s, done."))
+    assert (metrics.objects_sent, metrics.bytes_sent) == (12, 3 * 2**20)
+    # The counters of a transfer still running are not in the report
+    assert "_before" not in asdict(metrics)
+
+
+def _report():
+    report = RunReport()
+    for index, status in enumerate([STATUS_SUCCESS, STATUS_SUCCESS, STATUS_FAILED, STATUS_SKIPPED]):
+        report.add(RepoMetrics(src_project="p", src_repo=f"r{index}", status=status,
+                               phases={"clone": float(index + 1)}, bytes_received=2**20))
+    return report
+
+
+def test_summary_aggregates():
+    summary = _report().summary()
+    assert summary["repos"] == {STATUS_SUCCESS: 2, STATUS_FAILED: 1, STATUS_SKIPPED: 1}
+    assert summary["phases"]["clone"]["count"] == 4
+    assert summary["phases"]["clone"]["p50"] == 2.0
+    assert summary["phases"]["clone"]["p95"] == 4.0
+    assert summary["phases"]["push"]["count"] == 0
+    assert summary["bytes_received"] == 4 * 2**20
+
+
+def test_write_jsonl(tmp_path):
+    path = tmp_path / "reports" / "run.jsonl"
+    _report().write_jsonl(str(path))
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line["type"] for line in lines] == ["repo"] * 4 + ["summary"]
+    assert lines[0]["src_repo"] == "r0"
+
+
+def test_write_prometheus(tmp_path):
+    path = tmp_path / "vecto.prom"
+    _report().write_prometheus(str(path))
+    content = path.read_text()
+    assert 'vecto_repos{status="success"} 2' in content
+    assert 'vecto_phase_duration_seconds{phase="clone",quantile="0.95"} 4.000000' in content
+    assert 'vecto_transfer_bytes{direction="received"} 4194304' in content
+    assert not list(tmp_path.glob(".*.tmp"))
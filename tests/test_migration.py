@@ -0,0 +1,179 @@
+import json
+import pytest
+import yaml
+from conftest import git
+from migration.cache import MirrorCache
+from migration.main import migration
+from utils.config import from_dict
+
+
+def _setup(tmp_path, monkeypatch, local_config, migration_config=None, count=3, dest_config=None):
+    config = local_config([f"repo{number}" for number in range(count)], migration_config, dest_config=dest_config)
+    (tmp_path / "config.yml").write_text(yaml.dump(config))
+    monkeypatch.chdir(tmp_path)
+    return tmp_path / "src", tmp_path / "dest"
+
+
+def _assert_migrated(src_root, dest_root, count=3):
+    for number in range(count):
+        src = src_root / "proj" / f"repo{number}.git"
+        dest = dest_root / "dest" / f"repo{number}.git"
+        assert git("--git-dir", str(dest), "show-ref") == git("--git-dir", str(src), "show-ref")
+
+
+@pytest.mark.parametrize("migration_config", [
+    {},
+    {"concurrency": 3, "max_per_src_host": 2},
+    {"stages": {"create": 1, "clone": 2, "push": 2, "queue_depth": 1}},
+    {"concurrency": 2, "cache_dir": "mirrors", "cache_max_gb": 1},
+    {"concurrency": 3, "disk_budget_gb": 0.000001},
+    {"schedule": "largest_first", "size_probe": True},
+])
+def test_migration_local_to_local(tmp_path, monkeypatch, local_config, migration_config):
+    src_root, dest_root = _setup(tmp_path, monkeypatch, local_config, migration_config)
+    assert migration() is True
+    _assert_migrated(src_root, dest_root)
+
+
+def test_migration_throttled_destination(tmp_path, monkeypatch, local_config):
+    src_root, dest_root = _setup(tmp_path, monkeypatch, local_config, count=1,
+                                 dest_config={"latency_ms": 10, "bandwidth_mbps": 100})
+    assert migration() is True
+    _assert_migrated(src_root, dest_root, count=1)
+
+
+def test_migration_resume_skips_unchanged(tmp_path, monkeypatch, local_config, capsys):
+    src_root, dest_root = _setup(tmp_path, monkeypatch, local_config,
+                                 {"report": {"jsonl": "run.jsonl"}})
+    assert migration() is True
+    capsys.readouterr()
+
+    assert migration(resume=True) is True
+    assert capsys.readouterr().out.count("UP-TO-DATE") == 3
+    summary = json.loads((tmp_path / "run.jsonl").read_text().splitlines()[-1])
+    assert summary["repos"]["skipped"] == 3
+
+
+def test_migration_invalid_entry_fails_run(tmp_path, monkeypatch, local_config):
+    src_root, dest_root = _setup(tmp_path, monkeypatch, local_config, count=1)
+    repo_map = json.loads((tmp_path / "repos_map.json").read_text())
+    repo_map.append({"src_repo": "missing-project"})
+    (tmp_path / "repos_map.json").write_text(json.dumps(repo_map))
+
+    assert migration() is False
+    _assert_migrated(src_root, dest_root, count=1)
+
+
+def test_migration_starts_largest_repos_first(tmp_path, monkeypatch, local_config):
+    src_root, dest_root = _setup(tmp_path, monkeypatch, local_config,
+                                 {"schedule": "largest_first", "report": {"jsonl": "run.jsonl"}})
+    repo_map = json.loads((tmp_path / "repos_map.json").read_text())
+    for entry, size in zip(repo_map, (1, 10 * 2**30, 2**20)):
+        entry["size"] = size
+    (tmp_path / "repos_map.json").write_text(json.dumps(repo_map))
+
+    assert migration() is True
+    lines = [json.loads(line) for line in (tmp_path / "run.jsonl").read_text().splitlines()[:-1]]
+    assert [line["src_repo"] for line in lines] == ["repo1", "repo2", "repo0"]
+
+
+def test_migration_jsonl_map_fails_duplicate_targets_up_front(tmp_path, monkeypatch, local_config, capsys):
+    src_root, dest_root = _setup(tmp_path, monkeypatch, local_config, {"concurrency": 2})
+    repo_map = json.loads((tmp_path / "repos_map.json").read_text())
+    repo_map.append({**repo_map[0], "src_repo": "repo2"})
+    (tmp_path / "repos_map.jsonl").write_text("".join(json.dumps(entry) + "\n" for entry in repo_map))
+    config = yaml.safe_load((tmp_path / "config.yml").read_text())
+    config["repos"]["map"] = "repos_map.jsonl"
+    (tmp_path / "config.yml").write_text(yaml.dump(config))
+
+    assert migration() is False
+    output = capsys.readouterr().out
+    assert "Invalid repo map entry #4: destination 'repo0' (Project: dest) is already the target of entry #1." in output
+    assert output.index("Invalid repo map entry #4") < output.index("--- Migrating")
+    _assert_migrated(src_root, dest_root)
+
+
+def test_migration_with_loaded_config_does_not_read_config_file(tmp_path, monkeypatch, local_config):
+    src_root, dest_root = _setup(tmp_path, monkeypatch, local_config)
+    loaded = from_dict(yaml.safe_load((tmp_path / "config.yml").read_text()))
+    (tmp_path / "config.yml").unlink()
+
+    assert migration(loaded) is True
+    _assert_migrated(src_root, dest_root)
+
+
+def test_migration_rerun_skips_creating_cached_repos(tmp_path, monkeypatch, local_config):
+    src_root, dest_root = _setup(tmp_path, monkeypatch, local_config)
+    config = yaml.safe_load((tmp_path / "config.yml").read_text())
+    config["api_cache"] = {"path": str(tmp_path / "api-cache.db")}
+    assert migration(from_dict(config)) is True
+
+    created = []
+    monkeypatch.setattr("utils.vcs.local.LocalVCS.create_repo", lambda self, repo, project: created.append(repo))
+    assert migration(from_dict(config)) is True
+    assert created == []
+    _assert_migrated(src_root, dest_root)
+
+
+def test_migration_cleans_up_when_interrupted(tmp_path, monkeypatch, local_config):
+    _setup(tmp_path, monkeypatch, local_config, {"work_dir": str(tmp_path / "tmp")})
+    config = yaml.safe_load((tmp_path / "config.yml").read_text())
+    config["api_cache"] = {"path": str(tmp_path / "api-cache.db")}
+    closed = []
+    monkeypatch.setattr("migration.state.StateStore.close", lambda self: closed.append("state"))
+    monkeypatch.setattr("utils.vcs.api_cache.ApiCache.close", lambda self: closed.append("api_cache"))
+
+    def interrupt(run, job):
+        raise KeyboardInterrupt
+    monkeypatch.setattr("migration.main._migrate_repo", interrupt)
+
+    with pytest.raises(KeyboardInterrupt):
+        migration(from_dict(config))
+    assert list((tmp_path / "tmp").iterdir()) == []
+    assert sorted(closed) == ["api_cache", "state"]
+
+
+def test_migration_releases_the_resources_when_setup_fails(tmp_path, monkeypatch, local_config):
+    # The mirror cache root is a file, the run fails after the state, ssh and LFS setup
+    (tmp_path / "not-a-dir").write_text("")
+    _setup(tmp_path, monkeypatch, local_config, {"cache_dir": str(tmp_path / "not-a-dir"), "ssh": {}, "lfs": {}})
+    config = yaml.safe_load((tmp_path / "config.yml").read_text())
+    config["api_cache"] = {"path": str(tmp_path / "api-cache.db")}
+    closed = []
+    for name, target in [("state", "migration.state.StateStore"), ("api_cache", "utils.vcs.api_cache.ApiCache"),
+                         ("ssh", "migration.ssh.SSHMultiplexer"), ("lfs", "migration.lfs.LfsTransfer")]:
+        monkeypatch.setattr(f"{target}.close", lambda self, name=name: closed.append(name))
+
+    with pytest.raises(OSError):
+        migration(from_dict(config))
+    assert sorted(closed) == ["api_cache", "lfs", "ssh", "state"]
+
+
+def test_migration_evicts_the_mirror_cache_as_repos_finish(tmp_path, monkeypatch, local_config):
+    src_root, dest_root = _setup(tmp_path, monkeypatch, local_config,
+                                 {"cache_dir": "mirrors", "cache_max_gb": 0.000001})
+    evict = MirrorCache.evict
+    calls = []
+
+    def recording_evict(self, log=print):
+        calls.append(len(evict(self, log)))
+        return calls[-1]
+    monkeypatch.setattr(MirrorCache, "evict", recording_evict)
+
+    assert migration() is True
+    _assert_migrated(src_root, dest_root)
+    # Every repo evicts its mirror once released, then the end of the run finds nothing left
+    assert calls == [1, 1, 1, 0]
+    assert list((tmp_path / "mirrors").glob("*.git")) == []
+
+
+def test_migration_keeps_the_map_order_without_probing_by_default(tmp_path, monkeypatch, local_config):
+    _setup(tmp_path, monkeypatch, local_config, {"report": {"jsonl": "run.jsonl"}})
+
+    probed = []
+    monkeypatch.setattr("utils.vcs.local.LocalVCS.get_inventory", lambda self, project: probed.append(project) or [])
+
+    assert migration() is True
+    assert probed == []
+    lines = [json.loads(line) for line in (tmp_path / "run.jsonl").read_text().splitlines()[:-1]]
+    assert [line["src_repo"] for line in lines] == ["repo0", "repo1", "repo2"]
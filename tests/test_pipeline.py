@@ -0,0 +1,121 @@
+import threading
+import time
+from migration.pipeline import Stage, run_pipeline
+
+
+def _collect():
+    results = {}
+    lock = threading.Lock()
+
+    def finish(item, error):
+        with lock:
+            assert item not in results
+            results[item] = error
+    return results, finish
+
+
+def test_every_item_goes_through_all_stages():
+    seen = []
+    lock = threading.Lock()
+
+    def record(name):
+        def func(item):
+            with lock:
+                seen.append((name, item))
+            return True
+        return func
+
+    results, finish = _collect()
+    stages = [Stage("a", record("a"), 2), Stage("b", record("b"), 3)]
+    run_pipeline(range(10), stages, queue_depth=1, finish=finish)
+
+    assert results == {item: None for item in range(10)}
+    assert sorted(seen) == sorted([(name, item) for name in "ab" for item in range(10)])
+
+
+def test_failed_and_finished_items_skip_later_stages():
+    later = []
+
+    def first(item):
+        if item == 1:
+            raise RuntimeError("boom")
+        return item != 2
+
+    results, finish = _collect()
+    stages = [Stage("first", first), Stage("second", lambda item: later.append(item) or True)]
+    run_pipeline([0, 1, 2], stages, queue_depth=1, finish=finish)
+
+    assert later == [0]
+    assert results[0] is None and results[2] is None
+    assert str(results[1]) == "boom"
+
+
+def test_stages_overlap():
+    # The first stage of item N+1 runs while the second stage works on item N
+    running = set()
+    overlaps = []
+    lock = threading.Lock()
+
+    def stage(name):
+        def func(item):
+            with lock:
+                running.add(name)
+                if len(running) == 2:
+                    overlaps.append(item)
+            time.sleep(0.02)
+            with lock:
+                running.discard(name)
+            return True
+        return func
+
+    results, finish = _collect()
+    run_pipeline(range(4), [Stage("clone", stage("clone")), Stage("push", stage("push"))], 1, finish)
+
+    assert len(results) == 4
+    assert overlaps
+
+
+def test_queue_depth_bounds_items_in_flight():
+    in_flight = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def produce(item):
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        return True
+
+    def consume(item):
+        nonlocal in_flight
+        time.sleep(0.01)
+        with lock:
+            in_flight -= 1
+        return True
+
+    results, finish = _collect()
+    run_pipeline(range(10), [Stage("produce", produce), Stage("consume", consume)], 1, finish)
+
+    # one item in the consumer, one waiting in the queue and one blocked in the producer
+    assert peak <= 3
+    assert len(results) == 10
+
+
+def test_failing_finish_does_not_stop_the_stage():
+    finished = []
+
+    def finish(item, error):
+        if item % 3 == 0:
+            raise RuntimeError("state store locked")
+        finished.append(item)
+
+    errors = []
+    runner = threading.Thread(target=lambda: errors.extend(
+        run_pipeline(range(10), [Stage("a", lambda item: True, 1)], queue_depth=1, finish=finish)), daemon=True)
+    runner.start()
+    runner.join(timeout=10)
+
+    assert not runner.is_alive()
+    assert sorted(finished) == [1, 2, 4, 5, 7, 8]
+    assert [(item, str(error)) for item, error in errors] == [(item, "state store locked") for item in (0, 3, 6, 9)]
@@ -0,0 +1,120 @@
+import dataclasses
+from conftest import git
+import migration.plan as plan_module
+from migration.main import migration
+from migration.plan import PLAN_DIVERGENT, PLAN_ERROR, PLAN_FAST_FORWARD, PLAN_NEW, PLAN_UP_TO_DATE, classify, \
+    parse_ls_remote, plan
+from utils.config import from_dict
+from utils.repo_map import read_repo_map
+from utils.shell import CommandError
+
+
+def _commit(work, message):
+    (work / "file.txt").write_text(f"{message}\n")
+    git("-c", "user.name=t", "-c", "user.email=t@t", "commit", "-q", "-am", message, cwd=work)
+
+
+def _plan(tmp_path, config):
+    result = plan(config, plan_file=str(tmp_path / "plan.jsonl"), work_list=str(tmp_path / "work.jsonl"))
+    plans = {line["src_repo"]: line for line in read_repo_map(tmp_path / "plan.jsonl")}
+    return result, plans, list(read_repo_map(tmp_path / "work.jsonl"))
+
+
+def test_parse_ls_remote_skips_head_and_peeled_tags():
+    output = "a1\tHEAD\na1\trefs/heads/main\nb2\trefs/tags/v1\na1\trefs/tags/v1^{}\n"
+    assert parse_ls_remote(output) == {"refs/heads/main": "a1", "refs/tags/v1": "b2"}
+
+
+def test_plan_classifies_repos_and_writes_work_list(tmp_path, local_config):
+    config = from_dict(local_config())
+
+    result, plans, work = _plan(tmp_path, config)
+    assert result is True
+    assert {repo: line["status"] for repo, line in plans.items()} == dict.fromkeys(plans, PLAN_NEW)
+    assert len(work) == 3
+
+    assert migration(config) is True
+    result, plans, work = _plan(tmp_path, config)
+    assert {line["status"] for line in plans.values()} == {PLAN_UP_TO_DATE}
+    assert work == []
+
+    # repo0 gets a new commit, repo1 loses its tag, repo2 is untouched
+    work_dir = tmp_path / "work" / "proj" / "repo0"
+    _commit(work_dir, "new")
+    git("push", "-q", str(tmp_path / "src" / "proj" / "repo0.git"), "main", cwd=work_dir)
+    git("--git-dir", str(tmp_path / "src" / "proj" / "repo1.git"), "tag", "-d", "v1")
+
+    result, plans, work = _plan(tmp_path, config)
+    assert plans["repo0"]["status"] == PLAN_FAST_FORWARD
+    assert plans["repo0"]["updated_refs"] == ["refs/heads/main"]
+    assert plans["repo1"]["status"] == PLAN_DIVERGENT
+    assert plans["repo1"]["deleted_refs"] == ["refs/tags/v1"]
+    assert plans["repo2"]["status"] == PLAN_UP_TO_DATE
+    assert sorted(entry["src_repo"] for entry in work) == ["repo0", "repo1"]
+
+    # The work list is a map of its own
+    assert migration(dataclasses.replace(config, repos_map=str(tmp_path / "work.jsonl"))) is True
+    result, plans, work = _plan(tmp_path, config)
+    assert {line["status"] for line in plans.values()} == {PLAN_UP_TO_DATE}
+
+
+def test_plan_reports_invalid_entries(tmp_path, local_config):
+    config = from_dict(local_config(["repo0"], extra_entries=[{"src_repo": "missing-fields"}]))
+
+    result, plans, work = _plan(tmp_path, config)
+    assert result is False
+    assert plans["missing-fields"]["status"] == "invalid"
+    assert [entry["src_repo"] for entry in work] == ["repo0"]
+
+
+def test_plan_reports_unreachable_destination_as_error(tmp_path, local_config, monkeypatch):
+    config = from_dict(local_config(["repo0", "repo1"]))
+    real_list_refs = plan_module.list_refs
+
+    def list_refs(url, *args):
+        if url.endswith("repo1.git"):
+            raise CommandError("Listing refs.", ["git", "ls-remote", url], 128,
+                               "fatal: unable to access 'https://dest/': Could not resolve host: dest")
+        return real_list_refs(url, *args)
+
+    monkeypatch.setattr(plan_module, "list_refs", list_refs)
+    result, plans, work = _plan(tmp_path, config)
+    assert result is False
+    # repo0 is missing at the destination, repo1 may well be there
+    assert plans["repo0"]["status"] == PLAN_NEW
+    assert plans["repo1"]["status"] == PLAN_ERROR
+    assert "Could not resolve host" in plans["repo1"]["error"]
+    assert [entry["src_repo"] for entry in work] == ["repo0"]
+
+
+def test_classify_checks_ancestry_in_mirror(tmp_path, make_bare_repo):
+    bare = make_bare_repo(tmp_path / "src", "proj", "repo", commits=3)
+    work_dir = tmp_path / "work" / "proj" / "repo"
+    dest_refs = parse_ls_remote(git("ls-remote", str(bare)))
+
+    _commit(work_dir, "fast-forward")
+    git("push", "-q", str(bare), "main", cwd=work_dir)
+    mirror = tmp_path / "mirror.git"
+    git("clone", "-q", "--mirror", str(bare), str(mirror))
+    src_refs = parse_ls_remote(git("ls-remote", str(bare)))
+
+    fast_forward = classify({}, src_refs, dest_refs, size=10**9, mirror=mirror)
+    assert fast_forward.status == PLAN_FAST_FORWARD
+    assert fast_forward.exact is True
+    assert 0 < fast_forward.estimated_bytes < 10**9
+
+    # Rewrite main on top of its first commit
+    git("reset", "-q", "--hard", "HEAD~3", cwd=work_dir)
+    _commit(work_dir, "rewritten")
+    git("push", "-q", "--force", str(bare), "main", cwd=work_dir)
+    git("--git-dir", str(mirror), "fetch", "-q", "--prune", str(bare), "+refs/*:refs/*")
+    src_refs = parse_ls_remote(git("ls-remote", str(bare)))
+
+    divergent = classify({}, src_refs, dest_refs, size=10**9, mirror=mirror)
+    assert divergent.status == PLAN_DIVERGENT
+    assert divergent.exact is True
+
+    # Without the objects, the repo size is the bound and the ancestry is unknown
+    unverified = classify({}, src_refs, dest_refs, size=10**9)
+    assert unverified.status == PLAN_FAST_FORWARD
+    assert (unverified.estimated_bytes, unverified.exact) == (10**9, False)
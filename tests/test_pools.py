@@ -0,0 +1,78 @@
+import os
+import pytest
+from conftest import git
+import migration.cache as cache
+import migration.main as main
+from migration.main import migration
+from migration.pools import ObjectPools
+from utils.config import from_dict
+
+
+def _entry(name, **fields):
+    return {"src_repo": name, "src_project": "proj", "dest_repo": name, "dest_project": "dest", **fields}
+
+
+def test_assign_groups_forks(tmp_path):
+    pools = ObjectPools(str(tmp_path / "pools"))
+    assert pools.assign(_entry("app"), "a1\trefs/heads/main\nb2\trefs/tags/v1\n") == "proj/app"
+    # Shares the tag of app
+    assert pools.assign(_entry("app-copy"), "c3\trefs/heads/main\nb2\trefs/tags/v1\n") == "proj/app"
+    # Shares only the branch of the copy, still the same history
+    assert pools.assign(_entry("app-copy2"), "c3\trefs/heads/main\n") == "proj/app"
+    assert pools.assign(_entry("other"), "d4\trefs/heads/main\n") == "proj/other"
+    assert pools.assign(_entry("fork", parent="org/upstream"), "e5\trefs/heads/main\n") == "org/upstream"
+    assert pools.path("proj/app") != pools.path("proj/other")
+
+
+def _own_objects(mirror):
+    counts = dict(line.split(": ") for line in git("--git-dir", str(mirror), "count-objects", "-v").splitlines())
+    return int(counts["count"]) + int(counts["in-pack"])
+
+
+@pytest.mark.parametrize("cached", [False, True])
+def test_forks_download_the_shared_objects_once(tmp_path, monkeypatch, local_config, cached):
+    # An upstream repo with some history and two forks adding a commit each
+    work = tmp_path / "work" / "upstream"
+    git("init", "-q", "-b", "main", str(work))
+    for number in range(5):
+        (work / f"blob{number}").write_bytes(os.urandom(16 * 1024))
+        git("add", ".", cwd=work)
+        git("-c", "user.name=t", "-c", "user.email=t@t", "commit", "-q", "-m", f"commit {number}", cwd=work)
+    git("tag", "v1", cwd=work)
+    src_root = tmp_path / "src" / "proj"
+    git("clone", "-q", "--bare", str(work), str(src_root / "upstream.git"))
+    for fork in ("fork1", "fork2"):
+        git("clone", "-q", "--bare", str(work), str(src_root / f"{fork}.git"))
+        fork_work = tmp_path / "work" / fork
+        git("clone", "-q", str(src_root / f"{fork}.git"), str(fork_work))
+        (fork_work / "change").write_text(fork)
+        git("add", ".", cwd=fork_work)
+        git("-c", "user.name=t", "-c", "user.email=t@t", "commit", "-q", "-m", fork, cwd=fork_work)
+        git("push", "-q", "origin", "main", cwd=fork_work)
+
+    config = from_dict(local_config(
+        ["upstream", "fork1", "fork2"],
+        {"concurrency": 3, "schedule": "map", "pools": {"dir": str(tmp_path / "pools")},
+         **({"cache_dir": str(tmp_path / "cache")} if cached else {})},
+        repos=False))
+    # Objects of every fresh mirror before it borrows them from the pool
+    real_fetch, fetched = main.fetch_mirror, {}
+
+    def counting_fetch(src_url, path, *args, **kwargs):
+        real_fetch(src_url, path, *args, **kwargs)
+        fetched[path.name] = _own_objects(path)
+
+    monkeypatch.setattr(main, "fetch_mirror", counting_fetch)
+    monkeypatch.setattr(cache, "fetch_mirror", counting_fetch)
+    assert migration(config) is True
+
+    # The shared history (5 commits, trees and blobs) is downloaded once, whichever repo comes first,
+    # then every fork only adds its own commit. On their own, the three clones take 15 + 18 + 18 objects
+    assert sum(fetched.values()) == 15 + 3 + 3
+    assert len(list((tmp_path / "pools").glob("*.git"))) == 1
+
+    for name in ("upstream", "fork1", "fork2"):
+        dest = tmp_path / "dest" / "dest" / f"{name}.git"
+        assert git("--git-dir", str(dest), "show-ref") == git("--git-dir", str(src_root / f"{name}.git"), "show-ref")
+        git("--git-dir", str(dest), "fsck", "--no-dangling")
+        assert not (dest / "objects" / "info" / "alternates").exists()
@@ -0,0 +1,122 @@
+import threading
+import pytest
+import requests
+from utils.vcs.ratelimit import RequestScheduler, TokenBucket, quota, retry_after
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeSession(requests.Session):
+    '''Session answering the queued (status, headers) pairs instead of sending requests.'''
+    def __init__(self, answers):
+        super().__init__()
+        self.answers = list(answers)
+        self.sent = 0
+        self._lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        with self._lock:
+            self.sent += 1
+            answer = self.answers.pop(0) if self.answers else (200, {})
+        if isinstance(answer, Exception):
+            raise answer
+        response = requests.Response()
+        response.status_code, headers = answer
+        response.headers.update(headers)
+        response._content = b"{}"
+        return response
+
+
+def _scheduler(**kwargs):
+    clock = FakeClock()
+    return RequestScheduler(sleep=clock.sleep, clock=clock, **kwargs), clock
+
+
+def test_token_bucket_spaces_requests_after_burst():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, burst=2, clock=clock)
+    assert [bucket.reserve() for _ in range(4)] == [0, 0, 0.5, 1.0]
+
+
+def test_token_bucket_follows_server_quota():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=10, burst=1, clock=clock)
+    bucket.observe(remaining=30, reset_in=60)
+    assert bucket.rate == 0.5
+    bucket.observe(remaining=0, reset_in=42)
+    assert bucket.reserve() == 42
+
+
+def test_retry_after_and_quota_headers():
+    assert retry_after({"Retry-After": "7"}) == 7
+    assert retry_after({"Retry-After": "Thu, 01 Jan 1970 00:01:40 GMT"}, now=40) == 60
+    assert retry_after({}) is None
+    assert quota({"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "130"}, now=100) == (0, 30)
+    assert quota({}) == (None, None)
+
+
+def test_retries_throttled_requests_after_retry_after():
+    scheduler, clock = _scheduler()
+    session = FakeSession([(429, {"Retry-After": "5"}), (503, {"Retry-After": "3"}), (200, {})])
+    response = scheduler.request(session, "GET", "https://api.example.com/repos")
+    assert response.status_code == 200
+    assert session.sent == 3
+    assert clock.sleeps == [5, 3]
+
+
+def test_waits_for_quota_reset_on_exhausted_primary_limit(monkeypatch):
+    monkeypatch.setattr("utils.vcs.ratelimit.time.time", lambda: 1000.0)
+    scheduler, clock = _scheduler()
+    session = FakeSession([(403, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "1060"}), (200, {})])
+    assert scheduler.request(session, "GET", "https://api.example.com/repos").status_code == 200
+    assert clock.sleeps == [60]
+
+
+def test_backoff_is_jittered_and_bounded():
+    scheduler, clock = _scheduler(backoff=1, max_backoff=4)
+    session = FakeSession([(502, {})] * 5 + [(200, {})])
+    assert scheduler.request(session, "GET", "https://api.example.com/repos").status_code == 200
+    assert len(clock.sleeps) == 5
+    assert all(0 <= delay <= min(4, 2 ** attempt) for attempt, delay in enumerate(clock.sleeps))
+
+
+def test_gives_up_after_max_retries():
+    scheduler, _ = _scheduler(max_retries=2)
+    session = FakeSession([(429, {"Retry-After": "0"})] * 5)
+    assert scheduler.request(session, "GET", "https://api.example.com/repos").status_code == 429
+    assert session.sent == 3
+
+    session = FakeSession([requests.ConnectionError("reset")] * 5)
+    with pytest.raises(requests.ConnectionError):
+        scheduler.request(session, "GET", "https://api.example.com/repos")
+    assert session.sent == 3
+
+
+def test_client_errors_are_not_retried():
+    scheduler, _ = _scheduler()
+    session = FakeSession([(404, {})])
+    assert scheduler.request(session, "GET", "https://api.example.com/repos").status_code == 404
+    assert session.sent == 1
+
+
+def test_buckets_are_per_host_and_credential():
+    scheduler, _ = _scheduler()
+    alice, bob = FakeSession([]), FakeSession([])
+    alice.headers["Authorization"] = "Bearer alice"
+    bob.headers["Authorization"] = "Bearer bob"
+    url = "https://api.example.com/repos"
+    assert scheduler.key(alice, url) != scheduler.key(bob, url)
+    assert scheduler.key(alice, url) == scheduler.key(alice, "https://API.example.com/orgs")
+    assert scheduler.key(alice, url) != scheduler.key(alice, "https://dev.azure.com/org")
+    assert "alice" not in "".join(scheduler.key(alice, url))
@@ -0,0 +1,77 @@
+import json
+from conftest import git
+from migration.main import migration
+from migration.refs import RefRules, ref_rules
+from utils.config import RefSettings, from_dict
+from utils.vcs.local import LocalVCS
+
+
+class HostedVCS(LocalVCS):
+    def hidden_refs(self):
+        return ["refs/pull/*"]
+
+
+def test_rules_match_and_refspecs():
+    rules = RefRules(["refs/heads/*", "refs/tags/*"], ["refs/heads/tmp/*"])
+    assert rules.matches("refs/heads/feature/x")
+    assert not rules.matches("refs/heads/tmp/x")
+    assert not rules.matches("refs/pull/1/head")
+    assert rules.refspecs() == ["+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*", "^refs/heads/tmp/*"]
+
+    output = "a1\tHEAD\na1\trefs/heads/main\nb2\trefs/tags/v1\na1\trefs/tags/v1^{}\nc3\trefs/pull/1/head"
+    assert rules.filter_ls_remote(output) == "a1\trefs/heads/main\nb2\trefs/tags/v1\na1\trefs/tags/v1^{}"
+
+
+def test_exclude_defaults_to_hidden_refs_of_the_vcs():
+    local, hosted = LocalVCS({"root": "."}), HostedVCS({"root": "."})
+    assert ref_rules(RefSettings(), (local, hosted)).exclude == ("refs/pull/*",)
+    assert ref_rules(RefSettings(exclude=()), (local, hosted)).exclude == ()
+    assert ref_rules(RefSettings(), (local, local)).include == ("refs/heads/*", "refs/tags/*", "refs/notes/*")
+
+
+def _config(tmp_path, make_bare_repo, refs=None, **migration_config):
+    bare = make_bare_repo(tmp_path / "src", "proj", "repo")
+    work = tmp_path / "work" / "proj" / "repo"
+    # Refs a hosted source keeps next to the history
+    git("--git-dir", str(bare), "update-ref", "refs/pull/1/head", "main")
+    git("--git-dir", str(bare), "update-ref", "refs/keep-around/abc", "main")
+    git("-c", "user.name=t", "-c", "user.email=t@t", "notes", "add", "-m", "note", cwd=work)
+    git("push", "-q", str(bare), "refs/notes/commits", cwd=work)
+    (tmp_path / "repos_map.json").write_text(json.dumps(
+        [{"src_repo": "repo", "src_project": "proj", "dest_repo": "repo", "dest_project": "dest"}]))
+    migration_config["state_file"] = str(tmp_path / "state.db")
+    if refs is not None:
+        migration_config["refs"] = refs
+    return bare, tmp_path / "dest" / "dest" / "repo.git", from_dict({
+        "src": {"vcs": "Local", "config": {"root": str(tmp_path / "src")}},
+        "dest": {"vcs": "Local", "config": {"root": str(tmp_path / "dest")}},
+        "repos": {"map": str(tmp_path / "repos_map.json")},
+        "migration": migration_config,
+    })
+
+
+def _refs(bare):
+    return sorted(line.split()[1] for line in git("--git-dir", str(bare), "show-ref").splitlines())
+
+
+def test_migration_transfers_branches_tags_and_notes_only(tmp_path, make_bare_repo):
+    src, dest, config = _config(tmp_path, make_bare_repo)
+    assert migration(config) is True
+    assert _refs(dest) == ["refs/heads/main", "refs/notes/commits", "refs/tags/v1"]
+
+    # The prune only deletes refs under the rules, a ref outside them is left alone
+    git("--git-dir", str(src), "branch", "gone", "main")
+    assert migration(config) is True
+    git("--git-dir", str(src), "branch", "-D", "gone")
+    git("--git-dir", str(dest), "update-ref", "refs/pull/9/head", "main")
+    assert migration(config) is True
+    assert _refs(dest) == ["refs/heads/main", "refs/notes/commits", "refs/pull/9/head", "refs/tags/v1"]
+
+
+def test_migration_with_cache_excludes_refs(tmp_path, make_bare_repo):
+    src, dest, config = _config(tmp_path, make_bare_repo, {"include": ["refs/*"], "exclude": ["refs/pull/*"]},
+                                cache_dir=str(tmp_path / "mirrors"))
+    assert migration(config) is True
+    assert _refs(dest) == ["refs/heads/main", "refs/keep-around/abc", "refs/notes/commits", "refs/tags/v1"]
+    mirror = next((tmp_path / "mirrors").glob("*.git"))
+    assert "refs/pull/1/head" not in _refs(mirror)
@@ -0,0 +1,118 @@
+import json
+import pytest
+from conftest import git
+from utils.config import RepoFilter, from_dict
+from utils.mapper import generate_repo_map, repo_selector
+from utils.repo_map import read_repo_map, validate_repo_map, write_repo_map
+from utils.vcs.base import RepoInfo
+
+
+def _entry(number, dest_repo=None):
+    return {"src_repo": f"repo{number}", "src_project": "proj",
+            "dest_repo": dest_repo or f"repo{number}", "dest_project": "dest"}
+
+
+@pytest.mark.parametrize("name", ["map.json", "map.jsonl"])
+def test_write_and_read_round_trip(tmp_path, name):
+    entries = [_entry(number) for number in range(5)]
+    path = tmp_path / name
+    assert write_repo_map(path, (entry for entry in entries)) == 5
+    assert list(read_repo_map(path)) == entries
+
+
+def test_jsonl_map_is_one_entry_per_line_and_streamed(tmp_path):
+    path = tmp_path / "map.jsonl"
+    path.write_text(json.dumps(_entry(0)) + "\n\n" + json.dumps(_entry(1)) + "\n{broken\n")
+
+    entries = read_repo_map(path)
+    assert next(entries) == _entry(0)
+    assert next(entries) == _entry(1)
+    with pytest.raises(Exception, match="map.jsonl:4: invalid JSON"):
+        next(entries)
+
+
+@pytest.mark.parametrize("content, message", [
+    ('{"src_repo": "a"}', "must be a list"),
+    ('["a"]', "entry 1 is not an object"),
+])
+def test_read_json_map_rejects_bad_structure(tmp_path, content, message):
+    path = tmp_path / "map.json"
+    path.write_text(content)
+    with pytest.raises(Exception, match=message):
+        list(read_repo_map(path))
+
+
+def test_validate_reports_missing_fields_and_duplicate_targets():
+    entries = [_entry(0), {"src_repo": "x", "dest_repo": "y"}, _entry(2), _entry(3, dest_repo="repo0")]
+    count, problems = validate_repo_map(iter(entries))
+    assert count == 4
+    assert problems == {
+        1: "missing src_project, dest_project",
+        3: "destination 'repo0' (Project: dest) is already the target of entry #1",
+    }
+
+
+def test_generate_jsonl_repo_map(tmp_path, make_bare_repo):
+    make_bare_repo(tmp_path / "src", "proj", "alpha")
+    make_bare_repo(tmp_path / "src", "proj", "beta")
+    config = from_dict({
+        "src": {"vcs": "Local", "config": {"root": str(tmp_path / "src")}, "get_inventory": True},
+        "dest": {"vcs": "Local", "config": {"root": str(tmp_path / "dest")}},
+        "repos": {"map": str(tmp_path / "maps" / "repos_map.jsonl")},
+    })
+    generate_repo_map(config, "proj")
+
+    lines = (tmp_path / "maps" / "repos_map.jsonl").read_text().splitlines()
+    entries = [json.loads(line) for line in lines]
+    assert [entry["src_repo"] for entry in entries] == ["alpha", "beta"]
+    assert all(entry["size"] > 0 for entry in entries)
+
+
+def _map_config(tmp_path, map_name="repos_map.jsonl", **repos):
+    return from_dict({
+        "src": {"vcs": "Local", "config": {"root": str(tmp_path / "src")}, "get_inventory": True},
+        "dest": {"vcs": "Local", "config": {"root": str(tmp_path / "dest")}},
+        "repos": {"map": str(tmp_path / map_name), **repos},
+    })
+
+
+def _generated(tmp_path, map_name="repos_map.jsonl"):
+    return [(entry["src_project"], entry["src_repo"], entry["dest_project"])
+            for entry in read_repo_map(tmp_path / map_name)]
+
+
+@pytest.fixture
+def multi_project_source(tmp_path, make_bare_repo):
+    for project, names in (("alpha", ["api", "web", "legacy-tool"]), ("beta", ["api", "docs"])):
+        for name in names:
+            make_bare_repo(tmp_path / "src", project, name)
+    (tmp_path / "src" / "gamma").mkdir()
+    git("init", "-q", "--bare", str(tmp_path / "src" / "gamma" / "empty.git"))
+
+
+def test_generate_map_of_several_projects(tmp_path, multi_project_source):
+    generate_repo_map(_map_config(tmp_path, inventory_workers=2), ["alpha", "beta", "missing"])
+    assert _generated(tmp_path) == [
+        ("alpha", "api", "alpha"), ("alpha", "legacy-tool", "alpha"), ("alpha", "web", "alpha"),
+        ("beta", "api", "beta"), ("beta", "docs", "beta"),
+    ]
+
+
+def test_generate_map_of_all_projects_with_rules(tmp_path, multi_project_source, capsys):
+    config = _map_config(tmp_path, include=["*", "gamma/*"], exclude=["re:^legacy-", "beta/docs"], skip_empty=True)
+    generate_repo_map(config, None)
+    assert _generated(tmp_path) == [("alpha", "api", "alpha"), ("alpha", "web", "alpha"), ("beta", "api", "beta")]
+    output = capsys.readouterr().out
+    assert "Discovered 3 projects in Local." in output
+    assert "in project 'gamma' (1 skipped by the repos rules)." in output
+
+
+def test_repo_selector_rules():
+    select = repo_selector(RepoFilter(include=("svc-*", "re:^lib"), exclude=("*-old",), skip_forks=True,
+                                      skip_disabled=True))
+    assert select(RepoInfo("svc-api", "proj")) is None
+    assert select(RepoInfo("libcore", "proj")) is None
+    assert select(RepoInfo("web", "proj")) == "not included"
+    assert select(RepoInfo("svc-api-old", "proj")) == "excluded"
+    assert select(RepoInfo("svc-fork", "proj", is_fork=True)) == "fork"
+    assert select(RepoInfo("svc-off", "proj", is_disabled=True)) == "disabled"
@@ -0,0 +1,82 @@
+import threading
+import time
+import pytest
+from migration.scheduling import DiskBudget, estimate_sizes, largest_first
+from utils.vcs.base import RepoInfo
+
+
+class InventoryVCS:
+    def __init__(self, inventories):
+        self.inventories = inventories
+        self.calls = []
+
+    def get_inventory(self, project):
+        self.calls.append(project)
+        if project not in self.inventories:
+            raise Exception("unknown project")
+        return self.inventories[project]
+
+
+def _entry(repo, project="proj", **extra):
+    return {"src_repo": repo, "src_project": project, "dest_repo": repo, "dest_project": "dest", **extra}
+
+
+def test_estimate_sizes_prefers_map_and_probes_each_project_once():
+    repo_map = [_entry("a", size=10), _entry("b"), _entry("c"),
+                _entry("x", project="other"), _entry("y", project="gone")]
+    vcs = InventoryVCS({
+        "proj": [RepoInfo("a", "proj", size=999), RepoInfo("b", "proj", size=20), RepoInfo("c", "proj")],
+        "other": [RepoInfo("x", "other", size=5)],
+    })
+    warnings = []
+    sizes = estimate_sizes(repo_map, vcs, log=warnings.append)
+    assert sizes == {("proj", "a"): 10, ("proj", "b"): 20, ("other", "x"): 5}
+    assert sorted(vcs.calls) == ["gone", "other", "proj"]
+    assert len(warnings) == 1 and "gone" in warnings[0]
+    assert estimate_sizes(repo_map) == {("proj", "a"): 10}
+
+
+def test_largest_first_puts_unknown_sizes_last_in_map_order():
+    repo_map = [_entry("small"), _entry("unknown1"), _entry("big"), _entry("unknown2"), _entry("medium")]
+    sizes = {("proj", "small"): 1, ("proj", "big"): 100, ("proj", "medium"): 10}
+    assert [entry["src_repo"] for entry in largest_first(repo_map, sizes)] == \
+        ["big", "medium", "small", "unknown1", "unknown2"]
+
+
+def test_disk_budget_admits_clones_that_fit():
+    budget = DiskBudget(100)
+    admitted = threading.Event()
+
+    def clone():
+        with budget.reserve(50):
+            admitted.set()
+
+    with budget.reserve(60):
+        thread = threading.Thread(target=clone)
+        thread.start()
+        assert not admitted.wait(0.2)
+        assert budget.reserved == 60
+    thread.join(5)
+    assert admitted.is_set()
+    assert budget.reserved == 0
+
+
+def test_disk_budget_admits_oversized_repo_alone_and_unknown_sizes():
+    budget = DiskBudget(100)
+    with budget.reserve(500):
+        assert budget.reserved == 500
+        with budget.reserve(None):
+            pass
+    assert budget.reserved == 0
+
+
+def test_disk_budget_wait_is_cancellable():
+    budget = DiskBudget(100)
+    cancel = threading.Event()
+    with budget.reserve(80):
+        cancel.set()
+        started = time.monotonic()
+        with pytest.raises(Exception, match="Cancelled"):
+            with budget.reserve(80, cancel):
+                pass
+        assert time.monotonic() - started < 2
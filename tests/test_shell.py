@@ -0,0 +1,146 @@
+import os
+import sys
+import threading
+import time
+import pytest
+from utils.shell import CommandError, ProgressReporter, RingBuffer, parse_progress, redact, run, run_command
+
+
+def _python(code):
+    return [sys.executable, "-c", code]
+
+
+def test_parse_progress_with_size_and_rate():
+    event = parse_progress("Receiving objects:  45% (4500/10000), 12.00 MiB | 3.00 MiB/s")
+    assert event.phase == "Receiving objects"
+    assert (event.percent, event.current, event.total) == (45, 4500, 10000)
+    assert event.bytes == 12 * 2**20
+    assert event.rate == 3 * 2**20
+
+
+def test_parse_progress_remote_counting():
+    event = parse_progress("remote: Counting objects: 100% (10/10), done.")
+    assert event.phase == "Counting objects"
+    assert event.bytes is None and event.rate is None
+
+
+def test_parse_progress_ignores_other_lines():
+    assert parse_progress("To https://github.com/o/r.git") is None
+
+
+def test_ring_buffer_keeps_tail():
+    buffer = RingBuffer(8)
+    buffer.write(b"0123456789")
+    buffer.write(b"ab")
+    assert buffer.text() == "456789ab"
+
+
+def test_redact_hides_pat():
+    assert redact("https://s3cret@dev.azure.com/o") == "https://***@dev.azure.com/o"
+
+
+def test_run_returns_stdout():
+    assert run(_python("print('hello')"), "hello", log=lambda *_: None) == "hello\n"
+
+
+def test_run_feeds_stdin():
+    lines = "".join(f"{number}\n" for number in range(100000))
+    stdout = run(_python("import sys; print(sum(map(int, sys.stdin)))"), "sum", log=lambda *_: None, stdin=lines)
+    assert stdout == f"{sum(range(100000))}\n"
+
+
+def test_run_cancel_kills_command_blocked_on_stdin():
+    # The command never reads its input, the feeder stays blocked on the full pipe until the kill
+    cancel = threading.Event()
+    threading.Timer(0.3, cancel.set).start()
+    with pytest.raises(CommandError) as error:
+        run(_python("import time; time.sleep(30)"), "sleep", log=lambda *_: None, cancel=cancel, stdin="x" * 2**20)
+    assert error.value.reason == "cancelled"
+
+
+def test_run_command_splits_without_shell():
+    assert run_command("echo '$HOME'", "echo", log=lambda *_: None) == "$HOME\n"
+
+
+def test_run_failure_reports_stderr_tail():
+    code = "import sys; sys.stderr.write('x' * 5000 + 'the end'); sys.exit(3)"
+    with pytest.raises(CommandError) as error:
+        run(_python(code), "failing", log=lambda *_: None, tail_bytes=100)
+    assert error.value.returncode == 3
+    assert len(error.value.output) == 100
+    assert error.value.output.endswith("the end")
+
+
+def test_run_streams_progress_events():
+    code = ("import sys, time\n"
+            "for i in (1, 50, 100):\n"
+            "    sys.stderr.write(f'Receiving objects: {i}% ({i}/100), 1.00 KiB | 1.00 KiB/s\\r')\n"
+            "    sys.stderr.flush()\n"
+            "sys.stderr.write('\\n')\n")
+    events = []
+    run(_python(code), "progress", log=lambda *_: None, on_progress=events.append)
+    assert [event.percent for event in events] == [1, 50, 100]
+
+
+def test_run_timeout_kills_command():
+    started = time.monotonic()
+    with pytest.raises(CommandError) as error:
+        run(_python("import time; time.sleep(30)"), "sleep", log=lambda *_: None, timeout=0.5)
+    assert "timed out" in str(error.value)
+    assert time.monotonic() - started < 10
+
+
+def _alive(pid):
+    # An orphan killed but not reaped yet is a zombie, dead all the same
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] not in ("Z", "X")
+    except FileNotFoundError:
+        return False
+    except OSError:
+        pass
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    return True
+
+
+def test_run_timeout_kills_helper_processes(tmp_path):
+    # The helper keeps the pipes of the command open, like git-remote-https or an ext:: proxy
+    pid_file = tmp_path / "helper.pid"
+    code = ("import subprocess, sys, time\n"
+            "helper = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(30)'])\n"
+            f"open({str(pid_file)!r}, 'w').write(str(helper.pid))\n"
+            "time.sleep(30)\n")
+    started = time.monotonic()
+    with pytest.raises(CommandError):
+        run(_python(code), "helper", log=lambda *_: None, timeout=1)
+    assert time.monotonic() - started < 10
+    assert not _alive(int(pid_file.read_text()))
+
+
+def test_run_cancel_kills_command():
+    cancel = threading.Event()
+    threading.Timer(0.3, cancel.set).start()
+    with pytest.raises(CommandError) as error:
+        run(_python("import time; time.sleep(30)"), "sleep", log=lambda *_: None, cancel=cancel)
+    assert error.value.reason == "cancelled"
+
+
+def test_run_skips_command_once_cancelled(tmp_path):
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(CommandError) as error:
+        run(_python(f"open({str(tmp_path / 'ran')!r}, 'w')"), "touch", log=lambda *_: None, cancel=cancel)
+    assert error.value.reason == "cancelled"
+    assert not (tmp_path / "ran").exists()
+
+
+def test_progress_reporter_throttles_same_phase():
+    lines = []
+    reporter = ProgressReporter("[repo] ", interval=60, log=lines.append)
+    for percent in (1, 2, 3):
+        reporter(parse_progress(f"Receiving objects: {percent}% ({percent}/100)"))
+    reporter(parse_progress("Resolving deltas: 1% (1/100)"))
+    assert lines == ["[repo] Receiving objects: 1% (1/100)", "[repo] Resolving deltas: 1% (1/100)"]
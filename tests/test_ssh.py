@@ -0,0 +1,115 @@
+import json
+import sys
+from contextlib import ExitStack
+from conftest import git
+from migration.main import migration
+from migration.ssh import SSHMultiplexer, is_ssh_url
+from utils.config import from_dict
+
+# Stands in for ssh: records its arguments, answers the control commands and runs the
+# remote command locally
+FAKE_SSH = '''
+import json, subprocess, sys
+args = sys.argv[1:]
+with open({calls!r}, "a") as f:
+    f.write(json.dumps(args) + "\\n")
+if "-G" in args:
+    sys.exit(1)
+if "-O" in args:
+    sys.exit({control_status})
+rest = list(args)
+while rest and rest[0].startswith("-"):
+    option = rest.pop(0)
+    if option in ("-o", "-p"):
+        rest.pop(0)
+sys.exit(subprocess.call(" ".join(rest[1:]), shell=True))
+'''
+
+
+def _fake_ssh(tmp_path, control_status=0):
+    calls = tmp_path / "ssh-calls.jsonl"
+    script = tmp_path / "fake_ssh.py"
+    script.write_text(FAKE_SSH.format(calls=str(calls), control_status=control_status))
+    return f"{sys.executable} {script}", calls
+
+
+def _calls(calls):
+    return [json.loads(line) for line in calls.read_text().splitlines()] if calls.exists() else []
+
+
+def test_is_ssh_url():
+    assert is_ssh_url("git@ssh.dev.azure.com:v3/org/project/repo")
+    assert is_ssh_url("ssh://git@github.com/org/repo.git")
+    assert not is_ssh_url("https://dev.azure.com/org/project/_git/repo")
+    assert not is_ssh_url("file:///srv/repos/repo.git")
+    assert not is_ssh_url("/srv/repos/repo.git")
+    assert not is_ssh_url("ext::python throttle.py %S /srv/repo.git 0 0")
+
+
+def test_session_shares_masters_up_to_max_sessions(tmp_path):
+    pool = SSHMultiplexer(max_sessions=2, control_dir=str(tmp_path / "control"))
+    with ExitStack() as stack:
+        envs = [stack.enter_context(pool.session("git@github.com:org/repo.git")) for _ in range(3)]
+        other = stack.enter_context(pool.session("ssh://deploy@github.com/org/repo.git"))
+        assert stack.enter_context(pool.session("https://github.com/org/repo.git")) == {}
+
+    commands = [env["GIT_SSH_COMMAND"] for env in envs]
+    assert "ControlMaster=auto" in commands[0] and "ControlPersist=60" in commands[0]
+    assert commands[0] == commands[1] != commands[2]
+    # Another user never rides the connection of the first one
+    assert other["GIT_SSH_COMMAND"] not in commands
+
+    with pool.session("git@github.com:org/repo.git") as env:
+        assert env["GIT_SSH_COMMAND"] == commands[0]
+
+
+def test_dead_master_is_replaced_and_close_stops_masters(tmp_path):
+    command, calls = _fake_ssh(tmp_path, control_status=1)
+    pool = SSHMultiplexer(command, control_dir=str(tmp_path / "control"))
+    with pool.session("git@github.com:org/repo.git"):
+        pass
+    socket = tmp_path / "control" / "git@github.com-0"
+    socket.touch()
+
+    # The master behind the socket does not answer, its socket goes away
+    with pool.session("git@github.com:org/repo.git"):
+        assert not socket.exists()
+    assert [call[:2] for call in _calls(calls)] == [["-O", "check"]]
+
+    socket.touch()
+    pool.close()
+    assert [call[:2] for call in _calls(calls)][-1] == ["-O", "exit"]
+
+
+def test_migration_over_ssh_uses_control_socket(tmp_path, monkeypatch, make_bare_repo):
+    command, calls = _fake_ssh(tmp_path)
+    src_root = tmp_path / "src"
+    for number in range(2):
+        make_bare_repo(src_root, "proj", f"repo{number}")
+    (tmp_path / "repos_map.json").write_text(json.dumps([
+        {"src_repo": f"repo{number}", "src_project": "proj", "dest_repo": f"repo{number}", "dest_project": "dest"}
+        for number in range(2)
+    ]))
+    # The sources are reached over "ssh" to localhost
+    monkeypatch.setattr("utils.vcs.local.LocalVCS.get_clone_url",
+                        lambda self, repo, auth, project: f"git@localhost:{self._repo_path(repo, project)}"
+                        if auth == "ssh" else self._repo_path(repo, project).as_uri())
+
+    config = from_dict({
+        "src": {"vcs": "Local", "config": {"root": str(src_root)}, "auth": "ssh"},
+        "dest": {"vcs": "Local", "config": {"root": str(tmp_path / "dest")}},
+        "repos": {"map": str(tmp_path / "repos_map.json")},
+        "migration": {"state_file": str(tmp_path / "state.db"), "concurrency": 2,
+                      "ssh": {"command": command, "control_dir": str(tmp_path / "control")}},
+    })
+    assert migration(config) is True
+
+    for number in range(2):
+        src = src_root / "proj" / f"repo{number}.git"
+        dest = tmp_path / "dest" / "dest" / f"repo{number}.git"
+        assert git("--git-dir", str(dest), "show-ref") == git("--git-dir", str(src), "show-ref")
+
+    transfers = [call for call in _calls(calls) if "-O" not in call and "-G" not in call]
+    # ls-remote and clone of every repo
+    assert len(transfers) == 4
+    assert all(f"ControlPath={tmp_path / 'control'}/git@localhost-0" in call for call in transfers)
@@ -0,0 +1,47 @@
+from migration.state import StateStore, tips_hash, STATUS_FAILED, STATUS_IN_PROGRESS, STATUS_SUCCESS
+
+ENTRY = {"src_repo": "r", "src_project": "p", "dest_repo": "r", "dest_project": "q"}
+
+
+def test_tips_hash_ignores_order_and_blank_lines():
+    first = "aaa\trefs/heads/main\nbbb\trefs/tags/v1\n"
+    second = "\nbbb\trefs/tags/v1\naaa\trefs/heads/main"
+    assert tips_hash(first) == tips_hash(second)
+    assert tips_hash(first) != tips_hash("ccc\trefs/heads/main\n")
+
+
+def test_state_lifecycle(tmp_path):
+    store = StateStore(str(tmp_path / "state" / "state.db"))
+    assert store.get(ENTRY) is None
+
+    store.start(ENTRY)
+    assert store.get(ENTRY)["status"] == STATUS_IN_PROGRESS
+    assert not store.is_synced(ENTRY, "tips")
+
+    store.finish(ENTRY, "tips")
+    state = store.get(ENTRY)
+    assert state["status"] == STATUS_SUCCESS
+    assert state["finished_at"] >= state["started_at"]
+    assert store.is_synced(ENTRY, "tips")
+    assert not store.is_synced(ENTRY, "other-tips")
+
+
+def test_failure_is_never_synced(tmp_path):
+    store = StateStore(str(tmp_path / "state.db"))
+    store.finish(ENTRY, "tips", error="push rejected")
+
+    assert store.get(ENTRY)["status"] == STATUS_FAILED
+    assert store.get(ENTRY)["error"] == "push rejected"
+    assert not store.is_synced(ENTRY, "tips")
+
+
+def test_state_survives_reopen(tmp_path):
+    path = str(tmp_path / "state.db")
+    store = StateStore(path)
+    store.start(ENTRY)
+    store.finish(ENTRY, "tips")
+    store.close()
+
+    reopened = StateStore(path)
+    assert reopened.is_synced(ENTRY, "tips")
+    assert reopened.counts() == {STATUS_SUCCESS: 1}
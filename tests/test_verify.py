@@ -0,0 +1,73 @@
+from conftest import git
+from migration.main import migration
+from migration.state import STATUS_FAILED, StateStore
+from migration.verify import VERIFY_INVALID, VERIFY_MATCH, VERIFY_MISMATCH, compare_refs, is_sampled, verify
+from utils.config import from_dict
+from utils.repo_map import read_repo_map
+
+
+def _verify(tmp_path, config, sample=0.0):
+    result = verify(config, sample=sample, report=str(tmp_path / "report.jsonl"),
+                    resync=str(tmp_path / "resync.jsonl"))
+    report = {line["src_repo"]: line for line in read_repo_map(tmp_path / "report.jsonl")}
+    return result, report, list(read_repo_map(tmp_path / "resync.jsonl"))
+
+
+def test_compare_refs():
+    src = {"refs/heads/main": "a1", "refs/heads/dev": "b2", "refs/tags/v1": "c3"}
+    dest = {"refs/heads/main": "a1", "refs/heads/dev": "ff", "refs/heads/old": "d4"}
+    assert compare_refs(src, dest) == (["refs/tags/v1"], ["refs/heads/dev"], ["refs/heads/old"])
+    assert compare_refs(src, src) == ([], [], [])
+
+
+def test_is_sampled_is_stable():
+    entries = [{"src_repo": f"repo{number}", "src_project": "proj", "dest_repo": f"repo{number}",
+                "dest_project": "dest"} for number in range(200)]
+    sampled = [entry for entry in entries if is_sampled(entry, 0.25)]
+    assert 20 < len(sampled) < 80
+    assert sampled == [entry for entry in entries if is_sampled(entry, 0.25)]
+    assert all(is_sampled(entry, 1.0) for entry in entries)
+    assert not any(is_sampled(entry, 0.0) for entry in entries)
+
+
+def test_verify_after_migration_matches_with_deep_check(tmp_path, local_config):
+    config = from_dict(local_config())
+    assert migration(config) is True
+
+    result, report, resync = _verify(tmp_path, config, sample=1.0)
+    assert result is True
+    assert {line["status"] for line in report.values()} == {VERIFY_MATCH}
+    assert all(line["deep"] == {"fsck": True, "src_commits": 2, "dest_commits": 2} for line in report.values())
+    assert resync == []
+
+
+def test_verify_queues_mismatches_for_resync(tmp_path, local_config):
+    invalid = {"src_repo": "", "src_project": "proj", "dest_repo": "x", "dest_project": "dest"}
+    config = from_dict(local_config(extra_entries=[invalid]))
+    assert migration(config) is False
+
+    # repo0 gets a new commit at the source, repo1 loses its tag at the destination
+    work_dir = tmp_path / "work" / "proj" / "repo0"
+    (work_dir / "file.txt").write_text("new\n")
+    git("-c", "user.name=t", "-c", "user.email=t@t", "commit", "-q", "-am", "new", cwd=work_dir)
+    git("push", "-q", str(tmp_path / "src" / "proj" / "repo0.git"), "main", cwd=work_dir)
+    git("--git-dir", str(tmp_path / "dest" / "dest" / "repo1.git"), "tag", "-d", "v1")
+
+    result, report, resync = _verify(tmp_path, config)
+    assert result is False
+    assert report["repo0"]["status"] == VERIFY_MISMATCH
+    assert report["repo0"]["mismatched_refs"] == ["refs/heads/main"]
+    assert report["repo1"]["status"] == VERIFY_MISMATCH
+    assert report["repo1"]["missing_refs"] == ["refs/tags/v1"]
+    assert report["repo2"]["status"] == VERIFY_MATCH
+    assert report[""]["status"] == VERIFY_INVALID
+    assert [entry["src_repo"] for entry in resync] == ["repo0", "repo1"]
+
+    # The state no longer takes repo1 as in sync although its source did not change
+    state = StateStore(str(tmp_path / "state.db"))
+    assert state.get(resync[1])["status"] == STATUS_FAILED
+    state.close()
+    assert migration(config, resume=True) is False
+    result, report, resync = _verify(tmp_path, config)
+    assert {report[repo]["status"] for repo in ("repo0", "repo1", "repo2")} == {VERIFY_MATCH}
+    assert resync == []
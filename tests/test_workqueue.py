@@ -0,0 +1,94 @@
+import threading
+from conftest import git
+from migration.main import migration
+from migration.metrics import STATUS_FAILED, STATUS_SUCCESS
+from migration.workqueue import QUEUE_DONE, QUEUE_LEASED, QUEUE_PENDING, WorkQueue, coordinate, merge_report
+from utils.config import from_dict
+from utils.repo_map import read_repo_map
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _entry(name):
+    return {"src_repo": name, "src_project": "proj", "dest_repo": name, "dest_project": "dest"}
+
+
+def test_expired_leases_are_taken_over(tmp_path):
+    clock = Clock()
+    queue = WorkQueue(str(tmp_path / "queue.db"), lease_seconds=60, clock=clock)
+    assert queue.load([(_entry("a"), None), (_entry("b"), "missing dest_repo")]) == 2
+
+    first, second = queue.claim("node1"), queue.claim("node2")
+    assert (first.entry["src_repo"], second.entry["src_repo"]) == ("a", "b")
+    assert second.problem == "missing dest_repo"
+    assert queue.claim("node3") is None
+
+    # node2 keeps beating, node1 crashed
+    clock.now += 50
+    assert queue.renew("node2") == 1
+    clock.now += 20
+    taken_over = queue.claim("node3")
+    assert (taken_over.entry["src_repo"], taken_over.worker, taken_over.attempt) == ("a", "node3", 2)
+    assert queue.claim("node3") is None
+
+    assert queue.complete(first, {"status": STATUS_SUCCESS}) is False
+    assert queue.complete(taken_over, {"status": STATUS_SUCCESS}) is True
+    assert queue.counts() == {QUEUE_PENDING: 0, QUEUE_LEASED: 1, QUEUE_DONE: 1}
+    queue.close()
+
+
+def test_entry_failed_after_max_attempts(tmp_path):
+    clock = Clock()
+    queue = WorkQueue(str(tmp_path / "queue.db"), lease_seconds=60, max_attempts=2, clock=clock)
+    queue.load([(_entry("poison"), None)])
+    for worker in ("node1", "node2"):
+        assert queue.claim(worker).worker == worker
+        clock.now += 61
+
+    assert queue.claim("node3") is None
+    result, = queue.results()
+    assert (result["src_repo"], result["status"]) == ("poison", STATUS_FAILED)
+    assert "expired 2 times" in result["error"]
+    queue.close()
+
+
+def test_workers_share_the_queue_and_merge_their_report(tmp_path, local_config):
+    src_root = tmp_path / "src"
+    config = from_dict(local_config(
+        [f"repo{number}" for number in range(6)],
+        {"concurrency": 2, "report": {"jsonl": str(tmp_path / "report.jsonl")},
+         "queue": {"path": str(tmp_path / "queue.db"), "lease_seconds": 1, "poll_seconds": 0.1}},
+        extra_entries=[{**_entry("broken"), "dest_repo": ""}]))
+    assert coordinate(config) is True
+
+    # A worker that died right after leasing an entry
+    crashed = WorkQueue(str(tmp_path / "queue.db"), lease_seconds=1)
+    abandoned = crashed.claim("crashed-node").entry["src_repo"]
+    crashed.close()
+
+    results = []
+    workers = [threading.Thread(target=lambda: results.append(migration(config, worker=True))) for _ in range(2)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    # Each worker ran its own share, the broken entry failed one of them
+    assert sorted(results) == [False, True]
+
+    for number in range(6):
+        dest = tmp_path / "dest" / "dest" / f"repo{number}.git"
+        src = src_root / "proj" / f"repo{number}.git"
+        assert git("--git-dir", str(dest), "show-ref") == git("--git-dir", str(src), "show-ref")
+
+    assert merge_report(config) is False
+    lines = list(read_repo_map(tmp_path / "report.jsonl"))
+    repos = {line["src_repo"]: line["status"] for line in lines if line["type"] == "repo"}
+    assert repos == {**{f"repo{number}": STATUS_SUCCESS for number in range(6)}, "broken": STATUS_FAILED}
+    assert abandoned in repos
+    assert lines[-1]["repos"] == {STATUS_SUCCESS: 6, STATUS_FAILED: 1, "skipped": 0}
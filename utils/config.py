@@ -4,9 +4,13 @@ The supported schema for the config.yml
 src:
     vcs: 
         - Name of the source VCS. 
-        - allowed_values: AzureDevops, Github, Gitlab, Bitbucket, SVN
+        - allowed_values: AzureDevops, Github, Gitlab, Bitbucket, SVN, Local, or a backend registered with
+          VCSFactory.register or installed as an entry point of the vecto.vcs group
         config:
             - specific configuration for the vcs
+            - Local: root (directory of <project>/<repo>.git bare repos), optional latency_ms and bandwidth_mbps
+              to simulate a slow remote, optional lfs_url of an LFS server serving <lfs_url>/<project>/<repo>
+            - Github, AzureDevops: optional rate_limit (requests_per_second, burst, max_retries) of the API calls
     auth: 
         - authentication method to get the repositories from the VCS
         - allowed_values: ssh
@@ -19,7 +23,7 @@ src:
 dest:
     vcs: 
         - Name of the destination VCS. 
-        - values: AzureDevops, Github, Gitlab, Bitbucket, SVN
+        - values: AzureDevops, Github, Gitlab, Bitbucket, SVN, Local
         config:
             - specific configuration for the vcs
     auth: 
@@ -28,10 +32,263 @@ dest:
 repos:
     map: 
         - points to a file, which has the map between source and dest repos
+        - .json holds a list of entries, .jsonl one entry per line and is streamed, for very large maps
+    include / exclude:
+        - optional, rules on the repo name applied when generating the map: glob patterns (a pattern with a /
+          matches <project>/<repo>), or regular expressions prefixed with re:. Default to every repo
+    skip_forks / skip_disabled / skip_empty:
+        - leave the forks, disabled or empty repos out of the generated map. Default to False
+    inventory_workers:
+        - number of projects listed concurrently when generating the map. Default to 8
+api_cache:
+    - optional, on-disk cache of the inventories, project lists and created destination repos, shared by the runs
+    path:
+        - SQLite file of the cache. Default to .vecto/api-cache.db
+    ttl_seconds:
+        - age under which a cached result is used without any API call, older pages are revalidated with their ETag.
+          Default to 3600
+migration:
+    - optional block to tune the migration run
+    concurrency:
+        - number of repositories migrated in parallel. Default to 1
+    max_per_src_host:
+        - maximum number of parallel clones from a single source host. Default to no limit
+    max_per_dest_host:
+        - maximum number of parallel create/push against a single destination host. Default to no limit
+    cache_dir:
+        - directory of the persistent mirror cache. Later runs only fetch the deltas.
+          Default to a throwaway temp directory
+    work_dir:
+        - directory the throwaway temp directory is created in, without cache_dir. Default to the system temp directory
+    cache_max_gb:
+        - disk budget of the mirror cache, least recently used mirrors are evicted above it. Default to no limit
+    state_file:
+        - SQLite file recording the state of every migrated repository, used by --resume. Default to .vecto/state.db
+    command_timeout:
+        - seconds after which a git command gets killed. Default to no timeout
+    progress_interval:
+        - seconds between two git progress lines of the same transfer. Default to 10
+    report:
+        - optional, machine readable report of the run with per repo and per phase metrics
+        jsonl:
+            - file of the JSON lines report, one line per repo and a summary line
+        prometheus:
+            - file for the Prometheus textfile collector, e.g. /var/lib/node_exporter/vecto.prom
+    schedule:
+        - order of the repositories: largest_first (longest migrations start first) or map (order of the map file).
+          Default to map
+    size_probe:
+        - look up the size of the repos without a size field in the map in the source inventory. Default to False
+    disk_budget_gb:
+        - estimated size of the clones on disk at the same time, a clone waits until it fits. Default to no limit
+    stages:
+        - optional, runs the migration as a create -> clone -> push pipeline instead of the worker pool
+        create / clone / lfs / push:
+            - number of workers of the stage. Default to 1, lfs only runs with the lfs block
+        queue_depth:
+            - number of repos waiting in front of every stage, bounds the disk used by finished clones. Default to 1
+    refs:
+        - optional, refs transferred by the fetch and the push, as full ref names where * matches any part of the name
+        include:
+            - refs to transfer. Default to refs/heads/*, refs/tags/*, refs/notes/*
+        exclude:
+            - refs left out even when included. Default to the hidden refs of the source and destination VCS
+              (refs/pull/* for Github and AzureDevops)
+    lfs:
+        - optional, copies the Git LFS objects of the repos whose .gitattributes use LFS, between the clone and
+          the push. The LFS endpoints derive from the https clone URLs (pat auth)
+        workers:
+            - number of LFS objects transferred in parallel across the run. Default to 8
+        batch_size:
+            - number of objects per request to the LFS batch API. Default to 100
+        store_dir:
+            - directory where every object is downloaded once per run, shared by the repos using it.
+              Default to a throwaway temp directory
+    chunked_push:
+        - optional, pushes the history of the large repos in chunks, for destinations with a push size limit or timeout
+        threshold_mb:
+            - size of the local mirror above which a repo is pushed in chunks. Default to 1024
+        chunk_mb:
+            - on-disk size of the objects added by a chunk, keep it well under the push limit of the destination.
+              Default to 512
+    ssh:
+        - optional, shares OpenSSH ControlMaster connections between the git commands over ssh (auth: ssh)
+        command:
+            - ssh command the masters are started with, e.g. "ssh -i ~/.ssh/migration". Default to ssh
+        max_sessions:
+            - commands running over a single master at a time, keep it under the MaxSessions of the server. Default to 8
+        persist_seconds:
+            - seconds an idle master stays up. Default to 60
+        control_dir:
+            - directory of the control sockets, keep its path short. Default to a throwaway temp directory
+        check_interval:
+            - seconds between two health checks of a master. Default to 30
+    pools:
+        - optional, clones the forks and near-copies of a repo (parent field of the map, or a ref tip in common)
+          against a shared object pool, so their common objects are downloaded once
+        dir:
+            - directory of the object pools. Default to <cache_dir>/pools, or a throwaway temp directory
+              without cache_dir
+    queue:
+        - optional, shared work queue of a distributed run over several machines with the same config.
+          main.py --coordinator loads the map into it, main.py --worker on every machine migrates the
+          entries it leases, main.py --merge-report writes the report of all the workers
+        path:
+            - SQLite file on a volume every machine mounts. Default to .vecto/queue.db
+        lease_seconds:
+            - seconds a worker holds an entry without a heartbeat, the entries of a crashed worker are
+              leased again after it. Default to 300
+        max_attempts:
+            - number of leases of an entry before it is failed. Default to 3
+        poll_seconds:
+            - seconds an idle worker waits before looking for expired leases again. Default to 5
 '''
+import re
 import yaml
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Optional, Dict, Any
+from types import MappingProxyType
+from typing import Optional, Dict, Any, List, Mapping, Tuple
+
+
+ALLOWED_VCS = frozenset({"AzureDevops", "AzureDevOps", "Github", "Gitlab", "Bitbucket", "SVN", "Local"})
+ALLOWED_AUTH = frozenset({"ssh", "pat"})
+SCHEDULES = ("largest_first", "map")
+
+
+class ConfigError(Exception):
+    '''config.yml is missing or does not follow the schema. errors lists every problem found.'''
+    def __init__(self, errors: List[str]):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+@dataclass(frozen=True, slots=True)
+class VCSSettings:
+    '''src or dest section of the config.yml'''
+    vcs: str
+    config: Mapping[str, Any] = field(default_factory=lambda: MappingProxyType({}))
+    auth: str = "pat"
+    pipeline: bool = False
+    get_inventory: bool = False
+
+
+@dataclass(frozen=True, slots=True)
+class StageSettings:
+    create: int = 1
+    clone: int = 1
+    lfs: int = 1
+    push: int = 1
+    queue_depth: int = 1
+
+
+@dataclass(frozen=True, slots=True)
+class ReportSettings:
+    jsonl: Optional[str] = None
+    prometheus: Optional[str] = None
+
+
+@dataclass(frozen=True, slots=True)
+class RefSettings:
+    include: Tuple[str, ...] = ("refs/heads/*", "refs/tags/*", "refs/notes/*")
+    # None uses the hidden refs of the VCS
+    exclude: Optional[Tuple[str, ...]] = None
+
+
+@dataclass(frozen=True, slots=True)
+class LfsSettings:
+    workers: int = 8
+    batch_size: int = 100
+    store_dir: Optional[str] = None
+
+
+@dataclass(frozen=True, slots=True)
+class ChunkedPushSettings:
+    threshold_mb: float = 1024.0
+    chunk_mb: float = 512.0
+
+
+@dataclass(frozen=True, slots=True)
+class SSHSettings:
+    command: str = "ssh"
+    max_sessions: int = 8
+    persist_seconds: int = 60
+    control_dir: Optional[str] = None
+    check_interval: float = 30.0
+
+
+@dataclass(frozen=True, slots=True)
+class PoolSettings:
+    dir: Optional[str] = None
+
+
+@dataclass(frozen=True, slots=True)
+class QueueSettings:
+    path: str = ".vecto/queue.db"
+    lease_seconds: float = 300.0
+    max_attempts: int = 3
+    poll_seconds: float = 5.0
+
+
+@dataclass(frozen=True, slots=True)
+class MigrationSettings:
+    '''migration section of the config.yml, with the defaults of the schema'''
+    concurrency: int = 1
+    max_per_src_host: Optional[int] = None
+    max_per_dest_host: Optional[int] = None
+    cache_dir: Optional[str] = None
+    work_dir: Optional[str] = None
+    cache_max_gb: Optional[float] = None
+    state_file: str = ".vecto/state.db"
+    command_timeout: Optional[float] = None
+    progress_interval: float = 10.0
+    report: ReportSettings = field(default_factory=ReportSettings)
+    schedule: str = "map"
+    size_probe: bool = False
+    disk_budget_gb: Optional[float] = None
+    # None runs the worker pool instead of the create -> clone -> push pipeline
+    stages: Optional[StageSettings] = None
+    # None keeps a connection per git command
+    ssh: Optional[SSHSettings] = None
+    refs: RefSettings = field(default_factory=RefSettings)
+    # None leaves the LFS objects behind
+    lfs: Optional[LfsSettings] = None
+    # None pushes every repo at once
+    chunked_push: Optional[ChunkedPushSettings] = None
+    # None when the run is not distributed
+    queue: Optional[QueueSettings] = None
+    # None clones every fork on its own
+    pools: Optional[PoolSettings] = None
+
+
+@dataclass(frozen=True, slots=True)
+class RepoFilter:
+    '''Rules of the repos section selecting the repos of a generated map'''
+    include: Tuple[str, ...] = ()
+    exclude: Tuple[str, ...] = ()
+    skip_forks: bool = False
+    skip_disabled: bool = False
+    skip_empty: bool = False
+    inventory_workers: int = 8
+
+
+@dataclass(frozen=True, slots=True)
+class ApiCacheSettings:
+    path: str = ".vecto/api-cache.db"
+    ttl_seconds: float = 3600.0
+
+
+@dataclass(frozen=True, slots=True)
+class Config:
+    '''The whole config.yml, loaded and validated once.'''
+    src: VCSSettings
+    dest: VCSSettings
+    repos_map: str
+    migration: MigrationSettings = field(default_factory=MigrationSettings)
+    repo_filter: RepoFilter = field(default_factory=RepoFilter)
+    # None disables the API cache
+    api_cache: Optional[ApiCacheSettings] = None
+    path: Optional[Path] = None
 
 
 def _get_config_path() -> Optional[Path]:
@@ -47,105 +304,278 @@ def _get_config_path() -> Optional[Path]:
     return None
 
 
-def validate() -> bool:
+def _read_raw(path: Optional[Path] = None) -> Dict[str, Any]:
     '''
-    Validate the config.yml to the schema above
+    Read the config.yml once
 
-    Input: auto find the config.yml file in the current directory or find the config.yml file to the directory it points
+    Input: the path of the file, found with _get_config_path when None
 
-    Output: True or False
+    Output: the YAML document
     '''
-    config_path = _get_config_path()
+    config_path = path or _get_config_path()
     if not config_path:
-        print("DEBUG: Validation failed at config_path not found.")
-        return False
+        raise ConfigError(["config_path not found"])
 
     try:
         with open(config_path, 'r') as f:
-            config = yaml.safe_load(f)
+            return yaml.safe_load(f)
     except Exception as e:
-        print(f"DEBUG: Validation failed at YAML loading: {e}")
-        return False
+        raise ConfigError([f"YAML loading: {e}"])
 
-    if not config or not isinstance(config, dict):
-        print("DEBUG: Validation failed at config empty or not dict.")
-        return False
 
-    allowed_vcs = {"AzureDevops", "AzureDevOps", "Github", "Gitlab", "Bitbucket", "SVN"}
-    allowed_auth = {"ssh", "pat"}
+def check(raw: Any) -> List[str]:
+    '''
+    Validate a config document to the schema above, in a single pass
 
-    # Validate src
-    src = config.get('src')
-    if not isinstance(src, dict):
-        print("DEBUG: Validation failed at src not dict.")
-        return False
-    
-    # config block is mandatory
-    src_config = src.get('config')
-    if not isinstance(src_config, dict):
-        print("DEBUG: Validation failed at src.config not dict.")
-        return False
-    
-    if src.get('vcs') not in allowed_vcs:
-        print(f"DEBUG: Validation failed at src.vcs invalid: {src.get('vcs')}.")
-        return False
+    Input: the YAML document
 
-    if 'auth' in src and src['auth'] not in allowed_auth:
-        print(f"DEBUG: Validation failed at src.auth invalid: {src.get('auth')}.")
-        return False
+    Output: every problem found, empty when the config is valid
+    '''
+    if not raw or not isinstance(raw, dict):
+        return ["config empty or not dict"]
 
-    if 'pipeline' in src and not isinstance(src['pipeline'], bool):
-        print("DEBUG: Validation failed at src.pipeline not bool.")
-        return False
+    errors = _vcs_errors('src', raw.get('src'))
+    src = raw.get('src')
+    if isinstance(src, dict):
+        if 'pipeline' in src and not isinstance(src['pipeline'], bool):
+            errors.append("src.pipeline not bool")
+        if not isinstance(src.get('get_inventory', False), bool):
+            errors.append("src.get_inventory not bool")
+    errors.extend(_vcs_errors('dest', raw.get('dest')))
 
-    get_inventory = src.get('get_inventory', False)
-    if not isinstance(get_inventory, bool): # Ensure get_inventory is boolean
-        print("DEBUG: Validation failed at src.get_inventory not bool.")
-        return False
+    repos = raw.get('repos')
+    if not isinstance(repos, dict) or 'map' not in repos or not isinstance(repos['map'], str):
+        errors.append("repos section structure or map key")
+    if isinstance(repos, dict):
+        errors.extend(f"repos.{error}" for error in _repo_filter_errors(repos))
 
-    # default_src_project_for_map is NOT mandatory
+    if 'api_cache' in raw:
+        errors.extend(_api_cache_errors(raw['api_cache']))
+
+    # The whole migration block is optional
+    if 'migration' in raw:
+        errors.extend(f"migration.{error}" for error in _migration_errors(raw['migration']))
+
+    return errors
 
-    if src.get('vcs') in ["AzureDevops", "AzureDevOps"]:
-        if not _validate_azure_config(src):
-            print("DEBUG: Validation failed at Azure specific src config.")
-            return False
 
-    # Validate dest
-    dest = config.get('dest')
-    if not isinstance(dest, dict):
-        print("DEBUG: Validation failed at dest not dict.")
+def _is_plugin_vcs(vcs: Any) -> bool:
+    """Whether vcs names a backend registered with the VCSFactory, e.g. by a third-party package."""
+    if not isinstance(vcs, str):
         return False
+    # The factory imports this module
+    from utils.vcs.factory import VCSFactory
+    return VCSFactory.is_supported(vcs)
 
+
+def _vcs_errors(section: str, settings: Any) -> List[str]:
+    '''Problems of the src or dest section.'''
+    if not isinstance(settings, dict):
+        return [f"{section} not dict"]
+
+    errors = []
     # config block is mandatory
-    dest_config = dest.get('config')
-    if not isinstance(dest_config, dict):
-        print("DEBUG: Validation failed at dest.config not dict.")
-        return False
+    conf = settings.get('config')
+    if not isinstance(conf, dict):
+        errors.append(f"{section}.config not dict")
 
-    if dest.get('vcs') not in allowed_vcs:
-        print(f"DEBUG: Validation failed at dest.vcs invalid: {dest.get('vcs')}.")
-        return False
+    vcs = settings.get('vcs')
+    if vcs not in ALLOWED_VCS and not _is_plugin_vcs(vcs):
+        errors.append(f"{section}.vcs invalid: {vcs}")
 
-    if 'auth' in dest and dest['auth'] not in allowed_auth:
-        print(f"DEBUG: Validation failed at dest.auth invalid: {dest.get('auth')}.")
+    if 'auth' in settings and settings['auth'] not in ALLOWED_AUTH:
+        errors.append(f"{section}.auth invalid: {settings['auth']}")
+
+    if isinstance(conf, dict):
+        if vcs in ("AzureDevops", "AzureDevOps") and not _validate_azure_config(settings):
+            errors.append(f"Azure specific {section} config")
+        if vcs == "Local" and not _validate_local_config(settings):
+            errors.append(f"Local specific {section} config")
+
+    # default_src_project_for_map / default_dest_project_for_map are NOT mandatory
+    return errors
+
+
+def _validate_local_config(section_config: Dict[str, Any]) -> bool:
+    """Helper to validate the Local (directory of bare repos) specific configuration."""
+    conf = section_config.get('config')
+    if not isinstance(conf.get('root'), str) or not conf['root']:
         return False
-    
-    # default_dest_project_for_map is NOT mandatory
 
-    if dest.get('vcs') in ["AzureDevops", "AzureDevOps"]:
-        if not _validate_azure_config(dest):
-            print("DEBUG: Validation failed at Azure specific dest config.")
+    for key in ('latency_ms', 'bandwidth_mbps'):
+        if key in conf and not _is_positive_number(conf[key]):
             return False
 
-    # Validate repos
-    repos = config.get('repos')
-    if not isinstance(repos, dict) or 'map' not in repos or not isinstance(repos['map'], str):
-        print("DEBUG: Validation failed at repos section structure or map key.")
+    if 'lfs_url' in conf and not isinstance(conf['lfs_url'], str):
         return False
 
     return True
 
 
+def _is_positive_int(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 1
+
+
+def _is_positive_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0
+
+
+def _migration_errors(migration: Any) -> List[str]:
+    """Helper to validate the optional migration tuning block, returns every problem found."""
+    if not isinstance(migration, dict):
+        return ["not dict"]
+
+    errors = [f"unknown key {key}" for key in migration if key not in MigrationSettings.__dataclass_fields__]
+    for key in ('concurrency', 'max_per_src_host', 'max_per_dest_host'):
+        if key in migration and not _is_positive_int(migration[key]):
+            errors.append(f"{key} not a positive integer")
+
+    stages = migration.get('stages')
+    if stages is not None:
+        if not isinstance(stages, dict):
+            errors.append("stages not dict")
+        else:
+            for key, value in stages.items():
+                if key not in StageSettings.__dataclass_fields__ or not _is_positive_int(value):
+                    errors.append(f"stages.{key} invalid: {value}")
+
+    report = migration.get('report')
+    if report is not None:
+        if not isinstance(report, dict):
+            errors.append("report not dict")
+        else:
+            for key, value in report.items():
+                if key not in ('jsonl', 'prometheus') or not isinstance(value, str):
+                    errors.append(f"report.{key} invalid: {value}")
+
+    refs = migration.get('refs')
+    if refs is not None:
+        if not isinstance(refs, dict):
+            errors.append("refs not dict")
+        else:
+            errors.extend(f"refs.unknown key {key}" for key in refs if key not in RefSettings.__dataclass_fields__)
+            for key in ('include', 'exclude'):
+                patterns = refs.get(key, [])
+                if not isinstance(patterns, list) or not all(isinstance(pattern, str) for pattern in patterns):
+                    errors.append(f"refs.{key} not a list of patterns")
+                    continue
+                # Refspec patterns: full ref names with at most one *
+                errors.extend(f"refs.{key} invalid pattern {pattern}" for pattern in patterns
+                              if not pattern.startswith("refs/") or pattern.count("*") > 1)
+
+    lfs = migration.get('lfs')
+    if lfs is not None:
+        if not isinstance(lfs, dict):
+            errors.append("lfs not dict")
+        else:
+            errors.extend(f"lfs.unknown key {key}" for key in lfs if key not in LfsSettings.__dataclass_fields__)
+            for key in ('workers', 'batch_size'):
+                if key in lfs and not _is_positive_int(lfs[key]):
+                    errors.append(f"lfs.{key} not a positive integer")
+            if 'store_dir' in lfs and not isinstance(lfs['store_dir'], str):
+                errors.append("lfs.store_dir not str")
+
+    chunked_push = migration.get('chunked_push')
+    if chunked_push is not None:
+        if not isinstance(chunked_push, dict):
+            errors.append("chunked_push not dict")
+        else:
+            for key, value in chunked_push.items():
+                if key not in ChunkedPushSettings.__dataclass_fields__ or not _is_positive_number(value):
+                    errors.append(f"chunked_push.{key} invalid: {value}")
+
+    ssh = migration.get('ssh')
+    if ssh is not None:
+        if not isinstance(ssh, dict):
+            errors.append("ssh not dict")
+        else:
+            errors.extend(f"ssh.unknown key {key}" for key in ssh if key not in SSHSettings.__dataclass_fields__)
+            for key in ('command', 'control_dir'):
+                if key in ssh and (not isinstance(ssh[key], str) or not ssh[key]):
+                    errors.append(f"ssh.{key} not str")
+            for key in ('max_sessions', 'persist_seconds'):
+                if key in ssh and not _is_positive_int(ssh[key]):
+                    errors.append(f"ssh.{key} not a positive integer")
+            if 'check_interval' in ssh and not _is_positive_number(ssh['check_interval']):
+                errors.append("ssh.check_interval not a positive number")
+
+    pools = migration.get('pools')
+    if pools is not None:
+        if not isinstance(pools, dict):
+            errors.append("pools not dict")
+        else:
+            errors.extend(f"pools.unknown key {key}" for key in pools if key not in PoolSettings.__dataclass_fields__)
+            if 'dir' in pools and (not isinstance(pools['dir'], str) or not pools['dir']):
+                errors.append("pools.dir not str")
+
+    queue = migration.get('queue')
+    if queue is not None:
+        if not isinstance(queue, dict):
+            errors.append("queue not dict")
+        else:
+            errors.extend(f"queue.unknown key {key}" for key in queue if key not in QueueSettings.__dataclass_fields__)
+            if 'path' in queue and (not isinstance(queue['path'], str) or not queue['path']):
+                errors.append("queue.path not str")
+            if 'max_attempts' in queue and not _is_positive_int(queue['max_attempts']):
+                errors.append("queue.max_attempts not a positive integer")
+            for key in ('lease_seconds', 'poll_seconds'):
+                if key in queue and not _is_positive_number(queue[key]):
+                    errors.append(f"queue.{key} not a positive number")
+
+    for key in ('cache_dir', 'work_dir', 'state_file'):
+        if key in migration and not isinstance(migration[key], str):
+            errors.append(f"{key} not str")
+
+    if migration.get('schedule', 'map') not in SCHEDULES:
+        errors.append(f"schedule invalid: {migration['schedule']}")
+
+    if 'size_probe' in migration and not isinstance(migration['size_probe'], bool):
+        errors.append("size_probe not bool")
+
+    for key in ('cache_max_gb', 'command_timeout', 'progress_interval', 'disk_budget_gb'):
+        if key in migration and not _is_positive_number(migration[key]):
+            errors.append(f"{key} not a positive number")
+
+    return errors
+
+
+def _api_cache_errors(api_cache: Any) -> List[str]:
+    """Helper to validate the optional api_cache block."""
+    if not isinstance(api_cache, dict):
+        return ["api_cache not dict"]
+    errors = [f"api_cache.unknown key {key}" for key in api_cache if key not in ApiCacheSettings.__dataclass_fields__]
+    if 'path' in api_cache and not isinstance(api_cache['path'], str):
+        errors.append("api_cache.path not str")
+    if 'ttl_seconds' in api_cache and not _is_positive_number(api_cache['ttl_seconds']):
+        errors.append("api_cache.ttl_seconds not a positive number")
+    return errors
+
+
+def _repo_filter_errors(repos: Dict[str, Any]) -> List[str]:
+    """Helper to validate the map generation rules of the repos section."""
+    errors = []
+    for key in ('include', 'exclude'):
+        patterns = repos.get(key, [])
+        if not isinstance(patterns, list) or not all(isinstance(pattern, str) for pattern in patterns):
+            errors.append(f"{key} not a list of patterns")
+            continue
+        for pattern in patterns:
+            if pattern.startswith("re:"):
+                try:
+                    re.compile(pattern[len("re:"):])
+                except re.error as e:
+                    errors.append(f"{key} invalid regular expression {pattern}: {e}")
+
+    for key in ('skip_forks', 'skip_disabled', 'skip_empty'):
+        if key in repos and not isinstance(repos[key], bool):
+            errors.append(f"{key} not bool")
+
+    if 'inventory_workers' in repos and not _is_positive_int(repos['inventory_workers']):
+        errors.append("inventory_workers not a positive integer")
+
+    return errors
+
+
 def _validate_azure_config(section_config: Dict[str, Any]) -> bool:
     """Helper to validate Azure DevOps specific configuration."""
     conf = section_config.get('config')
@@ -161,6 +591,101 @@ def _validate_azure_config(section_config: Dict[str, Any]) -> bool:
         
     return True
 
+
+def _vcs_settings(section: Dict[str, Any]) -> VCSSettings:
+    return VCSSettings(
+        vcs=section['vcs'],
+        config=MappingProxyType(dict(section['config'])),
+        auth=section.get('auth', 'pat'), # Default to pat if not specified
+        pipeline=section.get('pipeline', False),
+        get_inventory=section.get('get_inventory', False),
+    )
+
+
+def from_dict(raw: Any, path: Optional[Path] = None) -> Config:
+    '''
+    Build the Config of a config document
+
+    Input: the YAML document, and the file it comes from if any
+
+    Output: the Config. Raises ConfigError with every schema problem when it is invalid
+    '''
+    errors = check(raw)
+    if errors:
+        raise ConfigError(errors)
+
+    migration = dict(raw.get('migration') or {})
+    stages = migration.pop('stages', None)
+    report = migration.pop('report', None) or {}
+    ssh = migration.pop('ssh', None)
+    refs = migration.pop('refs', None) or {}
+    chunked_push = migration.pop('chunked_push', None)
+    lfs = migration.pop('lfs', None)
+    queue = migration.pop('queue', None)
+    pools = migration.pop('pools', None)
+    return Config(
+        src=_vcs_settings(raw['src']),
+        dest=_vcs_settings(raw['dest']),
+        repos_map=raw['repos']['map'],
+        repo_filter=RepoFilter(**{
+            key: tuple(value) if isinstance(value, list) else value
+            for key, value in raw['repos'].items() if key in RepoFilter.__dataclass_fields__
+        }),
+        migration=MigrationSettings(
+            **migration,
+            report=ReportSettings(**report),
+            stages=StageSettings(**stages) if stages is not None else None,
+            ssh=SSHSettings(**ssh) if ssh is not None else None,
+            refs=RefSettings(**{key: tuple(value) for key, value in refs.items()}),
+            chunked_push=ChunkedPushSettings(**chunked_push) if chunked_push is not None else None,
+            lfs=LfsSettings(**lfs) if lfs is not None else None,
+            queue=QueueSettings(**queue) if queue is not None else None,
+            pools=PoolSettings(**pools) if pools is not None else None,
+        ),
+        api_cache=ApiCacheSettings(**raw['api_cache']) if 'api_cache' in raw else None,
+        path=path,
+    )
+
+
+def load(path: Optional[Path] = None) -> Config:
+    '''
+    Read and validate the config.yml, once
+
+    Input: the path of the file, auto find the config.yml file in the current directory when None
+
+    Output: the Config. Raises ConfigError with every problem found
+    '''
+    config_path = path or _get_config_path()
+    return from_dict(_read_raw(config_path), config_path)
+
+
+def load_and_report(path: Optional[Path] = None) -> Optional[Config]:
+    '''
+    Load the config.yml for a command line entry point, printing every problem found
+
+    Input: the path of the file, auto find the config.yml file in the current directory when None
+
+    Output: the Config, None when it is missing or invalid
+    '''
+    try:
+        return load(path)
+    except ConfigError as e:
+        for error in e.errors:
+            print(f"DEBUG: Validation failed at {error}.")
+        return None
+
+
+def validate() -> bool:
+    '''
+    Validate the config.yml to the schema above
+
+    Input: auto find the config.yml file in the current directory or find the config.yml file to the directory it points
+
+    Output: True or False
+    '''
+    return load_and_report() is not None
+
+
 def parse() -> dict:
     '''
     Parse the config.yml file and get the values
@@ -169,18 +694,17 @@ def parse() -> dict:
 
     Output: dict of values 
     '''
-    if not validate():
+    try:
+        config = _read_raw()
+        errors = check(config)
+    except ConfigError as e:
+        errors = e.errors
+    if errors:
+        for error in errors:
+            print(f"DEBUG: Validation failed at {error}.")
         return {}
 
-    config_path = _get_config_path()
-    with open(config_path, 'r') as f:
-        config = yaml.safe_load(f) or {}
-
     # Set defaults as specified in the schema
-    if 'src' in config:
-        if 'pipeline' not in config['src']:
-            config['src']['pipeline'] = False
-        if 'get_inventory' not in config['src']:
-            config['src']['get_inventory'] = False
-
+    config['src'].setdefault('pipeline', False)
+    config['src'].setdefault('get_inventory', False)
     return config
@@ -1,61 +1,163 @@
 import yaml
-import json # Import json module
+import re
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatchcase
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Callable, Dict, Any, Iterator, List, Optional, Sequence, Tuple, Union
+from utils.config import Config, RepoFilter
+from utils.repo_map import write_repo_map
+from utils.vcs.api_cache import ApiCache
+from utils.vcs.base import BaseVCS, RepoInfo
 from utils.vcs.factory import VCSFactory
 
-def generate_repo_map(config: Dict[str, Any], src_project_for_inventory: str):
+
+def _pattern_matcher(pattern: str) -> Callable[[RepoInfo], bool]:
+    """
+    Compile an include/exclude rule of the repos section.
+
+    Args:
+        pattern (str): A glob on the repo name, or on <project>/<repo> when it has a /,
+            or a regular expression prefixed with re: searched in the repo name.
+
+    Returns:
+        Callable[[RepoInfo], bool]: Whether a repo matches the rule.
+    """
+    if pattern.startswith("re:"):
+        regex = re.compile(pattern[len("re:"):])
+        return lambda repo: regex.search(repo.name) is not None
+    if "/" in pattern:
+        return lambda repo: fnmatchcase(f"{repo.project}/{repo.name}", pattern)
+    return lambda repo: fnmatchcase(repo.name, pattern)
+
+
+def repo_selector(rules: RepoFilter) -> Callable[[RepoInfo], Optional[str]]:
+    """
+    Build the selection of the repos that become entries of a generated map.
+
+    Args:
+        rules (RepoFilter): The include/exclude rules and the skip flags.
+
+    Returns:
+        Callable[[RepoInfo], Optional[str]]: Gives the reason a repo is left out, None when it is selected.
+    """
+    include = [_pattern_matcher(pattern) for pattern in rules.include]
+    exclude = [_pattern_matcher(pattern) for pattern in rules.exclude]
+
+    def select(repo: RepoInfo) -> Optional[str]:
+        if rules.skip_forks and repo.is_fork:
+            return "fork"
+        if rules.skip_disabled and repo.is_disabled:
+            return "disabled"
+        if rules.skip_empty and repo.is_empty:
+            return "empty"
+        if include and not any(match(repo) for match in include):
+            return "not included"
+        if any(match(repo) for match in exclude):
+            return "excluded"
+        return None
+    return select
+
+
+def _inventories(src_vcs: BaseVCS, projects: List[str], workers: int) -> Iterator[Tuple[str, List[RepoInfo]]]:
+    """
+    List the inventory of the projects concurrently, yielded in project order as they complete.
+    A project whose inventory fails is reported and yields no repo.
+    """
+    def inventory(project: str) -> Tuple[str, List[RepoInfo]]:
+        try:
+            return project, src_vcs.get_inventory(project)
+        except Exception as e:
+            print(f"Error getting inventory of project '{project}' from {type(src_vcs).__name__}: {e}")
+            return project, []
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="vecto-inventory") as pool:
+        yield from pool.map(inventory, projects)
+
+
+def generate_repo_map(config: Config, src_project_for_inventory: Union[str, Sequence[str], None]):
     """
     Generates a mapping of repositories from source to destination.
     Writes the mapping to the file specified in the config.
-    The generated map uses a list of dictionaries format with src_project and dest_project.
+    The generated map uses a list of dictionaries format with src_project and dest_project,
+    or one dictionary per line when the map file ends with .jsonl.
+
+    src_project_for_inventory is a project, a list of projects, or None for every project
+    of the source. The inventories are listed concurrently and merged into a single map,
+    leaving out the repos rejected by the rules of the repos section.
     """
-    src_config = config.get('src', {})
-    repos_config = config.get('repos', {})
-    
-    map_file_path = repos_config.get('map')
-    if not map_file_path:
-        print("No repository map file specified in config.")
-        return
+    src_config = config.src
+    map_file_path = config.repos_map
+
+    if isinstance(src_project_for_inventory, str):
+        projects = [src_project_for_inventory]
+    else:
+        projects = list(src_project_for_inventory) if src_project_for_inventory is not None else None
+
+    # Use a default dest_project for initial map generation, to be edited by user.
+    # Repos of several projects keep their project, so their names cannot collide
+    default_dest_project = config.dest.config.get('default_project_for_map')
+    if not default_dest_project and projects is not None and len(projects) == 1:
+        default_dest_project = 'my-dest-project'
 
-    # Use a default dest_project for initial map generation, to be edited by user
-    default_dest_project = config.get('dest', {}).get('config', {}).get('default_project_for_map', 'my-dest-project')
+    # Reruns of the mapping are answered by the API cache while it is fresh
+    api_cache = ApiCache(config.api_cache.path, config.api_cache.ttl_seconds) if config.api_cache else None
 
-    repo_map_list: List[Dict[str, str]] = []
-    
     # Check if we should inventory the source
-    get_inventory = src_config.get('get_inventory', False)
-    
-    if get_inventory:
+    if src_config.get_inventory:
+        src_vcs = None
         try:
-            src_vcs = VCSFactory.get_vcs(src_config['vcs'], src_config.get('config', {}))
-            # Pass the project for inventory discovery
-            src_repos = src_vcs.get_inventory(src_project_for_inventory) 
-            print(f"Discovered {len(src_repos)} repositories from {src_config['vcs']} in project '{src_project_for_inventory}'.")
+            src_vcs = VCSFactory.from_settings(src_config, api_cache)
+            if projects is None:
+                projects = src_vcs.list_projects()
+                print(f"Discovered {len(projects)} projects in {src_config.vcs}.")
         except Exception as e:
-            print(f"Error getting inventory from {src_config.get('vcs')}: {e}")
-            src_repos = [] # Fallback to empty list on error
+            print(f"Error getting inventory from {src_config.vcs}: {e}")
+            projects = [] # Fallback to empty map on error
+        inventories = _inventories(src_vcs, projects, config.repo_filter.inventory_workers)
     else:
         print("Inventory discovery disabled in config. Generating empty map template.")
         # If discovery is disabled, create a template entry
-        src_repos = ["example-source-repo"] 
+        projects = projects or ["example-source-project"]
+        inventories = ((project, [RepoInfo("example-source-repo", project)]) for project in projects)
 
-    for repo in src_repos:
-        repo_map_list.append({
-            "src_repo": repo,
-            "src_project": src_project_for_inventory,
-            "dest_repo": repo, # Default to same name
-            "dest_project": default_dest_project
-        })
+    select = repo_selector(config.repo_filter)
+
+    def entries() -> Iterator[Dict[str, Any]]:
+        for project, repos in inventories:
+            skipped = 0
+            for repo in repos:
+                if select(repo):
+                    skipped += 1
+                    continue
+                entry = {
+                    "src_repo": repo.name,
+                    "src_project": project,
+                    "dest_repo": repo.name, # Default to same name
+                    "dest_project": default_dest_project or project
+                }
+                # Lets the migration schedule the largest repos first without probing the source again
+                if repo.size is not None:
+                    entry["size"] = repo.size
+                # Groups the forks into the object pool of their parent
+                if repo.parent:
+                    entry["parent"] = repo.parent
+                yield entry
+            if src_config.get_inventory:
+                print(f"Discovered {len(repos)} repositories from {src_config.vcs} in project '{project}'"
+                      f"{f' ({skipped} skipped by the repos rules)' if skipped else ''}.")
 
     # Write to file
     output_path = Path(map_file_path)
-    
+
     # Ensure directory exists
     if output_path.parent != Path('.'):
         output_path.parent.mkdir(parents=True, exist_ok=True)
 
-    with open(output_path, 'w') as f:
-        json.dump(repo_map_list, f, indent=2) # Use json.dump
-    
-    print(f"Repository mapping generated at: {output_path.resolve()}")
+    # A .jsonl map is written entry by entry, as the inventories complete
+    try:
+        count = write_repo_map(output_path, entries())
+    finally:
+        if api_cache:
+            api_cache.close()
+
+    print(f"Repository mapping of {count} repositories generated at: {output_path.resolve()}")
@@ -0,0 +1,106 @@
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Tuple
+
+
+REQUIRED_FIELDS = ("src_repo", "src_project", "dest_repo", "dest_project")
+
+
+def is_jsonl(path) -> bool:
+    """Whether the map file uses the JSON Lines format (one entry per line)."""
+    return Path(path).suffix.lower() in (".jsonl", ".ndjson")
+
+
+def read_repo_map(path) -> Iterator[Dict[str, Any]]:
+    """
+    Read the entries of a repository map.
+
+    A .jsonl map is streamed line by line, so only the current entry is held in memory.
+    A .json map is a single list and gets loaded at once.
+
+    Args:
+        path: The map file.
+
+    Returns:
+        Iterator[Dict[str, Any]]: The entries, in file order.
+
+    Raises:
+        Exception: When a line is not valid JSON or an entry is not an object.
+    """
+    if not is_jsonl(path):
+        with open(path, 'r') as f:
+            entries = json.load(f)
+        if not isinstance(entries, list):
+            raise Exception(f"{path}: the repository map must be a list of entries.")
+        for number, entry in enumerate(entries, 1):
+            if not isinstance(entry, dict):
+                raise Exception(f"{path}: entry {number} is not an object.")
+            yield entry
+        return
+
+    with open(path, 'r') as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise Exception(f"{path}:{number}: invalid JSON: {e}") from e
+            if not isinstance(entry, dict):
+                raise Exception(f"{path}:{number}: entry is not an object.")
+            yield entry
+
+
+def write_repo_map(path, entries: Iterable[Dict[str, Any]]) -> int:
+    """
+    Write the entries of a repository map. A .jsonl map is written as the entries come.
+
+    Args:
+        path: The map file.
+        entries (Iterable[Dict[str, Any]]): The entries, e.g. a generator.
+
+    Returns:
+        int: The number of entries written.
+    """
+    count = 0
+    with open(path, 'w') as f:
+        if is_jsonl(path):
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+                count += 1
+        else:
+            entries = list(entries)
+            json.dump(entries, f, indent=2)
+            count = len(entries)
+    return count
+
+
+def validate_repo_map(entries: Iterable[Dict[str, Any]]) -> Tuple[int, Dict[int, str]]:
+    """
+    Check every entry of the map in a single pass: mandatory fields, and destination
+    targets claimed by more than one entry (the later entries would overwrite the first).
+
+    Args:
+        entries (Iterable[Dict[str, Any]]): The entries of the map.
+
+    Returns:
+        Tuple[int, Dict[int, str]]: The number of entries, and the problem of the invalid entries by index.
+    """
+    problems = {}
+    # Only the destination keys are kept, not the entries
+    targets: Dict[Tuple[str, str], int] = {}
+    count = 0
+    for index, entry in enumerate(entries):
+        count += 1
+        missing = [key for key in REQUIRED_FIELDS if not entry.get(key)]
+        if missing:
+            problems[index] = f"missing {', '.join(missing)}"
+            continue
+
+        target = (entry['dest_project'], entry['dest_repo'])
+        if target in targets:
+            problems[index] = (f"destination '{target[1]}' (Project: {target[0]}) is already "
+                               f"the target of entry #{targets[target] + 1}")
+        else:
+            targets[target] = index
+    return count, problems
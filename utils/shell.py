@@ -1,40 +1,274 @@
-import subprocess
 import os
-from typing import Optional
+import re
+import shlex
+import signal
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+
+# git writes its progress to stderr, e.g.
+#   Receiving objects:  45% (4500/10000), 12.00 MiB | 3.00 MiB/s
+#   remote: Counting objects: 100% (10/10), done.
+_PROGRESS_RE = re.compile(
+    r"^(?:remote: )?(?P<phase>[A-Z][a-z]+(?: [a-z]+)*):\s+(?P<percent>\d+)% \((?P<current>\d+)/(?P<total>\d+)\)"
+    r"(?:, (?P<size>[\d.]+) (?P<size_unit>bytes|KiB|MiB|GiB))?"
+    r"(?: \| (?P<rate>[\d.]+) (?P<rate_unit>bytes|KiB|MiB|GiB)/s)?"
+)
+_UNITS = {"bytes": 1, "KiB": 2**10, "MiB": 2**20, "GiB": 2**30}
+_CREDENTIALS_RE = re.compile(r"://[^/@\s]+@")
+
+
+@dataclass
+class ProgressEvent:
+    """A git --progress line, e.g. 'Receiving objects: 45% (4500/10000), 12.00 MiB | 3.00 MiB/s'."""
+    phase: str
+    percent: int
+    current: int
+    total: int
+    bytes: Optional[int] = None
+    rate: Optional[float] = None  # bytes per second
+
+    def __str__(self) -> str:
+        text = f"{self.phase}: {self.percent}% ({self.current}/{self.total})"
+        if self.bytes is not None:
+            text += f", {self.bytes / 2**20:.2f} MiB"
+        if self.rate is not None:
+            text += f" | {self.rate / 2**20:.2f} MiB/s"
+        return text
+
+
+def parse_progress(line: str) -> Optional[ProgressEvent]:
+    """Parse a git progress line, None if the line is not a progress line."""
+    match = _PROGRESS_RE.match(line.strip())
+    if not match:
+        return None
+    size = rate = None
+    if match["size"]:
+        size = int(float(match["size"]) * _UNITS[match["size_unit"]])
+    if match["rate"]:
+        rate = float(match["rate"]) * _UNITS[match["rate_unit"]]
+    return ProgressEvent(match["phase"], int(match["percent"]), int(match["current"]), int(match["total"]), size, rate)
+
+
+class RingBuffer:
+    """Keeps only the last `size` bytes written to it."""
+    def __init__(self, size: int):
+        self.size = size
+        self._data = bytearray()
+        self._lock = threading.Lock()
+
+    def write(self, chunk: bytes):
+        with self._lock:
+            self._data += chunk
+            if len(self._data) > self.size:
+                del self._data[:len(self._data) - self.size]
+
+    def text(self) -> str:
+        with self._lock:
+            return self._data.decode("utf-8", errors="replace")
+
+
+class ProgressReporter:
+    """
+    Logs the git progress of a command at most once every `interval` seconds, and on every
+    new phase. Printed live (not through the buffered repo log) so a stalled transfer shows up
+    while it is happening.
+    """
+    def __init__(self, prefix: str, interval: float = 10.0, log=print):
+        self.prefix = prefix
+        self.interval = interval
+        self.log = log
+        self._last_phase = None
+        self._last_time = 0.0
+
+    def __call__(self, event: ProgressEvent):
+        now = time.monotonic()
+        if event.phase == self._last_phase and now - self._last_time < self.interval:
+            return
+        self._last_phase = event.phase
+        self._last_time = now
+        self.log(f"{self.prefix}{event}")
+
+
+class CommandError(Exception):
+    """Raised when a command fails, times out or gets cancelled. Carries the tail of its output."""
+    def __init__(self, description: str, argv: List[str], returncode: Optional[int], output: str, reason: str = ""):
+        self.description = description
+        self.argv = argv
+        self.returncode = returncode
+        self.output = output
+        self.reason = reason
+        super().__init__(
+            f"Error executing: {description}\n"
+            f"Command: {redact(shlex.join(argv))}\n"
+            f"Return Code: {returncode}{f' ({reason})' if reason else ''}\n"
+            f"Output (tail): {redact(output)}"
+        )
+
+
+def redact(text: str) -> str:
+    """Hide the credentials (PAT) of the URLs in text."""
+    return _CREDENTIALS_RE.sub("://***@", text)
+
+
+def _pump(stream, sink: Callable[[bytes], None]):
+    for chunk in iter(lambda: stream.read(65536), b""):
+        sink(chunk)
+    stream.close()
+
+
+def _stderr_sink(tail: RingBuffer, on_progress: Optional[Callable[[ProgressEvent], None]]):
+    # git redraws its progress lines with \r, split on both \r and \n
+    pending = bytearray()
+
+    def sink(chunk: bytes):
+        tail.write(chunk)
+        if not on_progress:
+            return
+        pending.extend(chunk)
+        *lines, rest = re.split(rb"[\r\n]", bytes(pending))
+        pending[:] = rest[-4096:]
+        for line in lines:
+            event = parse_progress(line.decode("utf-8", errors="replace"))
+            if event:
+                on_progress(event)
+    return sink
+
+
+def _feed(stream, data: bytes):
+    try:
+        stream.write(data)
+        stream.close()
+    except (BrokenPipeError, ValueError):
+        # The command exited (or got killed) without reading all of its input
+        pass
+
+
+def _kill_group(process: subprocess.Popen, grace: float = 5.0):
+    """
+    Kill the command with its helpers (git-remote-https, ssh, ext:: proxies), which hold its
+    pipes open after it exits. SIGTERM first, SIGKILL once the grace period is over.
+    """
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    try:
+        process.wait(timeout=grace)
+    except subprocess.TimeoutExpired:
+        pass
+    # The helpers outliving the command are killed as well
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    process.wait()
 
-def run_command(command: str, description: str):
+
+def run(argv: List[str], description: str, log=print, timeout: Optional[float] = None,
+        cancel: Optional[threading.Event] = None, on_progress: Optional[Callable[[ProgressEvent], None]] = None,
+        cwd: Optional[str] = None, env: Optional[dict] = None, capture_stdout: bool = True,
+        tail_bytes: int = 64 * 1024, stdin: Optional[str] = None) -> str:
     """
-    Runs a shell command and raises an exception on failure.
+    Runs a command without a shell and raises a CommandError on failure.
+
+    stderr is streamed through a ring buffer that keeps only its last `tail_bytes` for the
+    error report, and git progress lines found in it are handed to `on_progress`.
 
     Args:
-        command (str): The command to execute.
+        argv (List[str]): The command and its arguments.
         description (str): A human-readable description for logging.
-    
+        log (callable): Where to write the log lines. Defaults to print.
+        timeout (float): Seconds after which the command is killed. Defaults to no timeout.
+        cancel (threading.Event): Kills the command once set.
+        on_progress (callable): Called with every ProgressEvent parsed from stderr.
+        cwd (str): Working directory of the command.
+        env (dict): Extra environment variables of the command.
+        capture_stdout (bool): Return stdout. Otherwise stdout only goes to the ring buffer.
+        tail_bytes (int): Size of the ring buffer.
+        stdin (str): Input of the command, e.g. a list of revisions too long for argv. Defaults to no input.
+
     Returns:
         str: The stdout from the command.
     """
-    print(f"Executing: {description}...")
-    
+    log(f"Executing: {description}...")
+    if cancel is not None and cancel.is_set():
+        # e.g. the next step of a loop of commands, never started once the run is cancelled
+        raise CommandError(description, argv, None, "", "cancelled")
+
     try:
-        result = subprocess.run(
-            command, 
-            shell=True, 
-            check=True, 
-            capture_output=True, 
-            text=True
+        process = subprocess.Popen(
+            argv,
+            cwd=cwd,
+            env={**os.environ, **env} if env else None,
+            stdin=subprocess.DEVNULL if stdin is None else subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            # Own process group, the helpers of the command get killed with it
+            start_new_session=True,
         )
-        if result.stdout and len(result.stdout) < 500:
-            print(result.stdout)
-        return result.stdout
     except FileNotFoundError:
-        raise Exception(f"Command not found. Ensure the executable is in your PATH.")
-    except subprocess.CalledProcessError as e:
-        error_message = (
-            f"Error executing: {description}\n"
-            f"Command: {command}\n"
-            f"Return Code: {e.returncode}\n"
-            f"Stdout: {e.stdout}\n"
-            f"Stderr: {e.stderr}"
-        )
-        raise Exception(error_message)
+        raise Exception(f"Command not found: {argv[0]}. Ensure the executable is in your PATH.")
+
+    tail = RingBuffer(tail_bytes)
+    stdout_chunks: List[bytes] = []
+    readers = [
+        threading.Thread(target=_pump, args=(process.stdout, stdout_chunks.append if capture_stdout else tail.write),
+                         daemon=True),
+        threading.Thread(target=_pump, args=(process.stderr, _stderr_sink(tail, on_progress)), daemon=True),
+    ]
+    if stdin is not None:
+        readers.append(threading.Thread(target=_feed, args=(process.stdin, stdin.encode()), daemon=True))
+    for reader in readers:
+        reader.start()
 
+    deadline = time.monotonic() + timeout if timeout else None
+    reason = ""
+    try:
+        while True:
+            try:
+                process.wait(timeout=0.2)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+            if cancel is not None and cancel.is_set():
+                reason = "cancelled"
+            elif deadline is not None and time.monotonic() > deadline:
+                reason = f"timed out after {timeout}s"
+            if reason:
+                _kill_group(process)
+                break
+    except BaseException:
+        # e.g. KeyboardInterrupt, the new session no longer gets the terminal signals
+        _kill_group(process, grace=1.0)
+        raise
+
+    for reader in readers:
+        reader.join()
+
+    if reason or process.returncode != 0:
+        raise CommandError(description, argv, process.returncode, tail.text(), reason)
+
+    stdout = b"".join(stdout_chunks).decode("utf-8", errors="replace")
+    if stdout and len(stdout) < 500:
+        log(stdout)
+    return stdout
+
+
+def run_command(command: str, description: str, log=print):
+    """
+    Runs a command line and raises an exception on failure. Kept for the callers passing a
+    single string, the command is split into argv and never goes through a shell.
+
+    Args:
+        command (str): The command to execute.
+        description (str): A human-readable description for logging.
+        log (callable): Where to write the log lines. Defaults to print.
+
+    Returns:
+        str: The stdout from the command.
+    """
+    return run(shlex.split(command), description, log=log)
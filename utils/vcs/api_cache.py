@@ -0,0 +1,151 @@
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, List, Optional
+
+from .base import BaseVCS, RepoInfo
+
+
+DEFAULT_TTL = 3600.0
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    etag TEXT,
+    stored_at REAL NOT NULL
+)
+'''
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    etag: Optional[str]
+    stored_at: float
+
+
+class ApiCache:
+    """
+    On-disk cache of VCS API results, shared by the threads of a run and kept between runs.
+
+    Entries younger than the TTL are used without any API call. Older entries keep their
+    ETag, so the next request can be revalidated with If-None-Match instead of downloaded again.
+    """
+    def __init__(self, path: str, ttl: float = DEFAULT_TTL, clock=time.time):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def lookup(self, key: str) -> Optional[CacheEntry]:
+        """
+        Get an entry, fresh or not.
+
+        Args:
+            key (str): Key of the entry.
+
+        Returns:
+            Optional[CacheEntry]: The entry, None when missing.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT value, etag, stored_at FROM entries WHERE key = ?", (key,)).fetchone()
+        if not row:
+            return None
+        return CacheEntry(json.loads(row[0]), row[1], row[2])
+
+    def fresh(self, key: str) -> Optional[CacheEntry]:
+        """Get an entry younger than the TTL, None otherwise."""
+        entry = self.lookup(key)
+        if entry is None or self.clock() - entry.stored_at >= self.ttl:
+            return None
+        return entry
+
+    def store(self, key: str, value: Any, etag: Optional[str] = None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO entries (key, value, etag, stored_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT DO UPDATE SET value = excluded.value, etag = excluded.etag, "
+                "stored_at = excluded.stored_at",
+                (key, json.dumps(value), etag, self.clock()))
+
+    def touch(self, key: str):
+        """Restart the TTL of an entry, e.g. once the server confirmed it did not change."""
+        with self._lock:
+            self._conn.execute("UPDATE entries SET stored_at = ? WHERE key = ?", (self.clock(), key))
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+
+class CachedVCS:
+    """
+    Wraps a VCS client to answer the inventory, the project list and the existence of the
+    repos it created from the ApiCache while they are fresh. The HTTP clients also get the
+    cache, to revalidate the stale pages with their ETag.
+
+    Not a BaseVCS itself: everything it does not cache, e.g. the hooks hidden_refs or git_env
+    and the config, is looked up on the wrapped client, never on the defaults of BaseVCS.
+    """
+    def __init__(self, vcs: BaseVCS, cache: ApiCache):
+        self.vcs = vcs
+        self.cache = cache
+        vcs.api_cache = cache
+
+    def __getattr__(self, name: str):
+        # Only called for the names this class does not define
+        return getattr(self.vcs, name)
+
+    def _key(self, kind: str, *parts: str) -> str:
+        return ":".join((kind, self.vcs.cache_scope(), *parts))
+
+    def get_inventory(self, project: str) -> List[RepoInfo]:
+        key = self._key("inventory", json.dumps(project))
+        entry = self.cache.fresh(key)
+        if entry is not None:
+            return [RepoInfo(**repo) for repo in entry.value]
+        inventory = self.vcs.get_inventory(project)
+        self.cache.store(key, [asdict(repo) for repo in inventory])
+        return inventory
+
+    def list_projects(self) -> List[str]:
+        key = self._key("projects")
+        entry = self.cache.fresh(key)
+        if entry is not None:
+            return entry.value
+        projects = self.vcs.list_projects()
+        self.cache.store(key, projects)
+        return projects
+
+    def create_repo(self, repo_name: str, project: str) -> bool:
+        # A repo created (or found) by an earlier run is not created again while the entry is fresh
+        key = self._key("exists", project, repo_name)
+        if self.cache.fresh(key) is not None:
+            return True
+        try:
+            created = self.vcs.create_repo(repo_name, project)
+        except Exception:
+            self.cache.delete(key)
+            raise
+        if not created:
+            self.cache.delete(key)
+            return False
+        self.cache.store(key, True)
+        return True
+
+    def forget_repo(self, repo_name: str, project: str):
+        # The push failed, the repo may be gone: the next run creates it again
+        self.cache.delete(self._key("exists", project, repo_name))
+        self.vcs.forget_repo(repo_name, project)
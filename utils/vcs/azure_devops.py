@@ -1,22 +1,104 @@
 import os
 import requests
-from typing import List
-from .base import BaseVCS
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from urllib.parse import quote
+from .base import BaseVCS, RepoInfo
+from .http import DEFAULT_TIMEOUT, conditional_get, new_session
+from .ratelimit import DEFAULT_BURST, DEFAULT_RATE, get_scheduler
+
+
+API_VERSION = "7.1"
+
 
 class AzureDevOpsVCS(BaseVCS):
-    def get_inventory(self, project: str) -> List[str]:
-        # In a real scenario, this would use API calls to list repos within the project
-        # For now, return mock data.
-        return [f"{project}-azure-repo-1", f"{project}-azure-repo-2", f"{project}-azure-repo-3"]
+    """
+    config:
+        org_url: https://dev.azure.com/<organization>
+        inventory_workers: optional, number of projects listed concurrently. Default to 8
+        rate_limit: optional, requests_per_second (default 10), burst (default 10) and max_retries (default 6)
+            of the API calls, shared by the clients using the same host and credential
+    """
+    def __init__(self, config: dict):
+        super().__init__(config)
+        self.workers = config.get("inventory_workers", 8)
+        self.session = new_session(self.workers)
+        self.scheduler = get_scheduler()
+        self.rate_limit = config.get("rate_limit", {})
+        pat = os.environ.get("ADO_PAT", "")
+        if pat:
+            self.session.auth = ("", pat)
+
+    @property
+    def org_api_url(self) -> str:
+        return self.config["org_url"].rstrip("/")
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        return self.scheduler.request(
+            self.session, method, url,
+            rate=self.rate_limit.get("requests_per_second", DEFAULT_RATE),
+            burst=self.rate_limit.get("burst", DEFAULT_BURST),
+            max_retries=self.rate_limit.get("max_retries"),
+            timeout=DEFAULT_TIMEOUT, **kwargs)
+
+    def cache_scope(self) -> str:
+        # Another token may see other repositories
+        return f"{super().cache_scope()}-{self.scheduler.key(self.session, self.org_api_url)[1]}"
+
+    def hidden_refs(self) -> List[str]:
+        # Pull request merges (refs/pull/<id>/merge). Other internal refs are outside the default include
+        return ["refs/pull/*"]
+
+    def _get(self, url: str, params: Optional[dict] = None) -> requests.Response:
+        return conditional_get(self._request, url, {"api-version": API_VERSION, **(params or {})},
+                               self.api_cache, self.cache_scope())
+
+    def list_projects(self) -> List[str]:
+        projects = []
+        continuation_token = None
+        while True:
+            params = {"$top": 100}
+            if continuation_token:
+                params["continuationToken"] = continuation_token
+            response = self._get(f"{self.org_api_url}/_apis/projects", params)
+            projects.extend(project["name"] for project in response.json().get("value", []))
+            continuation_token = response.headers.get("x-ms-continuationtoken")
+            if not continuation_token:
+                return projects
+
+    def get_inventory(self, project: Optional[str]) -> List[RepoInfo]:
+        # No project means every project of the organization, listed concurrently
+        if project is None:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                inventories = pool.map(self.get_inventory, self.list_projects())
+                return [repo for inventory in inventories for repo in inventory]
+
+        response = self._get(f"{self.org_api_url}/{quote(project)}/_apis/git/repositories")
+        inventory = []
+        for repo in response.json().get("value", []):
+            parent = repo.get("parentRepository")
+            default_branch = repo.get("defaultBranch")
+            inventory.append(RepoInfo(
+                name=repo["name"],
+                project=project,
+                size=repo.get("size"),
+                default_branch=default_branch.removeprefix("refs/heads/") if default_branch else None,
+                is_fork=bool(repo.get("isFork")),
+                is_disabled=bool(repo.get("isDisabled")),
+                # Azure DevOps repos without a default branch have no commits
+                is_empty=not default_branch,
+                parent=f"{parent['project']['name']}/{parent['name']}" if parent and parent.get("project") else None,
+            ))
+        return inventory
 
     def get_clone_url(self, repo_name: str, auth_method: str, project: str) -> str:
         org_url = self.config["org_url"]
-        
+
         if auth_method == "ssh":
             # e.g. git@ssh.dev.azure.com:v3/{organization}/{project}/{repository}
             org_name = org_url.split('/')[-1]
             return f"git@ssh.dev.azure.com:v3/{org_name}/{project}/{repo_name}"
-        
+
         # Default to PAT (or if auth_method == "pat")
         pat = os.environ.get("ADO_PAT", "") # Get PAT from env var, default to empty string
         # e.g. https://<PAT>@dev.azure.com/{organization}/{project}/_git/{repository}
@@ -1,12 +1,32 @@
+import hashlib
+import json
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+
+@dataclass
+class RepoInfo:
+    """Metadata of a repository as reported by the inventory of its VCS."""
+    name: str
+    project: str
+    size: Optional[int] = None  # bytes
+    default_branch: Optional[str] = None
+    is_fork: bool = False
+    is_disabled: bool = False
+    is_empty: bool = False
+    parent: Optional[str] = None  # <project>/<repo> of the fork parent, when the VCS reports it
+
 
 class BaseVCS(ABC):
+    # Set by the factory when the API cache is enabled, see utils.vcs.api_cache
+    api_cache = None
+
     def __init__(self, config: dict):
         self.config = config
 
     @abstractmethod
-    def get_inventory(self, project: str) -> List[str]:
+    def get_inventory(self, project: str) -> List[RepoInfo]:
         """
         Get the list of available repositories from a specific project.
         
@@ -14,10 +34,19 @@ class BaseVCS(ABC):
             project (str): The project name to get the inventory from.
 
         Returns:
-            List[str]: A list of repository names/identifiers.
+            List[RepoInfo]: The repositories with their metadata.
         """
         pass
 
+    def list_projects(self) -> List[str]:
+        """
+        Get the projects (organizations for GitHub) whose inventory can be listed.
+
+        Returns:
+            List[str]: The project names.
+        """
+        raise NotImplementedError(f"{type(self).__name__} cannot list its projects.")
+
     @abstractmethod
     def get_clone_url(self, repo_name: str, auth_method: str, project: str) -> str:
         """
@@ -46,3 +75,60 @@ class BaseVCS(ABC):
             bool: True if successful, False otherwise.
         """
         pass
+
+    def git_env(self) -> Dict[str, str]:
+        """
+        Extra environment variables of the git commands talking to this VCS.
+
+        Returns:
+            Dict[str, str]: Environment variables, empty by default.
+        """
+        return {}
+
+    def lfs_url(self, repo_name: str, auth_method: str, project: str) -> Optional[str]:
+        """
+        Endpoint of the Git LFS API of a repository, derived from its clone URL as git-lfs does.
+
+        Args:
+            repo_name (str): The name of the repository.
+            auth_method (str): The authentication method ('ssh' or 'pat').
+            project (str): The project name of the repository.
+
+        Returns:
+            Optional[str]: e.g. https://<pat>@github.com/org/repo.git/info/lfs, None over ssh.
+        """
+        url = self.get_clone_url(repo_name, auth_method, project)
+        if not url.startswith(("https://", "http://")):
+            return None
+        return url + ("/info/lfs" if url.endswith(".git") else ".git/info/lfs")
+
+    def hidden_refs(self) -> List[str]:
+        """
+        Refs the server keeps next to the history of the repos, e.g. its pull requests, that
+        a migration leaves out by default.
+
+        Returns:
+            List[str]: Ref patterns, * matches any part of the name. Empty by default.
+        """
+        return []
+
+    def forget_repo(self, repo_name: str, project: str):
+        """
+        Called when a push to a repository failed, e.g. because it was deleted meanwhile. Does
+        nothing by default, a client that remembers the repos it created forgets this one.
+
+        Args:
+            repo_name (str): Name of the repository.
+            project (str): Project/Org of the repository.
+        """
+
+    def cache_scope(self) -> str:
+        """
+        Identity of this client in the API cache, the cached results of two clients with the
+        same scope are interchangeable.
+
+        Returns:
+            str: The class and a hash of the config.
+        """
+        config = json.dumps(dict(self.config), sort_keys=True, default=str)
+        return f"{type(self).__name__}-{hashlib.sha256(config.encode()).hexdigest()[:12]}"
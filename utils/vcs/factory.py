@@ -1,18 +1,143 @@
-from typing import Dict, Any, Type
+"""
+Registry of the VCS backends.
+
+The backends are resolved by name when first requested, so importing the factory never
+imports a backend module (and requests with it). A backend is either registered as a dotted
+path "package.module:Class", or as a class, with VCSFactory.register. Third-party packages can
+also declare their backends as entry points of the "vecto.vcs" group, e.g. in pyproject.toml:
+
+    [project.entry-points."vecto.vcs"]
+    Gitlab = "vecto_gitlab:GitlabVCS"
+
+The entry points are only looked up for a name the registry does not know.
+"""
+import importlib
+import threading
+from importlib.metadata import entry_points
+from typing import Any, Dict, List, Optional, Type, Union
+
+from utils.config import VCSSettings
+from .api_cache import ApiCache, CachedVCS
 from .base import BaseVCS
-from .azure_devops import AzureDevOpsVCS
-from .github import GitHubVCS
+
+
+ENTRY_POINT_GROUP = "vecto.vcs"
+
+
+def _load(path: str) -> Type[BaseVCS]:
+    """
+    Import the class of a dotted path.
+
+    Args:
+        path (str): "package.module:Class".
+
+    Returns:
+        Type[BaseVCS]: The class.
+    """
+    module_name, _, class_name = path.partition(":")
+    if not class_name:
+        raise ValueError(f"Invalid VCS backend path: {path}. Expected 'package.module:Class'.")
+    vcs_class = getattr(importlib.import_module(module_name), class_name)
+    if not (isinstance(vcs_class, type) and issubclass(vcs_class, BaseVCS)):
+        raise ValueError(f"VCS backend {path} is not a BaseVCS subclass.")
+    return vcs_class
+
 
 class VCSFactory:
-    _registry = {
-        "AzureDevOps": AzureDevOpsVCS,
-        "AzureDevops": AzureDevOpsVCS,
-        "Github": GitHubVCS,
+    # Name to dotted path, replaced by the class once imported
+    _registry: Dict[str, Union[str, Type[BaseVCS]]] = {
+        "AzureDevOps": "utils.vcs.azure_devops:AzureDevOpsVCS",
+        "AzureDevops": "utils.vcs.azure_devops:AzureDevOpsVCS",
+        "Github": "utils.vcs.github:GitHubVCS",
+        "Local": "utils.vcs.local:LocalVCS",
     }
+    _lock = threading.Lock()
+
+    @staticmethod
+    def register(name: str, backend: Union[str, Type[BaseVCS]]):
+        """
+        Register a backend under a name, replacing the backend of that name if any.
+
+        Args:
+            name (str): Name of the VCS in the config, e.g. Gitlab.
+            backend (Union[str, Type[BaseVCS]]): The class, or its dotted path "package.module:Class"
+                imported on first use.
+        """
+        with VCSFactory._lock:
+            VCSFactory._registry[name] = backend
+
+    @staticmethod
+    def _entry_points() -> Dict[str, Any]:
+        return {entry_point.name: entry_point for entry_point in entry_points(group=ENTRY_POINT_GROUP)}
+
+    @staticmethod
+    def names() -> List[str]:
+        """
+        Returns:
+            List[str]: The names of the registered backends and of the installed entry points.
+        """
+        with VCSFactory._lock:
+            names = set(VCSFactory._registry)
+        return sorted(names | set(VCSFactory._entry_points()))
+
+    @staticmethod
+    def is_supported(name: str) -> bool:
+        """Whether a backend of that name is registered or installed, without importing it."""
+        with VCSFactory._lock:
+            if name in VCSFactory._registry:
+                return True
+        return name in VCSFactory._entry_points()
+
+    @staticmethod
+    def resolve(name: str) -> Optional[Type[BaseVCS]]:
+        """
+        Find the backend class of a name, importing its module on first use.
+
+        Args:
+            name (str): Name of the VCS in the config.
+
+        Returns:
+            Optional[Type[BaseVCS]]: The class, None when no backend has that name.
+        """
+        with VCSFactory._lock:
+            backend = VCSFactory._registry.get(name)
+            if isinstance(backend, type):
+                return backend
+        if backend is None:
+            entry_point = VCSFactory._entry_points().get(name)
+            if entry_point is None:
+                return None
+            vcs_class = entry_point.load()
+            if not (isinstance(vcs_class, type) and issubclass(vcs_class, BaseVCS)):
+                raise ValueError(f"VCS backend {entry_point.value} is not a BaseVCS subclass.")
+        else:
+            vcs_class = _load(backend)
+        with VCSFactory._lock:
+            # Another thread may have registered a class meanwhile, keep the first one
+            current = VCSFactory._registry.get(name)
+            if isinstance(current, type):
+                return current
+            VCSFactory._registry[name] = vcs_class
+        return vcs_class
 
     @staticmethod
     def get_vcs(name: str, config: Dict[str, Any] = {}) -> BaseVCS:
-        vcs_class = VCSFactory._registry.get(name)
+        vcs_class = VCSFactory.resolve(name)
         if not vcs_class:
-            raise ValueError(f"Unsupported VCS: {name}. Supported: {list(VCSFactory._registry.keys())}")
+            raise ValueError(f"Unsupported VCS: {name}. Supported: {VCSFactory.names()}")
         return vcs_class(config)
+
+    @staticmethod
+    def from_settings(settings: VCSSettings, api_cache: Optional[ApiCache] = None) -> BaseVCS:
+        """
+        Instantiate the VCS of the src or dest section of a loaded Config.
+
+        Args:
+            settings (VCSSettings): The section.
+            api_cache (Optional[ApiCache]): Cache of the API results, None to always call the API.
+
+        Returns:
+            BaseVCS: The VCS client, behind a CachedVCS with the same methods when api_cache is given.
+        """
+        vcs = VCSFactory.get_vcs(settings.vcs, settings.config)
+        return CachedVCS(vcs, api_cache) if api_cache else vcs
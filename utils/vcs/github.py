@@ -1,28 +1,153 @@
 import os
 import requests
-from typing import List
-from .base import BaseVCS
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from urllib.parse import parse_qs, urlencode, urlparse, urlunparse
+from .base import BaseVCS, RepoInfo
+from .http import DEFAULT_TIMEOUT, conditional_get, new_session, parse_link_header
+from .ratelimit import DEFAULT_BURST, DEFAULT_RATE, get_scheduler
+
+
+DEFAULT_API_URL = "https://api.github.com"
+
 
 class GitHubVCS(BaseVCS):
-    def get_inventory(self, project: str) -> List[str]:
-        # For GitHub, 'project' is often the organization name
-        # In a real scenario, this would use API calls to list repos within the organization/user.
-        return [f"{project}-gh-repo-1", f"{project}-gh-repo-2"]
+    """
+    config:
+        api_url: optional, REST API of GitHub (Enterprise). Default to https://api.github.com. The clone URLs
+            use its host, github.com for api.github.com
+        inventory_workers: optional, number of pages fetched concurrently. Default to 8
+        orgs: optional, organizations returned by list_projects instead of the ones of the token
+        rate_limit: optional, requests_per_second (default 10), burst (default 10) and max_retries (default 6)
+            of the API calls, shared by the clients using the same host and credential
+    """
+    def __init__(self, config: dict):
+        super().__init__(config)
+        self.api_url = config.get("api_url", DEFAULT_API_URL).rstrip("/")
+        # GitHub Enterprise serves git and its API (https://<host>/api/v3) from the same host
+        api_host = urlparse(self.api_url).netloc
+        self.host = "github.com" if api_host == urlparse(DEFAULT_API_URL).netloc else api_host
+        self.workers = config.get("inventory_workers", 8)
+        self.session = new_session(self.workers)
+        self.scheduler = get_scheduler()
+        self.rate_limit = config.get("rate_limit", {})
+        self.session.headers.update({
+            "Accept": "application/vnd.github+json",
+            "X-GitHub-Api-Version": "2022-11-28",
+        })
+        token = os.environ.get("GITHUB_TOKEN", "")
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        return self.scheduler.request(
+            self.session, method, url,
+            rate=self.rate_limit.get("requests_per_second", DEFAULT_RATE),
+            burst=self.rate_limit.get("burst", DEFAULT_BURST),
+            max_retries=self.rate_limit.get("max_retries"),
+            timeout=DEFAULT_TIMEOUT, **kwargs)
+
+    def cache_scope(self) -> str:
+        # Another token may see other repositories
+        return f"{super().cache_scope()}-{self.scheduler.key(self.session, self.api_url)[1]}"
+
+    def hidden_refs(self) -> List[str]:
+        # Read-only pull request heads and merges, any push to them is rejected
+        return ["refs/pull/*"]
+
+    def _get(self, url: str, params: Optional[dict] = None) -> requests.Response:
+        return conditional_get(self._request, url, params, self.api_cache, self.cache_scope())
+
+    @staticmethod
+    def _page_url(url: str, page: int) -> str:
+        parsed = urlparse(url)
+        query = parse_qs(parsed.query)
+        query["page"] = [str(page)]
+        return urlunparse(parsed._replace(query=urlencode(query, doseq=True)))
+
+    def _get_all_pages(self, url: str, params: dict) -> list:
+        """
+        Fetch every page of a list endpoint. When the first page links the last one, the
+        remaining pages are fetched concurrently, otherwise the next links are followed.
+        """
+        first = self._get(url, params)
+        items = first.json()
+        links = parse_link_header(first.headers.get("Link"))
+
+        if "last" in links:
+            last_page = int(parse_qs(urlparse(links["last"]).query)["page"][0])
+            page_urls = [self._page_url(links["last"], page) for page in range(2, last_page + 1)]
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for page in pool.map(lambda page_url: self._get(page_url).json(), page_urls):
+                    items.extend(page)
+            return items
+
+        next_url = links.get("next")
+        while next_url:
+            response = self._get(next_url)
+            items.extend(response.json())
+            next_url = parse_link_header(response.headers.get("Link")).get("next")
+        return items
+
+    def get_inventory(self, project: str) -> List[RepoInfo]:
+        # For GitHub, 'project' is the organization (or user) name
+        params = {"per_page": 100, "type": "all"}
+        try:
+            repos = self._get_all_pages(f"{self.api_url}/orgs/{project}/repos", params)
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code != 404:
+                raise
+            repos = self._get_all_pages(f"{self.api_url}/users/{project}/repos", params)
+
+        # The list endpoints do not name the parent of a fork, only the repo endpoint does
+        forks = [repo.get("full_name") or f"{project}/{repo['name']}" for repo in repos if repo.get("fork")]
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            parents = dict(zip(forks, pool.map(self._fork_parent, forks)))
+
+        return [
+            RepoInfo(
+                name=repo["name"],
+                project=project,
+                size=repo.get("size", 0) * 1024,  # GitHub reports KB
+                default_branch=repo.get("default_branch"),
+                is_fork=bool(repo.get("fork")),
+                is_disabled=bool(repo.get("disabled")),
+                is_empty=repo.get("size", 0) == 0,
+                parent=parents.get(repo.get("full_name") or f"{project}/{repo['name']}"),
+            )
+            for repo in repos
+        ]
+
+    def _fork_parent(self, full_name: str) -> Optional[str]:
+        """<owner>/<repo> of the parent of a fork, None when the fork is gone meanwhile."""
+        try:
+            repo = self._get(f"{self.api_url}/repos/{full_name}").json()
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code != 404:
+                raise
+            return None
+        return (repo.get("parent") or {}).get("full_name")
+
+    def list_projects(self) -> List[str]:
+        if self.config.get("orgs"):
+            return list(self.config["orgs"])
+        orgs = self._get_all_pages(f"{self.api_url}/user/orgs", {"per_page": 100})
+        return [org["login"] for org in orgs]
 
     def get_clone_url(self, repo_name: str, auth_method: str, project: str) -> str:
         # For GitHub, 'project' is the organization or user name
-        org_or_user = project 
+        org_or_user = project
         if auth_method == "ssh":
-            return f"git@github.com:{org_or_user}/{repo_name}.git"
-        
+            return f"git@{self.host}:{org_or_user}/{repo_name}.git"
+
         # Default to PAT (or if auth_method == "pat")
         pat = os.environ.get("GITHUB_TOKEN", "") # Get PAT from env var, default to empty string
         # If PAT is empty, git will prompt for credentials.
         if pat:
-            return f"https://{pat}@github.com/{org_or_user}/{repo_name}.git"
+            return f"https://{pat}@{self.host}/{org_or_user}/{repo_name}.git"
         else:
-            return f"https://github.com/{org_or_user}/{repo_name}.git"
+            return f"https://{self.host}/{org_or_user}/{repo_name}.git"
 
     def create_repo(self, repo_name: str, project: str) -> bool:
         print(f"SIMULATING: Creating GitHub repo '{repo_name}' in project/org '{project}'.")
-        return True
\ No newline at end of file
+        return True
@@ -0,0 +1,87 @@
+import re
+from typing import Callable, Dict, Optional
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+DEFAULT_TIMEOUT = 30
+_LINK_RE = re.compile(r'<(?P<url>[^>]+)>;\s*rel="(?P<rel>[^"]+)"')
+
+
+def new_session(pool_size: int = 16) -> requests.Session:
+    """
+    Create an HTTP session with a pool of keep-alive connections per host, shared by the
+    concurrent page fetches of the VCS clients.
+
+    Args:
+        pool_size (int): Maximum number of connections kept open per host.
+
+    Returns:
+        requests.Session: The session.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def parse_link_header(value: str) -> Dict[str, str]:
+    """
+    Parse an RFC 8288 Link header as sent by the GitHub API.
+
+    Args:
+        value (str): e.g. '<https://api.github.com/...&page=2>; rel="next", <...&page=5>; rel="last"'
+
+    Returns:
+        Dict[str, str]: URL by relation, e.g. {"next": "...", "last": "..."}.
+    """
+    return {match["rel"]: match["url"] for match in _LINK_RE.finditer(value or "")}
+
+
+# Headers the clients read besides the body, kept with the cached pages
+_CACHED_HEADERS = ("Link", "x-ms-continuationtoken")
+
+
+def conditional_get(request: Callable[..., requests.Response], url: str, params: Optional[dict],
+                    cache, scope: str) -> requests.Response:
+    """
+    GET through the API cache: a page stored with an ETag is revalidated with If-None-Match,
+    and a 304 Not Modified answer (free on the GitHub rate limit) is served from the cache.
+
+    Args:
+        request (Callable): Sends the request, e.g. through the rate limit scheduler.
+        url (str): URL of the page.
+        params (Optional[dict]): Query parameters.
+        cache (Optional[ApiCache]): The cache, None to always download.
+        scope (str): Cache scope of the client, see BaseVCS.cache_scope.
+
+    Returns:
+        requests.Response: The successful response. Raises requests.HTTPError otherwise.
+    """
+    if cache is None:
+        response = request("GET", url, params=params)
+        response.raise_for_status()
+        return response
+
+    key = f"http:{scope}:{url}?{urlencode(sorted((params or {}).items()))}"
+    cached = cache.lookup(key)
+    headers = {"If-None-Match": cached.etag} if cached and cached.etag else {}
+    response = request("GET", url, params=params, headers=headers)
+
+    if response.status_code == 304 and cached:
+        cache.touch(key)
+        replay = requests.Response()
+        replay.status_code, replay.url = 200, response.url
+        replay.headers.update(cached.value["headers"])
+        replay._content = cached.value["body"].encode()
+        return replay
+
+    response.raise_for_status()
+    etag = response.headers.get("ETag")
+    if etag:
+        headers = {name: response.headers[name] for name in _CACHED_HEADERS if name in response.headers}
+        cache.store(key, {"body": response.text, "headers": headers}, etag)
+    return response
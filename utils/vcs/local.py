@@ -0,0 +1,99 @@
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+from .base import BaseVCS, RepoInfo
+
+
+def _ext_arg(value) -> str:
+    """Quote an argument of an ext:: command, where % and spaces are special."""
+    return str(value).replace("%", "%%").replace(" ", "% ")
+
+
+class LocalVCS(BaseVCS):
+    """
+    VCS backed by a directory of bare repositories, laid out as <root>/<project>/<repo>.git.
+    No network involved, meant for benchmarks and tests.
+
+    config:
+        root: directory of the bare repositories
+        latency_ms: optional, delay of every API call and git connection
+        bandwidth_mbps: optional, simulated transfer rate (megabits per second) of the git connections
+        lfs_url: optional, base URL of an LFS server serving <lfs_url>/<project>/<repo>
+    """
+    def _sleep(self):
+        latency_ms = self.config.get("latency_ms", 0)
+        if latency_ms:
+            time.sleep(latency_ms / 1000)
+
+    def _repo_path(self, repo_name: str, project: str) -> Path:
+        return Path(self.config["root"]).resolve() / project / f"{repo_name}.git"
+
+    def get_inventory(self, project: str) -> List[RepoInfo]:
+        self._sleep()
+        project_path = Path(self.config["root"]) / project
+        if not project_path.is_dir():
+            return []
+
+        inventory = []
+        for path in sorted(project_path.glob("*.git")):
+            if not (path / "HEAD").exists():
+                continue
+            head = (path / "HEAD").read_text().strip()
+            refs = subprocess.run(["git", "--git-dir", str(path), "for-each-ref", "--count=1"],
+                                  capture_output=True, text=True).stdout
+            inventory.append(RepoInfo(
+                name=path.name[:-len(".git")],
+                project=project,
+                size=sum(os.path.getsize(os.path.join(root, name))
+                         for root, _, files in os.walk(path) for name in files),
+                default_branch=head.removeprefix("ref: refs/heads/") if head.startswith("ref: ") else None,
+                is_empty=not refs.strip(),
+            ))
+        return inventory
+
+    def list_projects(self) -> List[str]:
+        self._sleep()
+        root = Path(self.config["root"])
+        if not root.is_dir():
+            return []
+        return sorted(path.name for path in root.iterdir() if path.is_dir())
+
+    def get_clone_url(self, repo_name: str, auth_method: str, project: str) -> str:
+        # auth_method does not apply to local repositories
+        path = self._repo_path(repo_name, project)
+        if not self.config.get("bandwidth_mbps") and not self.config.get("latency_ms"):
+            return path.as_uri()
+
+        # Simulate a slow remote through the ext:: transport and the throttling proxy
+        bytes_per_second = self.config.get("bandwidth_mbps", 0) * 10**6 / 8
+        throttle = Path(__file__).with_name("throttle.py")
+        args = [sys.executable, throttle, "%S", path, bytes_per_second, self.config.get("latency_ms", 0)]
+        return "ext::" + " ".join(arg if arg == "%S" else _ext_arg(arg) for arg in args)
+
+    def lfs_url(self, repo_name: str, auth_method: str, project: str) -> Optional[str]:
+        if not self.config.get("lfs_url"):
+            return None
+        return f"{self.config['lfs_url'].rstrip('/')}/{project}/{repo_name}"
+
+    def git_env(self) -> Dict[str, str]:
+        if not self.config.get("bandwidth_mbps") and not self.config.get("latency_ms"):
+            return {}
+        # git refuses the ext:: transport unless explicitly allowed. Appended to the entries of the environment
+        count = int(os.environ.get("GIT_CONFIG_COUNT") or 0)
+        return {"GIT_CONFIG_COUNT": str(count + 1), f"GIT_CONFIG_KEY_{count}": "protocol.ext.allow",
+                f"GIT_CONFIG_VALUE_{count}": "always"}
+
+    def create_repo(self, repo_name: str, project: str) -> bool:
+        self._sleep()
+        path = self._repo_path(repo_name, project)
+        if (path / "HEAD").exists():
+            return True
+        path.parent.mkdir(parents=True, exist_ok=True)
+        result = subprocess.run(["git", "init", "--quiet", "--bare", str(path)], capture_output=True, text=True)
+        if result.returncode != 0:
+            print(f"Failed to create local repo '{path}': {result.stderr}")
+            return False
+        return True
@@ -0,0 +1,229 @@
+import hashlib
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+
+
+DEFAULT_RATE = 10.0  # requests per second
+DEFAULT_BURST = 10
+DEFAULT_MAX_RETRIES = 6
+DEFAULT_BACKOFF = 1.0  # seconds, doubled on every retry
+DEFAULT_MAX_BACKOFF = 60.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Token bucket of one host/credential. Callers reserve a token and sleep outside of the lock,
+    so concurrent callers are spaced out instead of waking up together.
+    """
+    def __init__(self, rate: float, burst: int, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.max_rate = rate
+        self.burst = burst
+        self.clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """
+        Take a token, possibly ahead of time.
+
+        Returns:
+            float: Seconds to wait before sending the request.
+        """
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(wait, self._paused_until - now)
+
+    def pause(self, seconds: float):
+        """Hold every request of the bucket for the given number of seconds."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, self.clock() + seconds)
+
+    def observe(self, remaining: Optional[int], reset_in: Optional[float]):
+        """
+        Adjust the rate to the quota reported by the server, so the remaining requests are spread
+        over the rest of the window instead of being spent at once.
+
+        Args:
+            remaining (Optional[int]): Requests left in the current window.
+            reset_in (Optional[float]): Seconds until the window resets.
+        """
+        if remaining is None or reset_in is None:
+            return
+        if remaining <= 0:
+            self.pause(reset_in)
+            return
+        with self._lock:
+            self._refill(self.clock())
+            self.rate = min(self.max_rate, max(remaining / max(reset_in, 1.0), 0.01))
+
+
+def _header_number(headers, name: str) -> Optional[float]:
+    try:
+        return float(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def retry_after(headers, now: Optional[float] = None) -> Optional[float]:
+    """
+    Seconds to wait as requested by a Retry-After header (delay in seconds or HTTP date).
+
+    Args:
+        headers: Response headers.
+        now (Optional[float]): Current epoch time, defaults to time.time().
+
+    Returns:
+        Optional[float]: The delay, None when the header is absent or invalid.
+    """
+    value = headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - (now if now is not None else time.time()))
+    except (TypeError, ValueError):
+        return None
+
+
+def quota(headers, now: Optional[float] = None) -> Tuple[Optional[int], Optional[float]]:
+    """
+    Read the X-RateLimit-Remaining / X-RateLimit-Reset headers sent by GitHub and Azure DevOps.
+
+    Args:
+        headers: Response headers.
+        now (Optional[float]): Current epoch time, defaults to time.time().
+
+    Returns:
+        Tuple[Optional[int], Optional[float]]: Remaining requests and seconds until the reset.
+    """
+    remaining = _header_number(headers, "X-RateLimit-Remaining")
+    reset = _header_number(headers, "X-RateLimit-Reset")  # epoch seconds
+    reset_in = max(0.0, reset - (now if now is not None else time.time())) if reset is not None else None
+    return (int(remaining) if remaining is not None else None), reset_in
+
+
+def _is_throttled(response: requests.Response) -> bool:
+    if response.status_code in RETRY_STATUSES:
+        return True
+    # GitHub answers 403 for both the primary (quota exhausted) and the secondary rate limits
+    if response.status_code == 403:
+        remaining, _ = quota(response.headers)
+        return remaining == 0 or "Retry-After" in response.headers or "rate limit" in response.text.lower()
+    return False
+
+
+class RequestScheduler:
+    """
+    Shared scheduler of the API calls of the VCS clients: one token bucket per host and
+    credential, server quota headers honoured, throttled and failed calls retried with
+    jittered exponential backoff.
+    """
+    def __init__(self, max_retries: int = DEFAULT_MAX_RETRIES, backoff: float = DEFAULT_BACKOFF,
+                 max_backoff: float = DEFAULT_MAX_BACKOFF, sleep: Callable[[float], None] = time.sleep,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.sleep = sleep
+        self.clock = clock
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(session: requests.Session, url: str) -> Tuple[str, str]:
+        """Host of the URL and a fingerprint of the credential of the session."""
+        credential = session.headers.get("Authorization") or repr(session.auth or "")
+        return urlparse(url).netloc.lower(), hashlib.sha256(str(credential).encode()).hexdigest()[:12]
+
+    def bucket(self, key: Tuple[str, str], rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST) -> TokenBucket:
+        with self._lock:
+            if key not in self._buckets:
+                self._buckets[key] = TokenBucket(rate, burst, self.clock)
+            return self._buckets[key]
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: concurrent callers retrying the same failure do not come back in lockstep
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def request(self, session: requests.Session, method: str, url: str, rate: float = DEFAULT_RATE,
+                burst: int = DEFAULT_BURST, max_retries: Optional[int] = None, **kwargs) -> requests.Response:
+        """
+        Send a request through the bucket of its host and credential.
+
+        Args:
+            session (requests.Session): Session sending the request.
+            method (str): HTTP method.
+            url (str): URL of the request.
+            rate (float): Requests per second of the bucket, used when it is created.
+            burst (int): Size of the bucket, used when it is created.
+            max_retries (Optional[int]): Overrides the retries of the scheduler.
+            **kwargs: Passed to session.request.
+
+        Returns:
+            requests.Response: The last response, throttled or not once the retries are exhausted.
+        """
+        bucket = self.bucket(self.key(session, url), rate, burst)
+        retries = self.max_retries if max_retries is None else max_retries
+        # A file body is sent again from where it started on every retry
+        body = kwargs.get("data")
+        body_start = body.tell() if hasattr(body, "seek") else None
+        attempt = 0
+        while True:
+            wait = bucket.reserve()
+            if wait > 0:
+                self.sleep(wait)
+
+            if body_start is not None:
+                body.seek(body_start)
+            try:
+                response = session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= retries:
+                    raise
+                self.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+
+            bucket.observe(*quota(response.headers))
+            if not _is_throttled(response) or attempt >= retries:
+                return response
+
+            delay = retry_after(response.headers)
+            if delay is None:
+                remaining, reset_in = quota(response.headers)
+                delay = reset_in if remaining == 0 and reset_in is not None else self._backoff(attempt)
+            print(f"{method} {urlparse(url).netloc}{urlparse(url).path} throttled ({response.status_code}), "
+                  f"retrying in {delay:.1f}s")
+            bucket.pause(delay)
+            attempt += 1
+
+
+_scheduler = RequestScheduler()
+
+
+def get_scheduler() -> RequestScheduler:
+    """
+    The scheduler shared by every VCS client of the process, so the source and the
+    destination share their buckets when they talk to the same host with the same credential.
+    """
+    return _scheduler
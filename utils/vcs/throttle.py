@@ -0,0 +1,57 @@
+"""
+Throttling proxy for git's ext:: transport, used by LocalVCS to simulate a slow remote.
+
+Usage (from a clone URL): ext::<python> <this file> %S <repo path> <bytes per second> <latency ms>
+
+It starts `git upload-pack` / `git receive-pack` on the local repository after the latency
+and forwards both directions of the git protocol at the given rate.
+"""
+import os
+import subprocess
+import sys
+import threading
+import time
+
+
+class _Throttle:
+    def __init__(self, bytes_per_second: float):
+        self.bytes_per_second = bytes_per_second
+        self._started = time.monotonic()
+        self._sent = 0
+
+    def wait(self, size: int):
+        if self.bytes_per_second <= 0:
+            return
+        self._sent += size
+        delay = self._sent / self.bytes_per_second - (time.monotonic() - self._started)
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _forward(read_fd: int, write_fd: int, throttle: _Throttle, close_write: bool):
+    while True:
+        chunk = os.read(read_fd, 65536)
+        if not chunk:
+            break
+        throttle.wait(len(chunk))
+        os.write(write_fd, chunk)
+    if close_write:
+        os.close(write_fd)
+
+
+def main(argv) -> int:
+    service, path, bytes_per_second, latency_ms = argv
+    time.sleep(float(latency_ms) / 1000)
+
+    rate = float(bytes_per_second)
+    process = subprocess.Popen(["git", service.removeprefix("git-"), path],
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    upstream = threading.Thread(
+        target=_forward, args=(sys.stdin.fileno(), process.stdin.fileno(), _Throttle(rate), True), daemon=True)
+    upstream.start()
+    _forward(process.stdout.fileno(), sys.stdout.fileno(), _Throttle(rate), False)
+    return process.wait()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))